@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Pattern automaton - an incremental matcher for the regular expressions of
+pattern conditions (see rulecomponents.pattern).
+"""
+
+import re
+import sre_parse
+import sre_constants as sre
+
+MAX_NFA_STATES = 1000    # larger expressions (e.g. with large bounded repetitions) are not supported
+MAX_TRANSITIONS = 10000  # the cached transitions are cleared, if there are more
+
+# tests for the character categories (\d, \s, \w and their complements)
+CATEGORIES = {
+  sre.CATEGORY_DIGIT: re.compile(r"\d"),
+  sre.CATEGORY_NOT_DIGIT: re.compile(r"\D"),
+  sre.CATEGORY_SPACE: re.compile(r"\s"),
+  sre.CATEGORY_NOT_SPACE: re.compile(r"\S"),
+  sre.CATEGORY_WORD: re.compile(r"\w"),
+  sre.CATEGORY_NOT_WORD: re.compile(r"\W")
+}
+
+class PatternAutomaton:
+	"""
+	Finite automaton for a regular expression, which checks, whether the
+	expression matches somewhere in a string (like re.search).
+
+	The expression is translated to a nondeterministic automaton (Thompson's
+	construction), which is simulated as a deterministic automaton: its states
+	are sets of NFA states, and the transitions are built when they are used
+	for the first time. The state after a string can be kept, so that only the
+	characters, which are appended to the string later, have to be consumed.
+
+	Expressions with backreferences, assertions, anchors (except for a leading
+	'^') or flags are not supported.
+	"""
+
+	def __init__(self, regexp):
+		"""
+		@param regexp: compiled regular expression
+		@raise ValueError: if the expression is not supported
+		"""
+		if regexp.flags != 0:
+			raise ValueError("flags are not supported")
+		parsed = list(sre_parse.parse(regexp.pattern))
+		self.anchored = len(parsed) > 0 and parsed[0] == (sre.AT, sre.AT_BEGINNING)
+		if self.anchored:
+			parsed = parsed[1:]
+		self.tests = []    #: NFA state -> character test of the outgoing transition (or None)
+		self.targets = []  #: NFA state -> target of the character transition
+		self.epsilon = []  #: NFA state -> targets of the epsilon transitions
+		(start, self.accept) = self.sequence(parsed)
+		self.start = self.closure([start])
+		self.transitions = {} #: (set of NFA states, character) -> set of NFA states
+
+	def getInitialState(self):
+		"""
+		Returns the state for the empty string: a tuple (set of NFA states,
+		matched), where matched tells, whether the expression has matched.
+		"""
+		return (self.start, self.accept in self.start)
+
+	def consume(self, state, string):
+		"""
+		Returns the state after consuming the given string.
+
+		@param state: state before the string (see getInitialState)
+		@param string: characters to consume
+		"""
+		(states, matched) = state
+		for char in string:
+			if matched or len(states) == 0:
+				break # the result can't change anymore
+			key = (states, char)
+			if not self.transitions.has_key(key):
+				if len(self.transitions) >= MAX_TRANSITIONS:
+					self.transitions.clear()
+				self.transitions[key] = self.step(states, char)
+			states = self.transitions[key]
+			matched = self.accept in states
+		return (states, matched)
+
+	def step(self, states, char):
+		"""
+		Returns the set of NFA states after the given character.
+		"""
+		targets = self.closure([self.targets[state] for state in states
+		                        if self.tests[state] != None and self.tests[state](char)])
+		if not self.anchored: # a match can start at every position
+			targets = targets | self.start
+		return targets
+
+	def closure(self, states):
+		"""
+		Returns the given NFA states and all states reachable from them with
+		epsilon transitions (as a frozenset).
+		"""
+		result = set(states)
+		stack = list(states)
+		while len(stack) > 0:
+			for target in self.epsilon[stack.pop()]:
+				if not target in result:
+					result.add(target)
+					stack.append(target)
+		return frozenset(result)
+
+	def newState(self, test=None, target=None):
+		"""
+		Adds an NFA state and returns its number.
+		"""
+		if len(self.tests) >= MAX_NFA_STATES:
+			raise ValueError("expression is too large")
+		self.tests.append(test)
+		self.targets.append(target)
+		self.epsilon.append([])
+		return len(self.tests)-1
+
+	def sequence(self, items):
+		"""
+		Builds the NFA for a sequence of parsed items and returns a tuple with
+		its start and end state.
+		"""
+		start = end = self.newState()
+		for (op, value) in items:
+			(first, last) = self.item(op, value)
+			self.epsilon[end].append(first)
+			end = last
+		return (start, end)
+
+	def item(self, op, value):
+		"""
+		Builds the NFA for a single parsed item and returns a tuple with its
+		start and end state.
+		"""
+		if op == sre.SUBPATTERN:
+			return self.sequence(value[-1])
+		elif op == sre.BRANCH:
+			start = self.newState()
+			end = self.newState()
+			for alternative in value[1]:
+				(first, last) = self.sequence(alternative)
+				self.epsilon[start].append(first)
+				self.epsilon[last].append(end)
+			return (start, end)
+		elif op == sre.MAX_REPEAT or op == sre.MIN_REPEAT:
+			(low, high, items) = value
+			start = end = self.newState()
+			for i in range(low):
+				(first, last) = self.sequence(items)
+				self.epsilon[end].append(first)
+				end = last
+			if high == sre.MAXREPEAT:
+				loop = self.newState()
+				(first, last) = self.sequence(items)
+				self.epsilon[end].append(loop)
+				self.epsilon[loop].append(first)
+				self.epsilon[last].append(loop)
+				return (start, loop)
+			final = self.newState()
+			for i in range(high-low):
+				(first, last) = self.sequence(items)
+				self.epsilon[end].extend([first, final])
+				end = last
+			self.epsilon[end].append(final)
+			return (start, final)
+		else:
+			end = self.newState()
+			return (self.newState(self.characterTest(op, value), end), end)
+
+	def characterTest(self, op, value):
+		"""
+		Returns a function, which checks, whether a character matches the given
+		parsed item.
+		"""
+		if (op == sre.LITERAL or op == sre.NOT_LITERAL) and value > 127:
+			raise ValueError("non-ASCII literals are not supported")
+		elif op == sre.LITERAL:
+			return lambda char: char == chr(value)
+		elif op == sre.NOT_LITERAL:
+			return lambda char: char != chr(value)
+		elif op == sre.ANY:
+			return lambda char: char != "\n"
+		elif op == sre.RANGE:
+			return lambda char: value[0] <= ord(char) <= value[1]
+		elif op == sre.CATEGORY and CATEGORIES.has_key(value):
+			return lambda char: CATEGORIES[value].match(char) != None
+		elif op == sre.IN:
+			negate = len(value) > 0 and value[0][0] == sre.NEGATE
+			tests = [self.characterTest(itemop, itemvalue) for (itemop, itemvalue) in value[int(negate):]]
+			return lambda char: any([test(char) for test in tests]) != negate
+		raise ValueError("unsupported element: %s" % op)
+
+def compile_pattern(regexp):
+	"""
+	Returns a PatternAutomaton for the given compiled regular expression, or
+	None, if the expression is not supported by the automaton.
+	"""
+	try:
+		return PatternAutomaton(regexp)
+	except ValueError:
+		return None
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Rule compiler - an alternative rule backend, which generates specialized Python
+source code for the conditions and actions of each rule, instead of building
+them from nested closures (see rulecomponents).
+"""
+
+from ace.util.constants import *
+from ace.basisfunctions import rulecomponents
+
+# arguments of the generated functions (the keyword arguments passed by Rule.execute)
+ARGUMENTS = ['rule', 'trigger', 'core', 'rulemanager', 'cache', 'contexts', 'querycache', 'selected_events']
+
+# comparison operators for count
+OPERATORS = {'eq': "==", 'ge': ">=", 'le': "<="}
+
+class RuleCompiler:
+	"""
+	Compiles the conditions and actions of a rule to Python functions.
+
+	Conditions are compiled to a single (flattened) expression, simple
+	conditions and actions are inlined, strings with mixed content are built
+	directly, and the rule arguments are passed as local variables. Elements,
+	for which no code is generated (event queries, plugins, etc.), are built by
+	the rule parser as usual, and the resulting closures are called from the
+	generated code. The source is compiled once, when the rule is parsed.
+
+	The generated functions accept the same keyword arguments as the closures
+	(see Rule.execute), so rules from both backends are executed the same way.
+	"""
+
+	def __init__(self, parser):
+		"""
+		@param parser: the RuleParser (used to build the elements, which are
+		not compiled, and to report parsing errors)
+		"""
+		self.parser = parser
+		self.namespace = None #: global namespace of the generated code (constants and closures)
+		self.counter = 0      #: counter for unique names in the generated code
+
+	def compileRule(self, rule):
+		"""
+		Parses and compiles the given rule. The elements are parsed in document
+		order (like in RuleParser.parseRule).
+
+		@param rule: lxml Element with the rule
+		@return: tuple (events, condition, actions, alternative actions, source)
+		"""
+		self.namespace = {}
+		self.counter = 0
+		events = None
+		condition = "True"
+		bodies = {TAG_ACTIONS: [], TAG_ALTERNATIVE_ACTIONS: []}
+		for child in rule:
+			if child.tag == TAG_EVENTS:
+				events = self.parser.parseRuleElement(child)
+			elif child.tag == TAG_CONDITIONS:
+				condition = self.junction(" and ", list(child), "selected_events")
+			else:
+				bodies[child.tag] = self.actionStatements(list(child), "\t", "selected_events")
+		signature = ", ".join(ARGUMENTS)
+		source = ["def condition(%s):" % signature, "\treturn %s" % condition]
+		for tag in [TAG_ACTIONS, TAG_ALTERNATIVE_ACTIONS]:
+			if len(bodies[tag]) > 0:
+				source.extend(["", "def %s(%s):" % (tag, signature)]+bodies[tag])
+		source = "\n".join(source)+"\n"
+		try:
+			code = compile(source, "<rule %s::%s>" % (self.parser.currentgroup, rule.attrib['name']), "exec")
+		except SyntaxError as e:
+			self.parser.parsingError("Could not compile rule: %s" % e)
+			return (events, rulecomponents.false, [], [], source)
+		exec code in self.namespace
+		return (events,
+		        self.namespace['condition'],
+		        [self.namespace[TAG_ACTIONS]] if len(bodies[TAG_ACTIONS]) > 0 else [],
+		        [self.namespace[TAG_ALTERNATIVE_ACTIONS]] if len(bodies[TAG_ALTERNATIVE_ACTIONS]) > 0 else [],
+		        source)
+
+	def constant(self, value):
+		"""
+		Makes the given value available in the generated code and returns its
+		name.
+		"""
+		self.counter += 1
+		name = "_c%d" % self.counter
+		self.namespace[name] = value
+		return name
+
+	def local(self, prefix):
+		"""
+		Returns a new, unique name for a local variable.
+		"""
+		self.counter += 1
+		return "%s_%d" % (prefix, self.counter)
+
+	def fallback(self, element, selected):
+		"""
+		Builds the given element with the rule parser and returns an expression,
+		which calls the resulting closure with the rule arguments.
+
+		@param element: lxml Element
+		@param selected: name of the variable with the selected events
+		"""
+		return self.call(self.constant(self.parser.parseRuleElement(element)), selected)
+
+	def call(self, func, selected):
+		"""
+		Returns an expression, which calls the given function (name in the
+		generated code) with the rule arguments.
+		"""
+		return "%s(%s)" % (func, ", ".join(["%s=%s" % (arg, arg) for arg in ARGUMENTS[:-1]]
+		                                   +["selected_events=%s" % selected]))
+
+	def junction(self, op, elements, selected):
+		"""
+		Returns an expression for the conjunction (op ' and ') or disjunction
+		(op ' or ') of the given conditions (like and_ and or_ in
+		rulecomponents, the expression is True, if there are no conditions).
+		"""
+		if len(elements) == 0:
+			return "True"
+		conditions = [self.condition(element, selected) for element in elements]
+		if len(conditions) == 1:
+			return conditions[0]
+		return "(%s)" % op.join(conditions)
+
+	def condition(self, element, selected):
+		"""
+		Returns an expression for the given condition element.
+		"""
+		if element.tag == TAG_AND:
+			return self.junction(" and ", list(element), selected)
+		elif element.tag == TAG_OR:
+			return self.junction(" or ", list(element), selected)
+		elif element.tag == TAG_NOT:
+			assert(len(element)==1)
+			return "(not %s)" % self.condition(element[0], selected)
+		elif element.tag == TAG_CONTEXT and not element.attrib.has_key('group'):
+			name = self.mixedContent(element, selected)
+			if element.attrib.has_key('counter'):
+				return "contexts.checkContextCounter(%r, %s, %d, %r)"\
+				       % (self.parser.currentgroup, name, self.parser.parseInt(element.attrib['counter']),
+				          element.attrib['counter_op'])
+			else:
+				return "contexts.contextExists(%r, %s)" % (self.parser.currentgroup, name)
+		elif element.tag == TAG_COUNT:
+			threshold = self.parser.parseInt(element.attrib['threshold'])
+			op = element.attrib['op']
+			assert(op=="eq" or op=="le" or op=="ge")
+			query = self.parser.parseRuleElement(element[0])
+			if hasattr(query, 'lazy'): # only count the required events (see rulecomponents.count)
+				limit = threshold if op == "ge" else threshold+1
+				return "(%s(%s, %d) %s %d)" % (self.constant(rulecomponents.count_events),
+				                               self.call(self.constant(query)+".lazy", selected),
+				                               limit, OPERATORS[op], threshold)
+			return "(len(%s) %s %d)" % (self.call(self.constant(query), selected), OPERATORS[op], threshold)
+		elif element.tag == TAG_TRIGGER_MATCH:
+			predicates = [self.triggerPredicate(child) for child in element]
+			if not None in predicates:
+				if len(predicates) == 0:
+					return "True"
+				return "(%s)" % " and ".join(predicates)
+		return self.fallback(element, selected)
+
+	def triggerPredicate(self, element):
+		"""
+		Returns an expression, which checks the given query operation on the
+		trigger, or None, if the operation can't be inlined (in that case, the
+		whole trigger_match is built by the rule parser).
+
+		Only operations, whose value is known at compile time, are inlined, so
+		that no expressions are skipped due to short-circuit evaluation.
+		"""
+		if len(element) > 0: # mixed content with child elements
+			return None
+		text = element.text.strip() if element.text != None else ""
+		if element.tag == TAG_EVENT_NAME:
+			return "trigger.name == %r" % text
+		elif element.tag == TAG_EVENT_TYPE:
+			assert(text in EVENT_TYPES)
+			return "trigger.type == %r" % text
+		elif element.tag == TAG_EVENT_STATUS:
+			assert(text in EVENT_STATUSES)
+			return "trigger.status == %r" % text
+		elif element.tag == TAG_EVENT_HOST:
+			return "trigger.host == %r" % text
+		elif element.tag == TAG_EVENT_ATTRIBUTE and element.attrib['op'] in ["eq", "ge", "le"]:
+			return "trigger.checkAttribute(%r, %r, %r)" % (element.attrib['name'], element.attrib['op'], text)
+		elif element.tag == TAG_EVENT_MIN_AGE and text.isdigit():
+			return "(trigger.arrival-trigger.creation) >= %d" % int(text)
+		return None
+
+	def mixedContent(self, element, selected):
+		"""
+		Returns an expression for the string given by the mixed content of the
+		element (see RuleParser.parseMixedContent).
+		"""
+		parts = [repr(element.text if element.text != None else "")]
+		for child in element:
+			if child.tag == TAG_TRIGGER:
+				parts.append("trigger.getField(%r)" % child.attrib['field'])
+			else:
+				parts.append(self.fallback(child, selected))
+			if child.tail != None:
+				parts.append(repr(child.tail))
+		return "(%s).strip()" % " + ".join(parts)
+
+	def actionStatements(self, elements, indent, selected):
+		"""
+		Returns the source lines for the given action elements.
+
+		@param elements: list with lxml Elements
+		@param indent: indentation of the lines
+		@param selected: name of the variable with the selected events
+		"""
+		lines = []
+		for element in elements:
+			if element.tag == TAG_SELECT_EVENTS:
+				assert(element[0].tag == TAG_EVENT_QUERY)
+				events = self.local("selected_events")
+				lines.append(indent+"%s = %s" % (events, self.fallback(element[0], selected)))
+				lines.append(indent+"cache.pageInCopies(%s)" % events)
+				lines.extend(self.actionStatements(list(element)[1:], indent, events))
+			elif element.tag == TAG_SUBBLOCK:
+				condition = "True"
+				bodies = {TAG_ACTIONS: [], TAG_ALTERNATIVE_ACTIONS: []}
+				for child in element:
+					if child.tag == TAG_CONDITIONS:
+						condition = self.junction(" and ", list(child), selected)
+					else:
+						bodies[child.tag] = self.actionStatements(list(child), indent+"\t", selected)
+				lines.append(indent+"if %s:" % condition)
+				lines.extend(bodies[TAG_ACTIONS] or [indent+"\tpass"])
+				if len(bodies[TAG_ALTERNATIVE_ACTIONS]) > 0:
+					lines.append(indent+"else:")
+					lines.extend(bodies[TAG_ALTERNATIVE_ACTIONS])
+			elif element.tag == TAG_DROP:
+				lines.append(indent+"cache.dropEvents(%s)" % selected)
+			elif element.tag == TAG_FORWARD:
+				lines.append(indent+"for event in cache.forwardEvents(%s):" % selected)
+				lines.append(indent+"\tcore.generateOutputEvent(event)")
+			elif element.tag == TAG_ASSOCIATE_WITH_CONTEXT:
+				lines.append(indent+"contexts.associateEventsWithContext(%r, %s, %s)"
+				             % (self.parser.currentgroup, self.mixedContent(element, selected), selected))
+			elif element.tag == TAG_DELETE_CONTEXT:
+				lines.append(indent+"contexts.deleteContext(%r, %s)"
+				             % (self.parser.currentgroup, self.mixedContent(element, selected)))
+			elif element.tag == TAG_MODIFY_CONTEXT:
+				assert(element.attrib['counter_op'] in ['set', 'inc', 'dec'])
+				name = self.mixedContent(element, selected)
+				counter_value = self.parser.parseInt(element.attrib['counter_value'])\
+				                  if element.attrib.has_key('counter_value') else None
+				lines.append(indent+"contexts.modifyContext(%r, %s, %r, %r, %r, %r)"
+				             % (self.parser.currentgroup, name,
+				                element.attrib['reset_timer'] == "true",
+				                element.attrib['reset_associated_events'] == "true",
+				                element.attrib['counter_op'], counter_value))
+			else:
+				lines.append(indent+self.fallback(element, selected))
+		return lines
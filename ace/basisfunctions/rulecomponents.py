@@ -15,9 +15,14 @@ functions can be combined to reperesent any function in the rule function space
 used to represent a function from the represented function space).
 """
 
+import bisect
+import itertools
 import re
+import sys
+import time
 from ace.plugins import condition as condition_plugins
 from ace.plugins import action as action_plugins
+from ace.basisfunctions import patternautomaton
 
 # the functions below are used at the time, when the rules are parsed, to build
 # functions, which will be used to correlate events during run-time. the
@@ -31,6 +36,20 @@ from ace.plugins import action as action_plugins
 #  - selected_events (for actions/alt. actions only)
 #  - query_events
 
+# relative costs of query operations, which select events independently of
+# each other (filters), used to plan intersections (see plan_queries). query
+# operations without a cost depend on the set of events they get (e.g.
+# first_of), and are never reordered.
+COST_TRIGGER = 0 # is_trigger
+COST_INDEXED = 1 # comparison of an (indexed) field or attribute
+COST_LOOKUP = 2  # other lookups per event (e.g. event class, context)
+COST_REGEXP = 3  # regular expression on an attribute
+COST_QUERY = 4   # evaluation of another query
+
+# number of events in the first chunk, when a query is evaluated lazily (see
+# filter_chunks)
+LAZY_CHUNK_SIZE = 16
+
 def if_then_else(condition, actions, alternative_actions):
 	"""
 	Returns a function, which executes the actions, if the condition evaluates
@@ -129,22 +148,41 @@ def count(threshold, op, query):
 	"""
 	Returns a function, which counts the events selected by the given query.
 	
+	If the query can be evaluated lazily (see event_query), the events are
+	only counted up to threshold ('ge') or threshold+1 ('eq' and 'le').
+	
 	@param threshold: number of required events
 	@type  threshold: int
 	@param op: operator (eq/ge/le)
 	@type  op: string
 	"""
+	if hasattr(query, 'lazy'):
+		limit = threshold if op == "ge" else threshold+1
+		number = lambda **kwargs: count_events(query.lazy(**kwargs), limit)
+	else:
+		number = lambda **kwargs: len(query(**kwargs))
 	if op == "eq":
-		return lambda **kwargs: len(query(**kwargs)) == threshold
+		return lambda **kwargs: number(**kwargs) == threshold
 	elif op == "le":
-		return lambda **kwargs: len(query(**kwargs)) <= threshold
+		return lambda **kwargs: number(**kwargs) <= threshold
 	elif op == "ge":
-		return lambda **kwargs: len(query(**kwargs)) >= threshold
+		return lambda **kwargs: number(**kwargs) >= threshold
+
+def count_events(events, limit):
+	"""
+	Returns the number of events in the given iterable, but at most limit
+	(the remaining events are not fetched).
+	"""
+	return len(list(itertools.islice(events, limit)))
 
 def sequence(sort_by, match, queries):
 	"""
 	Returns a function, which checks, whether the events in the cache are
 	selected by the queries in the specified order.
+	
+	The sorted timestamps of the events selected by each query are used (see
+	query_timestamps), so that the check for each query is a binary search
+	(match 'any') or a comparison with the first timestamp (match 'all').
 	"""
 	assert(sort_by=="creation" or sort_by=="arrival")
 	assert(match=="any" or match=="all")
@@ -153,28 +191,75 @@ def sequence(sort_by, match, queries):
 	if match == "any":
 		def sequence_generated(**kwargs):
 			""" Dynamically generated function. """
-			events = [[e.getTimestamp(sort_by) for e in q(**kwargs)] for q in queries]
 			current_min = -1
-			for e in events:
-				timestamp = [t for t in e if t > current_min]
-				if len(timestamp) == 0:
+			for q in queries:
+				# earliest event of this query after the event found for the previous query
+				timestamps = query_timestamps(q, sort_by, kwargs)
+				position = bisect.bisect_right(timestamps, current_min)
+				if position == len(timestamps):
 					return False
-				else:
-					current_min = min(timestamp)
+				current_min = timestamps[position]
 			return True
 	else: # match all
 		def sequence_generated(**kwargs):
 			""" Dynamically generated function. """
-			events = [[e.getTimestamp(sort_by) for e in q(**kwargs)] for q in queries]
-			return all([max(events[i])<min(events[i+1]) for i in xrange(len(events)-1)])
+			previous_max = None
+			for q in queries:
+				timestamps = query_timestamps(q, sort_by, kwargs)
+				if len(timestamps) == 0 or (previous_max != None and previous_max >= timestamps[0]):
+					return False
+				previous_max = timestamps[-1]
+			return True
 	return sequence_generated
 
 def pattern(alphabet, regexp):
 	"""
 	Returns a function, which checks, whether the events selected by the
 	alphabet match the pattern specified in regexp.
-	"""
-	return lambda **kwargs: bool(regexp.search(alphabet(**kwargs)))
+	
+	If possible, the regular expression is checked with a finite automaton
+	(see PatternAutomaton). Expressions, which the automaton doesn't support,
+	are always checked with the regular expression.
+	
+	If all symbols of the alphabet have trigger independent queries (see
+	event_query), the letters are maintained by the cache as the events
+	arrive and leave the windows of the queries, together with the state of
+	the automaton after them (see EventCache.getPatternMatch), so the queries
+	are not evaluated for the condition.
+	
+	Otherwise, the automaton keeps its state after the string of the last
+	evaluation. If the new string only has events appended (i.e. the previous
+	string is a prefix), only the new letters are consumed. Otherwise (e.g.
+	after events have left the cache), the whole string is consumed.
+	"""
+	automaton = patternautomaton.compile_pattern(regexp)
+	if automaton == None:
+		return lambda **kwargs: bool(regexp.search(alphabet(**kwargs)))
+	last = {'string': "", 'state': automaton.getInitialState()}
+	def pattern_generated(**kwargs):
+		""" Dynamically generated function. """
+		string = alphabet(**kwargs)
+		previous = last['string']
+		last['string'] = string
+		if string.startswith(previous):
+			last['state'] = automaton.consume(last['state'], string[len(previous):])
+		else:
+			last['state'] = automaton.consume(automaton.getInitialState(), string)
+		return last['state'][1]
+	symbols = getattr(alphabet, 'symbols', None)
+	if symbols == None or not all([hasattr(query, 'view_query') for (letter, query) in symbols]):
+		return pattern_generated
+	views = [(letter, query.view_query) for (letter, query) in symbols]
+	key = (regexp.pattern, alphabet.sort_by, tuple([(letter, view[0]) for (letter, view) in views]))
+	def pattern_maintained(**kwargs):
+		""" Dynamically generated function. """
+		bound = [(letter, predicate.bind(kwargs), max_age, time_source)
+		         for (letter, (fingerprint, predicate, max_age, time_source)) in views]
+		matched = kwargs['cache'].getPatternMatch(key, bound, alphabet.sort_by, automaton)
+		if matched == None: # views disabled
+			return pattern_generated(**kwargs)
+		return matched
+	return pattern_maintained
 
 def alphabet(sort_by, symbols):
 	"""
@@ -187,17 +272,16 @@ def alphabet(sort_by, symbols):
 	def alphabet_generated(**kwargs):
 		""" Dynamically generated function. """
 		alphabet = []
-		matched_so_far = []
+		matched_so_far = set()
 		for sym in symbols:
 			matching = sym[1](**kwargs)
 			matching = [e for e in matching if not e in matched_so_far] # no overlapping matches!
-			matched_so_far.extend(matching)
-			if sort_by == "creation":
-				alphabet.extend([(sym[0], e.getCreationTime()) for e in matching])
-			else:
-				alphabet.extend([(sym[0], e.getArrivalTime()) for e in matching])
+			matched_so_far.update(matching)
+			alphabet.extend([(sym[0], e.getTimestamp(sort_by)) for e in matching])
 		alphabet.sort(key=lambda x: x[1])
-		return reduce(lambda a, b: a + b, [symbol[0] for symbol in alphabet], "")
+		return "".join([symbol[0] for symbol in alphabet])
+	alphabet_generated.symbols = symbols # for pattern
+	alphabet_generated.sort_by = sort_by
 	return alphabet_generated
 
 
@@ -233,28 +317,42 @@ def within(timeframe, timeref, match, event_queries):
 	assert(match=="any" or match=="all")
 	if len(event_queries)==0:
 		return true
+	def timestamps(kwargs):
+		"""
+		Returns a sorted list with the timestamps of the events selected by
+		each query (or None, if a query selects no events).
+		"""
+		groups = []
+		for q in event_queries:
+			group = query_timestamps(q, timeref, kwargs)
+			if len(group) == 0:
+				return None
+			groups.append(group)
+		return groups
 	if match == "all":
 		def within_generated(**kwargs):
 			""" Dynamically generated function. """
-			events = [[e.getTimestamp(timeref) for e in q(**kwargs)] for q in event_queries]
-			if min([len(e) for e in events])==0:
+			groups = timestamps(kwargs)
+			if groups == None:
 				return False
-			events = reduce(lambda a, b: a + b, events, [])
-			return max(events)-min(events) <= timeframe
+			return max([group[-1] for group in groups])-min([group[0] for group in groups]) <= timeframe
 	else:
 		def within_generated(**kwargs):
 			""" Dynamically generated function. """
-			events = [[e.getTimestamp(timeref) for e in q(**kwargs)] for q in event_queries]
-			return within_any(events, timeframe)
+			groups = timestamps(kwargs)
+			if groups == None:
+				return False
+			return within_any(groups, timeframe, presorted=True)
 	return within_generated
 
-def within_any(events, timeframe):
+def within_any(events, timeframe, presorted=False):
 	"""
 	Checks, whether there is a combination with at least one event from each group in
 	the events list within a time window of the given length.
 	
-	@param events: list of lists with event timestamps
+	@param events: list of lists with event timestamps (the lists are not modified)
 	@param timeframe: window length
+	@param presorted: whether the lists are already sorted
 	"""
 	# Explanation (w = window length):
 	#  1. At the start, we check, whether any group is empty, and the individual
@@ -270,16 +368,18 @@ def within_any(events, timeframe):
 	#     tmax => new tmin=tmax-w
 	#  6. We can discard all events from each group, which lie before tmin. If 
 	#     any group has no events left, we lose; otherwise we continue at 2.
+	#     (Instead of removing the events, we advance a position in each group
+	#     with a binary search, so the sorted lists are not modified.)
 	#
 	# Speed considerations: in each round, we either win (if at least one event
 	# from each group is within the window), or we can remove at least one
 	# event (as at least one event from one group is not within the window, the
 	# window advances and we can certainly remove the event at the previous
 	# start of the window). The worst case is thus O(n) rounds (n: total number
-	# of events) with a round complexity O(m) (m: number of groups). Total
-	# complexity is thus O(m*n) in the worst case; with a much better average
-	# complexity (e.g. if the events are bursty, or one group has only few
-	# events).
+	# of events) with a round complexity O(m*log(n)) (m: number of groups).
+	# Total complexity is thus O(m*n*log(n)) in the worst case; with a much
+	# better average complexity (e.g. if the events are bursty, or one group
+	# has only few events).
 	#
 	# Another possibility would be to recursively check (for each event
 	# matching the first query) the nearest earlier and later event matching
@@ -288,19 +388,78 @@ def within_any(events, timeframe):
 	for group in events:
 		if len(group) == 0:
 			return False
-		group.sort()
+	if not presorted:
+		events = [sorted(group) for group in events]
+	positions = [0]*len(events)
 	while True:
-		tmin = min([group[0] for group in events])
-		tmax = max([group[0] for group in events])
+		first = [group[pos] for (group, pos) in zip(events, positions)]
+		tmin = min(first)
+		tmax = max(first)
 		if tmax <= tmin+timeframe:
 			return True
 		tmin = tmax-timeframe
-		for group in events:
-			while group[0] < tmin:
-				group.pop(0)
-				if len(group) == 0:
+		for (i, group) in enumerate(events):
+			if first[i] < tmin:
+				positions[i] = bisect.bisect_left(group, tmin, positions[i])
+				if positions[i] == len(group):
 					return False
 
+def query_timestamps(query, timeref, kwargs):
+	"""
+	Returns a sorted list with the timestamps of the events selected by the
+	given query. For trigger independent queries, the list is taken from the
+	materialized view of the query (see EventCache.getViewTimestamps), which
+	keeps it up to date, as events enter and leave the cache. The list must
+	not be modified.
+	
+	@param query: event query function
+	@param timeref: creation or arrival
+	@param kwargs: arguments for the query
+	"""
+	timestamps = query.timestamps(timeref, **kwargs) if hasattr(query, 'timestamps') else None
+	if timestamps == None:
+		timestamps = sorted([e.getTimestamp(timeref) for e in query(**kwargs)])
+	return timestamps
+
+def window_count(group, field, timeframe, buckets, threshold, op, timeref, fingerprint, query_operations):
+	"""
+	Returns a function, which compares the number of events with the same
+	value in the given field as the trigger, which arrived within the time
+	window, with the threshold (e.g. at least 10 events per host within 10
+	minutes).
+	
+	The counts are kept in a window counter in the cache (see
+	EventCache.getWindowCount), which is updated when events are added to
+	the cache, so the condition doesn't need to query the cache. Only the
+	events selected by the query operations are counted (these must be
+	trigger independent conditions on single events).
+	
+	@param group: name of the rule group
+	@param field: event field or attributes.NAME
+	@param timeframe: length of the time window
+	@param buckets: number of buckets, into which the window is divided
+	@param threshold: number of required events
+	@param op: operator (eq/ge/le)
+	@param timeref: time reference (creation or arrival time)
+	@param fingerprint: identifies structurally identical window counters
+	@param query_operations: list with query operations on single events
+	"""
+	assert(type(timeframe)==int)
+	assert(timeref=="creation" or timeref=="arrival")
+	assert(op=="eq" or op=="le" or op=="ge")
+	predicate = event_predicate(query_operations)
+	def number(kwargs):
+		""" Returns the number of events in the window for the trigger. """
+		return kwargs['cache'].getWindowCount(group, fingerprint, predicate.bind(kwargs),
+		                                      field, timeframe, buckets, timeref,
+		                                      kwargs['trigger'].getField(field))
+	if op == "eq":
+		return lambda **kwargs: number(kwargs) == threshold
+	elif op == "le":
+		return lambda **kwargs: number(kwargs) <= threshold
+	elif op == "ge":
+		return lambda **kwargs: number(kwargs) >= threshold
+
 def condition_plugin(config, logger, name, parameters, queries):
 	"""
 	Returns a function, which executes the specified condition plugin, when it
@@ -323,7 +482,9 @@ def condition_plugin(config, logger, name, parameters, queries):
 def select_events(query, actions):
 	"""
 	Returns a function, which selects the events matched by the given query
-	function, and executes the specified actions on the events.
+	function, and executes the specified actions on the events. Selected
+	events from the overflow store are paged in, since the actions may modify
+	them (see EventCache.pageInCopies).
 	
 	@param query: query function
 	@param actions: list with action functions
@@ -331,6 +492,7 @@ def select_events(query, actions):
 	def select_events_generated(**kwargs):
 		""" Dynamically generated function. """
 		kwargs['selected_events'] = query(**kwargs)
+		kwargs['cache'].pageInCopies(kwargs['selected_events'])
 		for action in actions:
 			action(**kwargs)
 	return select_events_generated
@@ -361,9 +523,13 @@ def compress(**kwargs): # a function, not a function generator!
 	
 	@keyword selected_events: events to compress
 	"""
-	for event in kwargs['cache'].compressEvents(kwargs['selected_events']):
+	cache = kwargs['cache']
+	for event in cache.compressEvents(kwargs['selected_events']):
 		kwargs['rulemanager'].updateCacheAndDelayTime(event)
-		kwargs['cache'].addEvent(event)
+		if event in cache.getEvents(): # existing compressed event, which was updated
+			cache.insertEventCacheAndDelayTime(event)
+		else:
+			cache.addEvent(event, compressed=True)
 
 def aggregate(inject, eventfunc):
 	"""
@@ -407,10 +573,10 @@ def modify(status, local, rule, reason):
 		for event in events:
 			fields = []
 			if status != None and status != event.getStatus():
-				event.setStatus(status)
+				kwargs['cache'].setEventStatus(event, status)
 				fields.append('status')
 			if local != None and local != event.getLocal():
-				event.setLocal(local)
+				kwargs['cache'].setEventLocal(event, local)
 				fields.append('local')
 			if len(fields) > 0:
 				event.addHistoryEntry(rule, hostname, tick, fields, reason)
@@ -435,7 +601,7 @@ def modify_attribute(name, value, op, rule, reason):
 		hostname = core.config.hostname
 		kwargs['cache'].removeStaleEventsFromList(events)
 		for event in events:
-			event.setAttribute(name, value, op)
+			kwargs['cache'].setEventAttribute(event, name, value, op)
 			event.addHistoryEntry(rule, hostname, tick, ['attributes'], reason)
 		core.addModifiedEvents(events)
 	return modify_attribute_generated
@@ -459,7 +625,7 @@ def suppress(rule, reason, query):
 		kwargs['cache'].removeStaleEventsFromList(events)
 		active_events = [e for e in events if e.isActive()]
 		for event in active_events:
-			event.setStatus('inactive')
+			kwargs['cache'].setEventStatus(event, 'inactive')
 			event.addHistoryEntry(rule, hostname, tick, ['status'], reason)
 			event.addReferences('parent', responsible_events)
 		core.addModifiedEvents(active_events)
@@ -573,7 +739,13 @@ def action_plugin(config, logger, name, parameters):
 	"""
 	plugin = action_plugins.get_plugin(name)
 	plugin_instance = plugin(config, logger, parameters)
-	return lambda **kwargs: plugin_instance.executeAction(kwargs['selected_events'])
+	def action_plugin_generated(**kwargs):
+		""" Dynamically generated function. """
+		result = plugin_instance.executeAction(kwargs['selected_events'])
+		# the plugin may have changed attributes -> update the attribute index
+		kwargs['cache'].reindexAttributes(kwargs['selected_events'])
+		return result
+	return action_plugin_generated
 
 def trigger(field):
 	"""
@@ -582,29 +754,235 @@ def trigger(field):
 	"""
 	return lambda **kwargs: kwargs['trigger'].getField(field)
 
-def event_query(query_operations, max_age, time_source):
+def event_predicate(query_operations):
+	"""
+	Returns a function, which checks, whether a single event is selected by
+	all of the given (trigger independent) query operations.
+	
+	The function is built once, when the rule is parsed. Before it is passed
+	to the cache, its method bind has to be called with the arguments of the
+	rule execution (only cache, core and rulemanager are passed to the query
+	operations).
+	
+	@param query_operations: list with query operations on single events
+	"""
+	args = {}
+	def event_predicate_generated(event):
+		""" Dynamically generated function. """
+		args['query_events'] = [event]
+		for q in query_operations:
+			if len(q(**args)) == 0:
+				return False
+		return True
+	def bind(kwargs):
+		""" Sets the arguments for the query operations and returns the predicate. """
+		args['cache'] = kwargs['cache']
+		args['core'] = kwargs.get('core')
+		args['rulemanager'] = kwargs.get('rulemanager')
+		return event_predicate_generated
+	event_predicate_generated.bind = bind
+	return event_predicate_generated
+
+def event_query(query_operations, max_age, time_source, fingerprint=None, view=False, descriptions=None):
 	"""
 	Returns a function, which returns the events selected by the given query.
 	
+	If a fingerprint is given, and the rule passes a query cache, the result
+	is memoized for the current trigger, so that structurally identical
+	queries are only evaluated once (see QueryCache).
+	
+	Trigger independent queries, which only consist of conditions on single
+	events (view), are answered from a materialized view in the cache, which
+	is maintained incrementally (see EventCache.getViewEvents). The view also
+	provides the sorted timestamps of the selected events (see within). The
+	predicate of such queries is also used for the letters of patterns (see
+	pattern).
+	
+	Query operations, which can be answered by one of the cache indexes (see
+	index_lookup) are not applied as filters. Instead, the candidate events
+	are fetched from the corresponding indexes, and only the remaining
+	operations are applied to the candidates. This is only done for the
+	operations before the first order dependent operation (e.g. first_of),
+	since the result of the later ones depends on the events they get.
+	
+	If max_age is given, the time bound is applied first, with a range scan
+	on the time-ordered index of the cache (unless the index lookups yield
+	fewer candidates). In this case, the candidates are passed to the
+	operations ordered by the timestamp (see first_of and last_of). If the
+	query contains order dependent operations, the time bound is applied to
+	their result instead (as they select from all events in the cache).
+	
+	Events in the overflow store of the cache are not paged in to answer the
+	query: the query gets copies of them (see EventCache.getAllEvents), which
+	are only paged in, if they are selected for actions (see select_events).
+	
+	If the rule has an execution profile (see RuleProfile), the time and the
+	number of candidate and selected events are recorded.
+	
+	If all query operations are filters (see plan_queries), the returned
+	function has a method lazy, which returns an iterator over the selected
+	events, which only evaluates the query as far as the events are needed
+	(see count).
+	
 	@param query_operations: list with zero or more query operations
 	@param max_age: maximum age of a selected event
 	@param time_source: creation or arrival ..
-	"""
-	query = intersection(query_operations)
-	if max_age == None:
-		def event_query_generated(**kwargs):
-			""" Dynamically generated function. """
-			kwargs['query_events'] = kwargs['cache'].getEvents()
-			return query(**kwargs)
+	@param fingerprint: identifies structurally identical queries (or None)
+	@param view: whether the query may be answered from a materialized view
+	@param descriptions: list with a description of each query operation for
+	the query plan (e.g. the XML element, from which it was built), or None
+	"""
+	leading = list(itertools.takewhile(lambda q: hasattr(q, 'cost'), query_operations))
+	lookups = [q for q in leading if hasattr(q, 'index_lookup')]
+	query = intersection([q for q in leading if not hasattr(q, 'index_lookup')]
+	                     +query_operations[len(leading):])
+	time_bound_first = max_age != None and len(leading) == len(query_operations)
+	# operations may be shared by several queries, so the descriptions are kept here
+	described = dict(zip(query_operations, descriptions)) if descriptions != None else {}
+	view_predicate = event_predicate(query_operations) if view else None
+	def event_query_memoized(**kwargs):
+		""" Dynamically generated function. """
+		querycache = kwargs.get('querycache')
+		if querycache == None:
+			return event_query_generated(**kwargs)
+		events = querycache.get(fingerprint, kwargs['trigger'])
+		if events == None:
+			events = event_query_generated(**kwargs)
+			querycache.put(fingerprint, kwargs['trigger'], events)
+		return events
+	def event_query_generated(**kwargs):
+		""" Dynamically generated function. """
+		rule = kwargs.get('rule')
+		if rule == None or rule.profile == None:
+			return select(kwargs)[0]
+		start = time.time()
+		(events, scanned) = select(kwargs)
+		rule.profile.recordQuery(time.time()-start, scanned, len(events))
+		return events
+	def select(kwargs):
+		""" Returns the selected events and the number of candidate events. """
+		cache = kwargs['cache']
+		if view:
+			events = cache.getViewEvents(fingerprint, view_predicate.bind(kwargs), max_age, time_source)
+			if events != None:
+				return (events, len(events))
+		(events, filters) = candidates(kwargs)
+		scanned = len(events)
+		kwargs['query_events'] = events
+		for q in plan_queries(filters, kwargs):
+			if len(events) == 0:
+				return ([], scanned)
+			kwargs['query_events'] = events
+			events = q(**kwargs)
+		kwargs['query_events'] = events
+		events = query(**kwargs)
+		if max_age != None and not time_bound_first:
+			since = kwargs['core'].ticker.getTick()-max_age
+			events = [event for event in events if event.getTimestamp(time_source) >= since]
+		return (events, scanned)
+	def candidates(kwargs, lazy=False):
+		"""
+		Returns the candidate events from the indexes and the lookups, which
+		have to be applied as filters (and sets ordered_by). With lazy, the
+		events from the time index are returned as an iterator.
+		"""
+		cache = kwargs['cache']
+		indexed = []
+		filters = []
+		for q in lookups:
+			events = q.index_lookup(**kwargs)
+			if events == None: # not indexed (at the moment) -> apply as filter
+				filters.append(q)
+			else:
+				indexed.append(events)
+		indexed.sort(key=len)
+		if not time_bound_first:
+			ordered_by = None
+			if len(indexed) == 0 and len(leading) < len(query_operations):
+				# ordered for the order dependent operations (see first_of)
+				ordered_by = time_source
+				events = cache.getAllEventsOrdered(time_source)
+			elif len(indexed) == 0:
+				events = cache.getAllEvents()
+			elif len(indexed) == 1:
+				events = indexed[0]
+			else:
+				events = indexed[0].intersection(*indexed[1:])
+		else:
+			since = kwargs['core'].ticker.getTick()-max_age
+			if len(indexed) == 0 or cache.countEventsSince(time_source, since) < len(indexed[0]):
+				ordered_by = time_source
+				if lazy:
+					events = (event for event in cache.iterEventsSince(time_source, since)
+					          if all([event in candidates for candidates in indexed]))
+				else:
+					events = [event for event in cache.getEventsSince(time_source, since)
+					          if all([event in candidates for candidates in indexed])]
+			else:
+				ordered_by = None
+				events = [event for event in indexed[0].intersection(*indexed[1:])
+				          if event.getTimestamp(time_source) >= since]
+		kwargs['ordered_by'] = ordered_by
+		return (events, filters)
+	def event_query_lazy(**kwargs):
+		"""
+		Returns an iterator over the selected events. The candidates are
+		filtered in chunks (see filter_chunks), so that callers, which only
+		need a few events, can stop early.
+		"""
+		if fingerprint != None and kwargs.get('querycache') != None:
+			events = kwargs['querycache'].get(fingerprint, kwargs['trigger'])
+			if events != None:
+				return iter(events)
+		cache = kwargs['cache']
+		if view:
+			events = cache.getViewEvents(fingerprint, view_predicate.bind(kwargs), max_age, time_source)
+			if events != None:
+				return iter(events)
+		(events, filters) = candidates(kwargs, lazy=True)
+		kwargs['ordered_by'] = None
+		return itertools.chain.from_iterable(filter_chunks(sort_filters(filters+query.queries, kwargs),
+		                                                   events, kwargs))
+	def explain(**kwargs):
+		"""
+		Returns a list with strings describing the query plan. Only the counts
+		of the cache indexes are used (this is called from the RPC thread), so
+		no events are paged in.
+		"""
+		lines = ["max_age: %s, time source: %s" % (max_age, time_source)]
+		cache = kwargs['cache']
+		kwargs['query_events'] = cache.getEvents()
+		if view and fingerprint in cache.views:
+			lines.append("Answered from a materialized view with %d events."\
+			             % len(cache.views[fingerprint].events))
+		filters = []
+		for q in lookups:
+			estimate = estimate_query(q, kwargs)
+			if estimate == None:
+				filters.append(q)
+			else:
+				lines.append("Index lookup: %s -> %d candidates" % (describe_query(q, described), estimate))
+		for (i, q) in enumerate(plan_queries(filters, kwargs)+plan_queries(query.queries, kwargs)):
+			lines.append("%d. %s" % (i+1, explain_query(q, kwargs, described)))
+		return lines
+	def timestamps(timeref, **kwargs):
+		"""
+		Returns a sorted list with the timestamps of the selected events from
+		the materialized view (see EventCache.getViewTimestamps), or None.
+		"""
+		cache = kwargs['cache']
+		return cache.getViewTimestamps(fingerprint, view_predicate.bind(kwargs), max_age, time_source, timeref)
+	if fingerprint != None:
+		function = event_query_memoized
 	else:
-		def event_query_generated(**kwargs):
-			""" Dynamically generated function. """
-			kwargs['query_events'] = kwargs['cache'].getEvents()
-			tick = kwargs['core'].ticker.getTick()
-			return [event
-			         for event in query(**kwargs)
-			         if event.getTimestamp(time_source)+max_age >= tick]
-	return event_query_generated
+		function = event_query_generated
+	function.explain = explain
+	if fingerprint != None and view:
+		function.timestamps = timestamps
+		function.view_query = (fingerprint, view_predicate, max_age, time_source) # see pattern
+	if all([hasattr(q, 'cost') for q in query_operations]):
+		function.lazy = event_query_lazy
+	return function
 
 def intersection(queries):
 	"""
@@ -619,13 +997,30 @@ def intersection(queries):
 	#
 	# although less elegant, its more efficient to apply queries iteratively
 	# (i.e. to apply the condition on the remaining events only each time):
+	#
+	# the queries are applied in the order chosen by plan_queries, and the
+	# remaining queries are skipped, as soon as no events are left.
 	def intersection_generated(**kwargs):
 		""" Dynamically generated function. """
 		events = set(kwargs['query_events'])
-		for query in queries:
-			kwargs['query_events'] = list(events)
+		for query in plan_queries(queries, kwargs):
+			if len(events) == 0:
+				break
+			# note: the first query gets the (possibly ordered) original events
 			events.intersection_update(query(**kwargs))
+			kwargs['query_events'] = events
+			kwargs['ordered_by'] = None
 		return list(events)
+	intersection_generated.queries = queries
+	costs = [getattr(query, 'cost', None) for query in queries]
+	if not None in costs: # all queries are filters -> so is the intersection
+		intersection_generated.cost = max(costs+[COST_TRIGGER])
+		def intersection_estimate(**kwargs):
+			""" Dynamically generated function. """
+			estimates = [estimate_query(query, kwargs) for query in queries]
+			estimates = [estimate for estimate in estimates if estimate != None]
+			return min(estimates) if len(estimates) > 0 else None
+		intersection_generated.estimate = intersection_estimate
 	return intersection_generated
 
 def union(queries):
@@ -645,10 +1040,19 @@ def union(queries):
 			""" Dynamically generated function. """
 			events = kwargs['query_events']
 			current = set(events)
+			kwargs['ordered_by'] = None
 			for query in queries:
 				kwargs['query_events'] = list(current)
 				current.difference_update(query(**kwargs))
 			return list(set(events).difference(current))
+		costs = [getattr(query, 'cost', None) for query in queries]
+		if not None in costs: # all queries are filters -> so is the union
+			union_generated.cost = max(costs)
+			def union_estimate(**kwargs):
+				""" Dynamically generated function. """
+				estimates = [estimate_query(query, kwargs) for query in queries]
+				return sum(estimates) if not None in estimates else None
+			union_generated.estimate = union_estimate
 		return union_generated
 
 def complement(query):
@@ -659,20 +1063,33 @@ def complement(query):
 	
 	@param query: event selection query
 	"""
-	return lambda **kwargs: list(set(kwargs['cache'].getEvents()).difference(query(**kwargs)))
+	return lambda **kwargs: list(set(kwargs['cache'].getAllEvents()).difference(query(**kwargs)))
 
 def first_of(sort_by, query):
 	"""
 	Returns a function, which selects the oldest event in the set.
 	
+	If the query events are ordered by sort_by (see event_query), and the
+	query is a filter (see plan_queries), the query is applied to chunks of
+	the events from the start, until an event is selected. Otherwise, if
+	the query selects all of the ordered events, the first one is taken
+	directly.
+	
 	@param sort_by: creation or arrival.
 	@param query: returns the set, from which to select the first event
 	"""
 	def first_of_generated(**kwargs):
 		""" Dynamically generated function. """
+		if kwargs.get('ordered_by') == sort_by and hasattr(query, 'cost'):
+			# the first chunk with a selected event contains the oldest one
+			for events in filter_chunks([query], kwargs['query_events'], kwargs):
+				return [min(events, key=lambda e: e.getTimestamp(sort_by))]
+			return []
 		events = query(**kwargs)
 		if len(events) == 0:
 			return events
+		elif kwargs.get('ordered_by') == sort_by and len(events) == len(kwargs['query_events']):
+			return [kwargs['query_events'][0]]
 		else:
 			return [min(events, key=lambda e: e.getTimestamp(sort_by))]
 	return first_of_generated
@@ -681,14 +1098,26 @@ def last_of(sort_by, query):
 	"""
 	Returns a function, which selects the youngest event in the set.
 	
+	If the query events are ordered by sort_by (see event_query), and the
+	query is a filter (see plan_queries), the query is applied to chunks of
+	the events from the end, until an event is selected. Otherwise, if the
+	query selects all of the ordered events, the last one is taken directly.
+	
 	@param sort_by: creation or arrival.
 	@param query: returns the set, from which to select the last event
 	"""
 	def last_of_generated(**kwargs):
 		""" Dynamically generated function. """
+		if kwargs.get('ordered_by') == sort_by and hasattr(query, 'cost'):
+			# the first chunk from the end with a selected event contains the youngest one
+			for events in filter_chunks([query], reversed(kwargs['query_events']), kwargs):
+				return [max(events, key=lambda e: e.getTimestamp(sort_by))]
+			return []
 		events = query(**kwargs)
 		if len(events)==0:
 			return events
+		elif kwargs.get('ordered_by') == sort_by and len(events) == len(kwargs['query_events']):
+			return [kwargs['query_events'][-1]]
 		else:
 			return [max(events, key=lambda e: e.getTimestamp(sort_by))]
 	return last_of_generated
@@ -728,6 +1157,8 @@ def is_trigger(**kwargs): # a function, not a generator!
 	@keyword query_events: events
 	"""
 	return [kwargs['trigger']] if kwargs['trigger'] in kwargs['query_events'] else []
+is_trigger.cost = COST_TRIGGER
+is_trigger.estimate = lambda **kwargs: 1
 
 def in_context(group, namefunc):
 	"""
@@ -746,6 +1177,7 @@ def in_context(group, namefunc):
 			return [event for event in kwargs['query_events']
 			              if context in event.getDelayContexts() or
 			                 context in event.getCacheContexts()]
+	in_context_generated.cost = COST_LOOKUP
 	return in_context_generated
 
 def match_query(group, name):
@@ -755,7 +1187,11 @@ def match_query(group, name):
 	@param group: group of the specified query
 	@param name: name of the specified query
 	"""
-	return lambda **kwargs: kwargs['rulemanager'].getNamedQuery(group, name)(**kwargs)
+	def match_query_generated(**kwargs):
+		""" Dynamically generated function. """
+		return kwargs['rulemanager'].getNamedQuery(group, name)(**kwargs)
+	match_query_generated.cost = COST_QUERY
+	return match_query_generated
 
 def event_class(name):
 	"""
@@ -763,8 +1199,15 @@ def event_class(name):
 	
 	@param name: class name
 	"""
-	return lambda **kwargs: [event for event in kwargs['query_events']
-	                          if name in kwargs['rulemanager'].getEventClasses(event)]
+	def event_class_generated(**kwargs):
+		""" Dynamically generated function. """
+		return [event for event in kwargs['query_events']
+		              if name in kwargs['rulemanager'].getEventClasses(event)]
+	event_class_generated.cost = COST_LOOKUP
+	event_class_generated.estimate = lambda **kwargs:\
+	  sum([kwargs['cache'].countEventsByField('name', eventname)
+	       for eventname in kwargs['rulemanager'].eventclasses.get(name, [])])
+	return event_class_generated
 
 def event_name(name):
 	"""
@@ -772,7 +1215,7 @@ def event_name(name):
 	
 	@param name: event name
 	"""
-	return lambda **kwargs: [event for event in kwargs['query_events'] if event.name == name]
+	return index_lookup('name', lambda **kwargs: name)
 
 def event_type(eventtype):
 	"""
@@ -780,7 +1223,7 @@ def event_type(eventtype):
 	
 	@param eventtype: event type
 	"""
-	return lambda **kwargs: [event for event in kwargs['query_events'] if event.type == eventtype]
+	return index_lookup('type', lambda **kwargs: eventtype)
 
 def event_status(status):
 	"""
@@ -788,14 +1231,13 @@ def event_status(status):
 	
 	@param status: event status
 	"""
-	return lambda **kwargs: [event for event in kwargs['query_events'] if event.status == status]
+	return index_lookup('status', lambda **kwargs: status)
 
 def event_host(namefunc):
 	"""
 	Returns a function, which selects the events from the given host.
 	"""
-	return lambda **kwargs: [event for event in kwargs['query_events']
-	                               if event.host == namefunc(**kwargs)]
+	return index_lookup('host', namefunc)
 
 def event_attribute(name, valuefunc, op, regexp=None):
 	"""
@@ -804,19 +1246,35 @@ def event_attribute(name, valuefunc, op, regexp=None):
 	"""
 	if op == "re": # precompile the regular expression ..
 		rex = re.compile(regexp) # Exception is cached in caller ..
-		return lambda **kwargs: [event for event in kwargs['query_events']
-		                               if event.checkAttribute(name, op, None, regexp=rex)]
+		def event_attribute_regexp(**kwargs):
+			""" Dynamically generated function. """
+			return [event for event in kwargs['query_events']
+			              if event.checkAttribute(name, op, None, regexp=rex)]
+		event_attribute_regexp.cost = COST_REGEXP
+		return event_attribute_regexp
 	else:
-		return lambda **kwargs: [event for event in kwargs['query_events']
-		                               if event.checkAttribute(name, op, valuefunc(**kwargs))]
+		def event_attribute_generated(**kwargs):
+			""" Dynamically generated function. """
+			value = valuefunc(**kwargs)
+			return [event for event in kwargs['query_events'] if event.checkAttribute(name, op, value)]
+		# may be answered by the attribute index of the cache (see event_query)
+		event_attribute_generated.index_lookup = lambda **kwargs:\
+		  kwargs['cache'].getEventsByAttribute(name, op, valuefunc(**kwargs))
+		event_attribute_generated.cost = COST_INDEXED
+		event_attribute_generated.estimate = lambda **kwargs:\
+		  kwargs['cache'].countEventsByAttribute(name, op, valuefunc(**kwargs))
+		return event_attribute_generated
 
 def event_min_age(age):
 	"""
 	Returns a function, which selects the events with the given minimum age
 	(difference between creation and arrival time).
 	"""
-	return lambda **kwargs: [event for event in kwargs['query_events']
-	                               if (event.arrival-event.creation) >= age]
+	def event_min_age_generated(**kwargs):
+		""" Dynamically generated function. """
+		return [event for event in kwargs['query_events'] if (event.arrival-event.creation) >= age]
+	event_min_age_generated.cost = COST_INDEXED
+	return event_min_age_generated
 
 def event(eventdata, descriptionfunc, attributefuncs):
 	"""
@@ -855,6 +1313,137 @@ def mixed_content(initial_text, childfuncs):
 	                               childfuncs,
 	                               lambda **kwargs3: initial_text)(**kwargs).strip()
 
+def index_lookup(field, valuefunc):
+	"""
+	Generates a function, which selects the events with the given value in the
+	given field. The function can be used as a filter on query_events, but
+	additionally has an index_lookup function, which returns the matching
+	events from the cache indexes (or None, if there is no index), so that
+	event_query can use the index instead.
+	
+	@param field: indexed event field (see EventCache.INDEXED_FIELDS)
+	@param valuefunc: function returning the required field value
+	"""
+	def index_lookup_generated(**kwargs):
+		""" Dynamically generated function. """
+		value = valuefunc(**kwargs)
+		return [event for event in kwargs['query_events'] if getattr(event, field) == value]
+	index_lookup_generated.index_lookup = lambda **kwargs:\
+	  kwargs['cache'].getEventsByField(field, valuefunc(**kwargs))
+	index_lookup_generated.cost = COST_INDEXED
+	index_lookup_generated.estimate = lambda **kwargs:\
+	  kwargs['cache'].countEventsByField(field, valuefunc(**kwargs))
+	return index_lookup_generated
+
+# query planner
+
+def plan_queries(queries, kwargs):
+	"""
+	Returns the given query operations in the order, in which they should be
+	applied to the query events.
+
+	Consecutive filters (operations with a cost, which select events
+	independently of each other) are ordered by their cost, and filters with
+	the same cost by the estimated number of selected events (operations
+	without an estimate last), so that cheap and selective operations reduce
+	the events for the others. Operations without a cost are not moved, and
+	filters are not moved across them (likewise, event_query only answers
+	the filters before the first operation without a cost from the cache
+	indexes).
+
+	@param queries: list with query operations
+	@param kwargs: arguments of the query (used for the estimates)
+	"""
+	if len(queries) < 2 or len(kwargs['query_events']) < 2: # nothing to gain
+		return queries
+	planned = []
+	filters = []
+	for query in queries:
+		if hasattr(query, 'cost'):
+			filters.append(query)
+		else:
+			planned.extend(sort_filters(filters, kwargs))
+			planned.append(query)
+			filters = []
+	planned.extend(sort_filters(filters, kwargs))
+	return planned
+
+def filter_chunks(filters, events, kwargs):
+	"""
+	Generator, which applies the given filters to the events in chunks and
+	yields the list of selected events for each chunk. The first chunk has
+	LAZY_CHUNK_SIZE events, and the size is doubled for each further chunk,
+	so that callers, which only need a few events, can stop early, while the
+	filters are still applied to many events at once.
+
+	The result of each filter is intersected with the chunk, since some
+	filters (e.g. match_query) select events independently of the query
+	events they get.
+
+	@param filters: list with query operations with a cost (see plan_queries)
+	@param events: candidate events (an iterable)
+	@param kwargs: arguments for the filters
+	"""
+	events = iter(events)
+	size = LAZY_CHUNK_SIZE
+	while True:
+		chunk = list(itertools.islice(events, size))
+		if len(chunk) == 0:
+			return
+		for q in filters:
+			if len(chunk) == 0:
+				break
+			kwargs['query_events'] = chunk
+			selected = set(q(**kwargs))
+			chunk = [event for event in chunk if event in selected]
+		if len(chunk) > 0:
+			yield chunk
+		size *= 2
+
+def sort_filters(filters, kwargs):
+	"""
+	Returns the given filters sorted by cost and estimated selectivity (see
+	plan_queries). The sort is stable, so the order of the rules is kept for
+	equal filters.
+	"""
+	if len(filters) < 2:
+		return filters
+	def key(query):
+		estimate = estimate_query(query, kwargs)
+		return (query.cost, estimate if estimate != None else sys.maxint)
+	return sorted(filters, key=key)
+
+def estimate_query(query, kwargs):
+	"""
+	Returns the estimated number of events selected by the given query
+	operation (based on the cache indexes), or None, if there is no
+	estimate.
+	"""
+	if not hasattr(query, 'estimate') or not 'cache' in kwargs:
+		return None
+	return query.estimate(**kwargs)
+
+def describe_query(query, descriptions):
+	"""
+	Returns a description of the query operation (the XML element, from which
+	it was built, if passed by the rule parser - see event_query).
+	
+	@param descriptions: dict with the descriptions of the query operations
+	"""
+	description = descriptions.get(query)
+	return description if description != None else query.__name__
+
+def explain_query(query, kwargs, descriptions):
+	"""
+	Returns a description of the query operation with its cost and estimate.
+	
+	@param descriptions: dict with the descriptions of the query operations
+	"""
+	if not hasattr(query, 'cost'):
+		return "%s (order dependent)" % describe_query(query, descriptions)
+	return "%s (cost %d, estimate %s)" % (describe_query(query, descriptions), query.cost,
+	                                      estimate_query(query, kwargs))
+
 # functions
 #
 # These functions have no, or only runtime arguments. Thus, we can reference
@@ -10,31 +10,78 @@
 Event cache.
 """
 
+import heapq
 import bisect
 
-try:
-	from blist import blist
-except ImportError:
-	blist = list # fallback to built-in list
-
 from ace.event import Event
+from ace.overflow import OverflowStore
+from ace.views import MaterializedView, WindowCounter, PatternMatcher
 from ace.util import constants
+from ace.util.timerindex import TimerIndex
 
 class EventCache:
 	"""
 	Manages the events and determines, how long to store them.
 	"""
+
+	# event fields, for which a hash index (value -> events) is maintained
+	INDEXED_FIELDS = ['name', 'type', 'status', 'host']
+
+	# time sources, for which a time-ordered index is maintained
+	TIME_SOURCES = ['creation', 'arrival']
+
+	# counters, which are kept in snapshots
+	STATE_COUNTERS = ['dropped_events', 'compressed_events', 'new_compressed',
+	                  'evicted_events', 'evictions']
+
+	# possible values for the cache_eviction_policy configuration option
+	EVICTION_POLICIES = ['none', 'earliest', 'class', 'refuse_local']
+
 	def __init__(self, config, logger, ticker):
 		self.config = config
 		self.logger = logger
 		self.ticker = ticker
 		self.events = set()        #: a set of all events in the cache
-		self.delay_list = blist()  #: sorted list with event delay times -> tuple (delay time, event)
-		self.cache_list = blist()  #: sorted list with event cache times -> tuple (cache time, event)
+		self.ids = {}              #: event id -> event, for all events in the cache
+		self.delay_list = TimerIndex() #: timer index with the next delay check per event
+		self.cache_list = TimerIndex() #: timer index with the next cache check per event
 		self.dropped_events = 0    #: count of dropped events
+		self.delayed_events = 0    #: number of events in the cache, which were not forwarded yet
+		self.pending_events = 0    #: number of non-local, not forwarded events with a delay timer entry
 		self.compressed_events = 0 #: number of events removed from cache because of compression
 		self.new_compressed = 0    #: number of new compressed events
 		self.nextcachewarning = 0  #: next time for warning about cache size exceeded
+		self.evicted_events = 0    #: number of events evicted (or refused) due to the cache size limit
+		self.modifications = 0     #: number of modifications of the cached events (invalidates memoized query results)
+		self.evictions = {}        #: cachetime_rule name -> number of evicted/refused events
+		self.classtable = {}       #: event name -> event classes (for the 'class' eviction policy)
+		self.compressors = {}      #: event name -> compressed event from the last compression of events with this name
+		self.eviction_policy = config.cache_eviction_policy
+		if not self.eviction_policy in self.EVICTION_POLICIES:
+			self.logger.logErr("EventCache: unknown eviction policy '%s' - only warning about cache size."\
+			                   % self.eviction_policy)
+			self.eviction_policy = 'none'
+		self.class_ranks = dict([(c.strip(), i) for (i, c)
+		                         in enumerate(config.cache_eviction_classes.split(",")) if c.strip() != ""])
+		self.index = dict([(field, {}) for field in self.INDEXED_FIELDS]) #: field -> value -> set of events
+		self.time_index = dict([(ts, []) for ts in self.TIME_SOURCES]) #: time source -> sorted list with (timestamp, event id)
+		self.indexed_attributes = set() #: attribute names, for which an index is maintained
+		self.attribute_index = {}  #: attribute name -> value -> set of events
+		self.numeric_index = {}    #: attribute name -> sorted list with (numeric value, event id)
+		self.attribute_values = {} #: event id -> dict with the indexed attribute values of the event
+		self.views = {}            #: query fingerprint -> materialized view
+		self.window_counters = {}  #: (group name, fingerprint) -> window counter
+		self.pattern_matchers = {} #: pattern key -> pattern matcher
+		self.overflow = None       #: overflow store for long-retention events (if configured)
+		if config.cache_overflow_file != "":
+			self.overflow = OverflowStore(config.cache_overflow_file)
+		self.overflow_rules = {}   #: id of an event in the overflow store -> (delaytime_rule, cachetime_rule)
+		self.overflow_index = dict([(field, {}) for field in self.INDEXED_FIELDS]) #: field -> value -> number of events in the overflow store
+		self.pagein_ticks = {}     #: event id -> tick, when the event was read back from the overflow store
+		self.overflow_latest = dict([(ts, None) for ts in self.TIME_SOURCES]) #: time source -> latest timestamp of an event moved to the overflow store
+		self.overflow_attribute_index = {}  #: attribute name -> value -> set of ids of events in the overflow store
+		self.overflow_numeric_index = {}    #: attribute name -> sorted list with (numeric value, event id) for the overflow store
+		self.overflow_attribute_values = {} #: id of an event in the overflow store -> dict with its indexed attribute values
 
 	def getContent(self):
 		"""
@@ -48,12 +95,49 @@ class EventCache:
 		      "Total number of events in the cache: %d" % len(self.events),
 		      "Number of delayed events in the cache: %d" % self.getNumberOfDelayedEvents(),
 		      "Number of cached events in the cache: %d" % self.getNumberOfCachedEvents(),
-		      "Number of timestamps in the delay list: %d" % len(self.delay_list),
-		      "Number of timestamps in the cache list: %d" % len(self.cache_list),
+		      "Number of entries in the delay timer index: %d" % len(self.delay_list),
+		      "Number of entries in the cache timer index: %d" % len(self.cache_list),
+		      "Delay timer index insertions/updates/removals: %d/%d/%d"\
+		        % (self.delay_list.insertions, self.delay_list.updates, self.delay_list.removals),
+		      "Cache timer index insertions/updates/removals: %d/%d/%d"\
+		        % (self.cache_list.insertions, self.cache_list.updates, self.cache_list.removals),
 		      "Number of dropped events: %d" % self.dropped_events,
 		      "Number of removed events due to compression: %d" % self.compressed_events,
 		      "Number of new events due to compression: %d" % self.new_compressed,
+		      "Eviction policy: %s (high/low watermark: %d/%d)"\
+		        % (self.eviction_policy, self.config.cache_max_size, self.config.cache_low_watermark),
+		      "Number of evicted or refused events: %d" % self.evicted_events,
+		    ]+([
+		      "Events in the overflow store: %d (resident limit: %d)"\
+		        % (len(self.overflow), self.config.cache_resident_max),
+		      "Overflow store writes/reads/expirations: %d/%d/%d"\
+		        % (self.overflow.written, self.overflow.read, self.overflow.expired),
+		    ] if self.overflow != None else [])+[
+		      "Number of distinct values in %s index: %d" % (field, len(self.index[field]))
+		      for field in self.INDEXED_FIELDS
+		    ]+[
+		      "Number of distinct values in attribute index for '%s': %d (numeric: %d events)"\
+		        % (name, len(self.attribute_index[name]), len(self.numeric_index[name]))
+		      for name in sorted(self.indexed_attributes)
+		    ]+[
+		      "Number of materialized views: %d (events: %d, reads: %d, checked events: %d)"\
+		        % (len(self.views), sum([len(v.events) for v in self.views.values()]),
+		           sum([v.reads for v in self.views.values()]), sum([v.updates for v in self.views.values()])),
+		      "Number of window counters: %d (values: %d, reads: %d, counted events: %d)"\
+		        % (len(self.window_counters), sum([len(c) for c in self.window_counters.values()]),
+		           sum([c.reads for c in self.window_counters.values()]),
+		           sum([c.additions for c in self.window_counters.values()])),
+		      "Number of pattern matchers: %d (letters: %d, reads: %d, checked events: %d, rebuilds: %d)"\
+		        % (len(self.pattern_matchers), sum([len(m) for m in self.pattern_matchers.values()]),
+		           sum([m.reads for m in self.pattern_matchers.values()]),
+		           sum([m.updates for m in self.pattern_matchers.values()]),
+		           sum([m.rebuilds for m in self.pattern_matchers.values()]))
 		    ]
+		  },{
+		    'title': "Evictions per cache time rule",
+		    'type': 'table',
+		    'headers': ["Rule", "Evicted or refused events"],
+		    'content': [[rule, self.evictions[rule]] for rule in sorted(self.evictions)]
 		  },{
 		    'title': "Control",
 		    'type': 'list',
@@ -109,14 +193,552 @@ class EventCache:
 	def getEventByID(self, eventid):
 		"""
 		Returns the event with the given id, or None if no event with this id
-		is in the cache.
+		is in the cache. Events in the overflow store are not paged in (this is
+		used by the RPC thread) - a copy of the stored event is returned.
 		
 		@param eventid: Event ID.
 		"""
-		for event in self.events:
-			if event.id == eventid:
-				return event
-		return None
+		return self.getEventsByIDs([eventid])[0]
+
+	def getEventsByIDs(self, eventids):
+		"""
+		Returns a list with the events for the given ids (in the same order).
+		The list contains None for ids, which are not in the cache. Like
+		getEventByID, copies are returned for the events in the overflow store.
+		
+		@param eventids: list with event IDs
+		"""
+		ids = self.ids
+		events = [ids.get(eventid) for eventid in eventids]
+		offloaded = [eventid for (eventid, event) in zip(eventids, events)
+		             if event == None and eventid in self.overflow_rules]
+		if len(offloaded) > 0:
+			copies = dict([(event.id, event) for event in self.overflow.readByIDs(offloaded)])
+			events = [event if event != None else copies.get(eventid)
+			          for (eventid, event) in zip(eventids, events)]
+		return events
+
+	def getEventsByField(self, field, value):
+		"""
+		Returns the set of events in the cache, which have the given value in
+		the given (indexed) field. The returned set must not be modified by the
+		caller. Events in the overflow store are not paged in, but returned as
+		copies (see getAllEvents).
+		
+		@param field: one of INDEXED_FIELDS
+		@param value: field value
+		"""
+		events = self.index[field].get(value, frozenset())
+		if self.overflow_index[field].get(value, 0) > 0:
+			return events.union(self.overflow.readByField(field, value))
+		return events
+
+	def indexEvent(self, event):
+		"""
+		Adds the event to the field indexes.
+		"""
+		for field in self.INDEXED_FIELDS:
+			value = getattr(event, field)
+			if not value in self.index[field]:
+				self.index[field][value] = set()
+			self.index[field][value].add(event)
+		for time_source in self.TIME_SOURCES:
+			bisect.insort(self.time_index[time_source], (event.getTimestamp(time_source), event.id))
+		if len(self.indexed_attributes) > 0:
+			self.indexAttributes(event)
+		for view in self.views.itervalues():
+			view.update(event)
+		if len(self.pattern_matchers) > 0:
+			tick = self.ticker.getTick()
+			for matcher in self.pattern_matchers.itervalues():
+				matcher.update(event, tick)
+
+	def unindexEvent(self, event):
+		"""
+		Removes the event from the field indexes.
+		"""
+		for field in self.INDEXED_FIELDS:
+			value = getattr(event, field)
+			events = self.index[field].get(value)
+			if events != None:
+				events.discard(event)
+				if len(events) == 0:
+					del self.index[field][value]
+		for time_source in self.TIME_SOURCES:
+			index = self.time_index[time_source]
+			key = (event.getTimestamp(time_source), event.id)
+			pos = bisect.bisect_left(index, key)
+			if pos < len(index) and index[pos] == key:
+				del index[pos]
+		if event.id in self.attribute_values:
+			self.unindexAttributes(event)
+		for view in self.views.itervalues():
+			view.remove(event)
+		for matcher in self.pattern_matchers.itervalues():
+			matcher.remove(event)
+
+	def setIndexedAttributes(self, names):
+		"""
+		Sets the attribute names, for which an index is maintained (usually
+		the attribute names used in event queries), and rebuilds the attribute
+		index.
+		
+		@param names: set with attribute names
+		"""
+		if not self.config.cache_attribute_index:
+			names = set()
+		self.indexed_attributes = set(names)
+		self.attribute_index = dict([(name, {}) for name in self.indexed_attributes])
+		self.numeric_index = dict([(name, []) for name in self.indexed_attributes])
+		self.attribute_values = {}
+		self.overflow_attribute_index = dict([(name, {}) for name in self.indexed_attributes])
+		self.overflow_numeric_index = dict([(name, []) for name in self.indexed_attributes])
+		self.overflow_attribute_values = {}
+		if len(self.indexed_attributes) > 0:
+			for event in self.events:
+				self.indexAttributes(event)
+			if self.overflow != None and len(self.overflow) > 0:
+				for event in self.overflow.readAll():
+					self.indexStoredAttributes(event)
+
+	def indexAttributes(self, event):
+		"""
+		Adds the event to the attribute index. The indexed values are
+		remembered, so that the event can be removed from the index after its
+		attributes have changed.
+		"""
+		values = self.getIndexedAttributeValues(event)
+		if len(values) == 0:
+			return
+		self.attribute_values[event.id] = values
+		for (name, value) in values.iteritems():
+			index = self.attribute_index[name]
+			if not value in index:
+				index[value] = set()
+			index[value].add(event)
+			if value.isdigit():
+				bisect.insort(self.numeric_index[name], (int(value), event.id))
+
+	def getIndexedAttributeValues(self, event):
+		"""
+		Returns a dict with the values of the indexed attributes of the event
+		(as strings).
+		"""
+		attributes = event.getAttributes()
+		return dict([(name, str(attributes[name])) for name in self.indexed_attributes
+		             if name in attributes])
+
+	def indexStoredAttributes(self, event):
+		"""
+		Adds an event, which is moved to the overflow store, to the attribute
+		index of the stored events (which contains the event ids).
+		"""
+		values = self.getIndexedAttributeValues(event)
+		if len(values) == 0:
+			return
+		self.overflow_attribute_values[event.id] = values
+		for (name, value) in values.iteritems():
+			index = self.overflow_attribute_index[name]
+			if not value in index:
+				index[value] = set()
+			index[value].add(event.id)
+			if value.isdigit():
+				bisect.insort(self.overflow_numeric_index[name], (int(value), event.id))
+
+	def unindexStoredAttributes(self, eventid):
+		"""
+		Removes an event, which is no longer in the overflow store, from the
+		attribute index of the stored events.
+		"""
+		if not eventid in self.overflow_attribute_values:
+			return
+		for (name, value) in self.overflow_attribute_values.pop(eventid).iteritems():
+			index = self.overflow_attribute_index[name]
+			index[value].discard(eventid)
+			if len(index[value]) == 0:
+				del index[value]
+			if value.isdigit():
+				numeric = self.overflow_numeric_index[name]
+				key = (int(value), eventid)
+				pos = bisect.bisect_left(numeric, key)
+				if pos < len(numeric) and numeric[pos] == key:
+					del numeric[pos]
+
+	def unindexAttributes(self, event):
+		"""
+		Removes the event from the attribute index.
+		"""
+		for (name, value) in self.attribute_values.pop(event.id).iteritems():
+			index = self.attribute_index[name]
+			index[value].discard(event)
+			if len(index[value]) == 0:
+				del index[value]
+			if value.isdigit():
+				numeric = self.numeric_index[name]
+				key = (int(value), event.id)
+				pos = bisect.bisect_left(numeric, key)
+				if pos < len(numeric) and numeric[pos] == key:
+					del numeric[pos]
+
+	def noteModification(self):
+		"""
+		Records a modification of the cached events, which may change the
+		result of an event query (so memoized query results are discarded -
+		see QueryCache).
+		"""
+		self.modifications += 1
+
+	def getModifications(self):
+		"""
+		Returns the number of modifications of the cached events.
+		"""
+		return self.modifications
+
+	def reindexAttributes(self, events):
+		"""
+		Updates the attribute index for the given events (e.g. after their
+		attributes have been changed by a plugin).
+		
+		@param events: list with events
+		"""
+		self.noteModification()
+		for event in events:
+			if event in self.events:
+				if event.id in self.attribute_values:
+					self.unindexAttributes(event)
+				if len(self.indexed_attributes) > 0:
+					self.indexAttributes(event)
+				for view in self.views.itervalues():
+					view.update(event)
+				for matcher in self.pattern_matchers.itervalues():
+					matcher.update(event, self.ticker.getTick())
+
+	def setEventAttribute(self, event, name, value, op="set"):
+		"""
+		Changes an attribute of the given event and keeps the attribute index
+		up to date. Should be used instead of Event.setAttribute for cached
+		events.
+		
+		@param event: event to modify
+		@param name: attribute name
+		@param value: new value
+		@param op: operation (see Event.setAttribute)
+		"""
+		event.setAttribute(name, value, op)
+		self.reindexAttributes([event])
+
+	def getEventsByAttribute(self, name, op, value):
+		"""
+		Returns the set of events in the cache, whose attribute with the given
+		name matches the value according to op (see Event.checkAttribute), or
+		None, if the attribute is not indexed. The returned set must not be
+		modified by the caller. Events in the overflow store are not paged in,
+		but returned as copies (see getAllEvents).
+		
+		@param name: attribute name
+		@param op: 'eq', 'ge' or 'le'
+		@param value: value to compare with
+		"""
+		if not name in self.indexed_attributes:
+			return None
+		value = str(value)
+		events = self.lookupAttribute(self.attribute_index[name], self.numeric_index[name], op, value)
+		if op != "eq":
+			ids = self.ids
+			events = set([ids[eventid] for eventid in events])
+		if len(self.overflow_attribute_values) > 0:
+			stored = self.lookupAttribute(self.overflow_attribute_index[name],
+			                              self.overflow_numeric_index[name], op, value)
+			if len(stored) > 0:
+				return events.union(self.overflow.getCopies(stored))
+		return events
+
+	def lookupAttribute(self, index, numeric, op, value):
+		"""
+		Returns the entries of an attribute index for the attribute values,
+		which match the given value according to op: the set with the entries
+		for 'eq', and a list with the event ids from the numeric index for 'ge'
+		and 'le'.
+		
+		@param index: value -> set of entries (events or event ids)
+		@param numeric: sorted list with (numeric value, event id)
+		"""
+		if op == "eq":
+			return index.get(value, frozenset())
+		if not value.isdigit():
+			return []
+		if op == "ge":
+			entries = numeric[bisect.bisect_left(numeric, (int(value),)):]
+		else:
+			entries = numeric[:bisect.bisect_left(numeric, (int(value)+1,))]
+		return [entry[1] for entry in entries]
+
+	def countEventsByField(self, field, value):
+		"""
+		Returns the number of events in the cache (including the overflow
+		store), which have the given value in the given (indexed) field. Unlike
+		getEventsByField, no events are read from the overflow store.
+
+		@param field: one of INDEXED_FIELDS
+		@param value: field value
+		"""
+		return len(self.index[field].get(value, ())) + self.overflow_index[field].get(value, 0)
+
+	def countEventsByAttribute(self, name, op, value):
+		"""
+		Returns the number of events in the cache (including the overflow
+		store), whose attribute with the given name matches the value according
+		to op, or None, if the attribute is not indexed (see
+		getEventsByAttribute).
+
+		@param name: attribute name
+		@param op: 'eq', 'ge' or 'le'
+		@param value: value to compare with
+		"""
+		if not name in self.indexed_attributes:
+			return None
+		value = str(value)
+		return self.countAttribute(self.attribute_index[name], self.numeric_index[name], op, value)\
+		       +self.countAttribute(self.overflow_attribute_index[name], self.overflow_numeric_index[name], op, value)
+
+	def countAttribute(self, index, numeric, op, value):
+		"""
+		Returns the number of entries of an attribute index, which match the
+		given value according to op (see lookupAttribute).
+		"""
+		if op == "eq":
+			return len(index.get(value, ()))
+		if not value.isdigit():
+			return 0
+		if op == "ge":
+			return len(numeric)-bisect.bisect_left(numeric, (int(value),))
+		else:
+			return bisect.bisect_left(numeric, (int(value)+1,))
+
+	def getView(self, key, predicate, max_age, time_source):
+		"""
+		Returns the materialized view of a trigger independent event query (the
+		view is built, when it is used for the first time). Returns None, if
+		views are disabled. Events in the overflow store are kept in the view
+		by their id (see MaterializedView.offload).
+		
+		@param key: fingerprint of the query
+		@param predicate: function, which returns True for the events selected
+		by the query (without max_age)
+		@param max_age: maximum age of a selected event (or None)
+		@param time_source: creation or arrival
+		"""
+		if not self.config.cache_views:
+			return None
+		view = self.views.get(key)
+		if view == None:
+			view = MaterializedView(predicate, max_age, time_source)
+			for event in self.events:
+				view.update(event)
+			if self.overflow != None and len(self.overflow) > 0:
+				for event in self.overflow.readAll():
+					view.update(event)
+					view.offload(event)
+			self.views[key] = view
+		return view
+
+	def getViewEvents(self, key, predicate, max_age, time_source):
+		"""
+		Returns the events selected by a trigger independent event query from
+		the materialized view of the query, or None, if there is no view (see
+		getView). Events in the overflow store are not paged in, but returned
+		as copies (see getAllEvents).
+		"""
+		view = self.getView(key, predicate, max_age, time_source)
+		if view == None:
+			return None
+		events = view.getEvents(self.ticker.getTick())
+		if len(view.stored) > 0:
+			events.extend(self.overflow.getCopies(view.stored.keys()))
+		return events
+
+	def getViewTimestamps(self, key, predicate, max_age, time_source, timeref):
+		"""
+		Returns a sorted list with the timestamps (creation or arrival, see
+		timeref) of the events selected by a trigger independent event query
+		from the materialized view of the query, or None, if there is no view
+		(see getView). The list must not be modified.
+		"""
+		view = self.getView(key, predicate, max_age, time_source)
+		if view == None:
+			return None
+		return view.getTimestamps(self.ticker.getTick(), timeref)
+
+	def clearViews(self):
+		"""
+		Removes all materialized views and pattern matchers (e.g. after the
+		rules have been reloaded - they are rebuilt, when they are used).
+		"""
+		self.views = {}
+		self.pattern_matchers = {}
+
+	def getPatternMatch(self, key, symbols, sort_by, automaton):
+		"""
+		Returns True, if the regular expression of a pattern condition, whose
+		symbols have trigger independent queries, matches the letters of the
+		events in the cache (see PatternMatcher), or None, if views are
+		disabled. The pattern matcher is built, when it is used for the first
+		time, and updated whenever an event is added, modified or removed
+		afterwards. Events in the overflow store keep their letters.
+		
+		@param key: identifies the pattern (regular expression, sort_by and
+		the fingerprints of the symbol queries)
+		@param symbols: list with (letter, predicate, max_age, time_source)
+		@param sort_by: creation or arrival
+		@param automaton: PatternAutomaton of the regular expression
+		"""
+		if not self.config.cache_views:
+			return None
+		tick = self.ticker.getTick()
+		matcher = self.pattern_matchers.get(key)
+		if matcher == None:
+			matcher = PatternMatcher(symbols, sort_by, automaton)
+			for event in self.events:
+				matcher.update(event, tick)
+			if self.overflow != None and len(self.overflow) > 0:
+				for event in self.overflow.readAll():
+					matcher.update(event, tick)
+					matcher.offload(event)
+			self.pattern_matchers[key] = matcher
+		return matcher.matches(tick)
+
+	def getWindowCount(self, group, key, predicate, field, timeframe, buckets, timeref, value):
+		"""
+		Returns the number of events with the given field value in the time
+		window of a window_count condition. The window counter is created, when
+		it is used for the first time, and starts with the events in the cache
+		(apart from the events in the overflow store); afterwards, it is updated
+		whenever a new event is added to the cache (but not for the events
+		built by compressEvents, since the compressed events were counted).
+		
+		@param group: name of the rule group of the condition
+		@param key: fingerprint of the condition
+		@param predicate: function, which returns True for the events to count
+		@param field: event field or attributes.NAME
+		@param timeframe: length of the window
+		@param buckets: number of buckets
+		@param timeref: creation or arrival
+		@param value: field value, for which the events are counted
+		"""
+		tick = self.ticker.getTick()
+		counter = self.window_counters.get((group, key))
+		if counter == None:
+			counter = WindowCounter(predicate, field, timeframe, buckets, timeref)
+			for event in self.events:
+				counter.add(event, tick)
+			self.window_counters[(group, key)] = counter
+		return counter.count(value, tick)
+
+	def clearWindowCounters(self, keep):
+		"""
+		Removes the window counters of all rule groups except for the given
+		ones (e.g. after the rules have been reloaded - the counters of
+		unchanged groups are kept, so their counts continue).
+		
+		@param keep: list with the names of the groups, whose counters are kept
+		"""
+		for (group, key) in self.window_counters.keys():
+			if not group in keep:
+				del self.window_counters[(group, key)]
+
+	def getEventsSince(self, time_source, since):
+		"""
+		Returns a list with the events in the cache, whose timestamp is at
+		least the given time, ordered by the timestamp. Events in the overflow
+		store are not paged in, but returned as copies (see getAllEvents).
+		
+		@param time_source: creation or arrival
+		@param since: earliest timestamp
+		"""
+		index = self.time_index[time_source]
+		ids = self.ids
+		events = [ids[entry[1]] for entry in index[bisect.bisect_left(index, (since,)):]]
+		if self.hasStoredEventsSince(time_source, since):
+			events.extend(self.overflow.readSince(time_source, since))
+			events.sort(key=lambda e: (e.getTimestamp(time_source), e.id))
+		return events
+
+	def iterEventsSince(self, time_source, since):
+		"""
+		Like getEventsSince, but returns an iterator, which fetches the events
+		from the time index as they are needed. The cache must not be modified,
+		while the iterator is used.
+		
+		@param time_source: creation or arrival
+		@param since: earliest timestamp
+		"""
+		if self.hasStoredEventsSince(time_source, since):
+			return iter(self.getEventsSince(time_source, since))
+		index = self.time_index[time_source]
+		ids = self.ids
+		return (ids[index[position][1]] for position in xrange(bisect.bisect_left(index, (since,)), len(index)))
+
+	def hasStoredEventsSince(self, time_source, since):
+		"""
+		Checks, whether the overflow store may contain events, whose timestamp
+		is at least the given time.
+		"""
+		latest = self.overflow_latest[time_source]
+		return latest != None and since <= latest and len(self.overflow) > 0
+
+	def countEventsSince(self, time_source, since):
+		"""
+		Returns the number of events in memory, whose timestamp is at least the
+		given time.
+		
+		@param time_source: creation or arrival
+		@param since: earliest timestamp
+		"""
+		index = self.time_index[time_source]
+		return len(index)-bisect.bisect_left(index, (since,))
+
+	def setEventStatus(self, event, status):
+		"""
+		Changes the status of the given event and keeps the status index up to
+		date. Should be used instead of Event.setStatus for cached events.
+		
+		@param event: event to modify
+		@param status: new status
+		"""
+		if event in self.events:
+			self.unindexEvent(event)
+			event.setStatus(status)
+			self.indexEvent(event)
+			self.noteModification()
+		else:
+			event.setStatus(status)
+
+	def setEventLocal(self, event, local):
+		"""
+		Changes the local field of the given event and keeps the counter of
+		events, which still need forwarding, up to date. Should be used
+		instead of Event.setLocal for cached events.
+		
+		@param event: event to modify
+		@param local: new value for the local field
+		"""
+		if event in self.delay_list and not event.wasForwarded() and event.getLocal() != local:
+			self.pending_events += -1 if local else 1
+		event.setLocal(local)
+		self.noteModification()
+
+	def removeEvent(self, event):
+		"""
+		Removes the event from the event set and the indexes (but not from the
+		delay and cache lists).
+		"""
+		self.events.remove(event)
+		del self.ids[event.id]
+		self.noteModification()
+		self.pagein_ticks.pop(event.id, None)
+		if not event.wasForwarded():
+			self.delayed_events -= 1
+		self.unindexEvent(event)
 
 	def updateCache(self):
 		"""
@@ -129,6 +751,8 @@ class EventCache:
 		"""
 		self.logger.logDebug("Updating cache - events in cache: ", len(self.events))
 		tick = self.ticker.getTick()
+		if self.overflow != None:
+			self.overflow.releaseCopies() # copies returned by the queries of the last tick
 		# check if the cache limit has been exceeded
 		if len(self.events) > self.config.cache_max_size:
 			if self.ticker.getTime() >= self.nextcachewarning:
@@ -140,32 +764,38 @@ class EventCache:
 				            local=False,
 				            description="Too many events are in the cache.")
 		# check whether events can be forwarded
-		while len(self.delay_list)>0:
-			# note: the timestamps in events_delay are considered just as
-			# hints, that it might now be time to forward the event. things may
-			# have changed since the timestamp was inserted, so we recheck
-			# everything. this is easier than always looking for old timestamps
-			# in the list, when the event is changed (even though the list is
-			# sorted).
-			if self.delay_list[0][0] >= tick:
+		while len(self.delay_list) > 0:
+			# note: each event has at most one entry in the timer index. if the
+			# delay time has changed since the entry was set (or the entry was
+			# set earlier on purpose, e.g. by a context), the entry is simply
+			# moved to the current delay time.
+			(deadline, event) = self.delay_list.peek()
+			if deadline >= tick:
 				break
-			event = self.delay_list.pop(0)[1]
-			if event.getDelayTime() >= tick: # delay time has changed, so ignore this one
-				continue
-			if not event in self.events: # event is no longer in cache, -> must have been forwarded
+			self.removeDelayEntry(event)
+			if event.getDelayTime() >= tick: # delay time has changed -> reschedule
+				self.insertDelayTimestamp(event.getDelayTime(), event)
 				continue
 			if not event.hasDelayContexts(): # contexts holding the event back?
 				for e in self.forwardEvents([event]):
 					yield e
 		# check, whether events can be removed from cache
+		if self.overflow != None:
+			for row in self.overflow.expire(tick):
+				del self.overflow_rules[row[0]]
+				self.unindexOverflow(row[1:])
+				self.unindexStoredAttributes(row[0])
+				for view in self.views.itervalues():
+					view.removeStored(row[0])
+				for matcher in self.pattern_matchers.itervalues():
+					matcher.removeStored(row[0])
 		while len(self.cache_list) > 0:
-			# note: again, just hints (see above)
-			if self.cache_list[0][0] >= tick:
+			(deadline, event) = self.cache_list.peek()
+			if deadline >= tick:
 				break
-			event = self.cache_list.pop(0)[1]
-			if event.getCacheTime()>=tick: # cache time has changed -> ignore this one
-				continue
-			if not event in self.events:
+			self.cache_list.pop()
+			if event.getCacheTime() >= tick: # cache time has changed -> reschedule
+				self.cache_list.set(event, event.getCacheTime())
 				continue
 			if event.hasCacheContexts() or event.hasDelayContexts(): # context keeping evt in cache?
 				continue
@@ -176,9 +806,173 @@ class EventCache:
 					                  +"that was never forwarded!")
 				else:
 					self.dropped_events += 1
-			self.events.remove(event)
+			self.removeEvent(event)
+			self.removeDelayEntry(event)
+		# enforce the cache size limit
+		if self.eviction_policy in ['earliest', 'class']\
+		   and len(self.events) > self.config.cache_max_size:
+			for e in self.evictEvents():
+				yield e
+		# move long-retention events to the overflow store
+		if self.overflow != None and len(self.events) > self.config.cache_resident_max:
+			self.offloadEvents()
 		self.logger.logDebug("Update done - events in cache: ", len(self.events))
 
+	def evictEvents(self):
+		"""
+		Reduces the cache to cache_low_watermark events, by removing the events
+		selected by the eviction policy. Events, which were not forwarded yet,
+		are forwarded before they are removed (local events are dropped).
+		
+		Note that this function is a generator, which possibly generates
+		events, which need forwarding. It is the responsibility of the caller
+		to do this.
+		"""
+		if self.eviction_policy == 'class':
+			key = self.classEvictionKey
+		else:
+			key = self.cacheTimeEvictionKey
+		count = len(self.events)-self.config.cache_low_watermark
+		victims = heapq.nsmallest(count, self.events, key=key)
+		self.logger.logNotice("EventCache: evicting %d events (policy: %s)."\
+		                      % (len(victims), self.eviction_policy))
+		for event in victims:
+			for e in self.forwardEvents([event]):
+				yield e
+			if not event.wasForwarded(): # local event
+				self.dropped_events += 1
+			self.countEviction(event)
+			self.removeEvent(event)
+			self.removeEventCacheAndDelayTime(event)
+
+	def cacheTimeEvictionKey(self, event):
+		"""
+		Sort key for the 'earliest' eviction policy.
+		"""
+		return (event.getCacheTime(), event.getArrivalTime(), event.id)
+
+	def classEvictionKey(self, event):
+		"""
+		Sort key for the 'class' eviction policy: the rank of the event's
+		first listed class in cache_eviction_classes, then the cache time.
+		"""
+		ranks = [self.class_ranks[c] for c in self.classtable.get(event.name, [])
+		         if c in self.class_ranks]
+		rank = min(ranks) if len(ranks) > 0 else len(self.class_ranks)
+		return (rank,)+self.cacheTimeEvictionKey(event)
+
+	def countEviction(self, event):
+		"""
+		Counts an evicted (or refused) event for the rule, which determined
+		its cache time.
+		"""
+		rule = str(event.cachetime_rule) if event.cachetime_rule != None else "n/a"
+		self.evictions[rule] = self.evictions.get(rule, 0)+1
+		self.evicted_events += 1
+
+	def setClasstable(self, classtable):
+		"""
+		Sets the event name -> classes lookup table used by the 'class'
+		eviction policy.
+		
+		@param classtable: dict with event names as keys and sets of classes
+		as values
+		"""
+		self.classtable = classtable
+
+	def mayOffload(self, event, tick):
+		"""
+		Checks, whether the event may be moved to the overflow store: it must
+		be forwarded already, not be associated with a context, have a cache
+		time far enough in the future and not have been used recently.
+		"""
+		return event.wasForwarded()\
+		       and not (event.hasCacheContexts() or event.hasDelayContexts())\
+		       and event.getCacheTime() >= tick+self.config.cache_overflow_min_time\
+		       and max(event.getArrivalTime(), self.pagein_ticks.get(event.id, 0))\
+		           <= tick-self.config.cache_overflow_idle_time
+
+	def offloadEvents(self):
+		"""
+		Moves events to the overflow store, until at most cache_resident_max
+		events are in memory (if enough events qualify). The events with the
+		latest cache time are moved first.
+		"""
+		tick = self.ticker.getTick()
+		count = len(self.events)-self.config.cache_resident_max
+		candidates = [e for e in self.events if self.mayOffload(e, tick)]
+		victims = heapq.nlargest(count, candidates, key=lambda e: (e.getCacheTime(), e.id))
+		if len(victims) == 0:
+			return
+		self.logger.logDebug("Moving %d events to the overflow store." % len(victims))
+		for event in victims:
+			for view in self.views.itervalues():
+				view.offload(event)
+			for matcher in self.pattern_matchers.itervalues():
+				matcher.offload(event)
+			self.removeEvent(event)
+			self.removeEventCacheAndDelayTime(event)
+			self.indexStoredAttributes(event)
+			# rules can't be stored on disk -> keep them in memory
+			self.overflow_rules[event.id] = (event.delaytime_rule, event.cachetime_rule)
+			event.delaytime_rule = event.cachetime_rule = None
+			for field in self.INDEXED_FIELDS:
+				value = getattr(event, field)
+				self.overflow_index[field][value] = self.overflow_index[field].get(value, 0)+1
+			for time_source in self.TIME_SOURCES:
+				self.overflow_latest[time_source] = max(self.overflow_latest[time_source],
+				                                        event.getTimestamp(time_source))
+		self.overflow.put(victims)
+
+	def pageIn(self, events):
+		"""
+		Puts events read back from the overflow store into the cache again.
+		
+		@param events: list with events from the overflow store
+		"""
+		tick = self.ticker.getTick()
+		for event in events:
+			(event.delaytime_rule, event.cachetime_rule) = self.overflow_rules.pop(event.id)
+			self.unindexOverflow([getattr(event, field) for field in self.INDEXED_FIELDS])
+			self.unindexStoredAttributes(event.id)
+			self.events.add(event)
+			self.ids[event.id] = event
+			self.indexEvent(event)
+			self.cache_list.set(event, event.getCacheTime())
+			self.pagein_ticks[event.id] = tick
+
+	def pageInCopies(self, events):
+		"""
+		Pages in the copies of events in the overflow store, which are among
+		the given events (see getAllEvents), so that they can be used like the
+		events in memory. Other events are ignored. This is done for the events
+		selected for actions (see rulecomponents.select_events), since they may
+		be modified.
+		
+		@param events: iterable with events (e.g. the result of a query)
+		"""
+		if self.overflow == None or len(self.overflow.copies) == 0:
+			return
+		copies = self.overflow.copies
+		paged = [event for event in events if copies.get(event.id) is event]
+		if len(paged) > 0:
+			self.overflow.takeCopies(paged)
+			self.pageIn(paged)
+
+	def unindexOverflow(self, values):
+		"""
+		Decrements the overflow index counts for an event, which is no longer
+		in the overflow store.
+		
+		@param values: the event's values for INDEXED_FIELDS (in this order)
+		"""
+		for (field, value) in zip(self.INDEXED_FIELDS, values):
+			count = self.overflow_index[field][value]-1
+			if count == 0:
+				del self.overflow_index[field][value]
+			else:
+				self.overflow_index[field][value] = count
+
 	def clearCache(self):
 		"""
 		Removes all events from the cache, be recreating the events set, the
@@ -186,87 +980,221 @@ class EventCache:
 		"""
 		self.logger.logNotice("EventCache: clearing event cache.")
 		self.events = set()
-		self.delay_list = blist()
-		self.cache_list = blist()
+		self.ids = {}
+		self.noteModification()
+		self.views = {}
+		self.window_counters = {}
+		self.pattern_matchers = {}
+		self.index = dict([(field, {}) for field in self.INDEXED_FIELDS])
+		self.time_index = dict([(ts, []) for ts in self.TIME_SOURCES])
+		self.delay_list.clear()
+		self.cache_list.clear()
+		self.delayed_events = 0
+		self.pending_events = 0
+		if self.overflow != None:
+			self.overflow.clear()
+		self.overflow_rules = {}
+		self.overflow_index = dict([(field, {}) for field in self.INDEXED_FIELDS])
+		self.pagein_ticks = {}
+		self.overflow_latest = dict([(ts, None) for ts in self.TIME_SOURCES])
+		self.setIndexedAttributes(self.indexed_attributes)
+		self.compressors = {}
+
+	def getState(self):
+		"""
+		Returns the state of the cache (for snapshots).
+		"""
+		return {
+		  'events': self.events,
+		  'delay_list': [(entry[2], entry[0]) for entry in self.delay_list.heap],
+		  'cache_list': [(entry[2], entry[0]) for entry in self.cache_list.heap],
+		  'overflow': self.overflow.readAll() if self.overflow != None else [],
+		  'overflow_rules': self.overflow_rules,
+		  'pagein_ticks': self.pagein_ticks,
+		  'counters': dict([(name, getattr(self, name)) for name in self.STATE_COUNTERS])
+		}
+
+	def setState(self, state):
+		"""
+		Restores the state of the cache from a snapshot. The current content of
+		the cache is discarded.
+		
+		@param state: dict returned by getState
+		"""
+		self.clearCache()
+		for event in state['events']:
+			self.events.add(event)
+			self.ids[event.id] = event
+			if not event.wasForwarded():
+				self.delayed_events += 1
+			self.indexEvent(event)
+		for (event, deadline) in state['delay_list']:
+			self.insertDelayTimestamp(deadline, event)
+		for (event, deadline) in state['cache_list']:
+			self.insertCacheTimestamp(deadline, event)
+		self.overflow_rules = state['overflow_rules']
+		for event in state['overflow']:
+			for field in self.INDEXED_FIELDS:
+				value = getattr(event, field)
+				self.overflow_index[field][value] = self.overflow_index[field].get(value, 0)+1
+			for time_source in self.TIME_SOURCES:
+				self.overflow_latest[time_source] = max(self.overflow_latest[time_source],
+				                                        event.getTimestamp(time_source))
+			self.indexStoredAttributes(event)
+		if self.overflow != None:
+			self.overflow.put(state['overflow'])
+		else: # no overflow store configured (anymore) -> keep everything in memory
+			self.pageIn(state['overflow'])
+		self.pagein_ticks.update(state['pagein_ticks'])
+		for (name, value) in state['counters'].iteritems():
+			setattr(self, name, value)
 
 	def hasDelayedEvents(self):
 		"""
-		Checks, whether there are any entries in the delay list, which
+		Checks, whether there are any entries in the delay timer index, which
 		reference events, that actually still need to be forwarded.
 		"""
-		for e in self.delay_list:
-			if e[1] in self.events:
-				if not (e[1].wasForwarded() == True or e[1].getLocal() == True):
-					return True
-		return False
+		return self.pending_events > 0
 
 	def getNumberOfDelayedEvents(self):
 		"""
 		Returns the number of delayed events in the cache.
 		"""
-		return len([e for e in self.events if not e.wasForwarded()])
+		return self.delayed_events
 
 	def getNumberOfCachedEvents(self):
 		"""
 		Returns the number of cached events in the cache.
 		"""
-		return len([e for e in self.events if e.wasForwarded()])
+		return len(self.events)-self.delayed_events
+
+	def isPending(self, event):
+		"""
+		Returns True, if the event still needs to be forwarded.
+		"""
+		return not (event.wasForwarded() or event.getLocal())
 
 	def insertDelayTimestamp(self, timestamp, event):
 		"""
-		Insert event's delay timestamp into the delay list in the right
-		position.
+		Sets the time, at which the event's delay is checked next. An existing
+		entry for the event is replaced. Events, which are no longer in the
+		cache, are ignored.
 		"""
-		bisect.insort_right(self.delay_list, (timestamp, event))
+		if event in self.events:
+			if not event in self.delay_list and self.isPending(event):
+				self.pending_events += 1
+			self.delay_list.set(event, timestamp)
 
 	def insertCacheTimestamp(self, timestamp, event):
 		"""
-		Insert event's cache timestamp into the cache list in the correct
-		position.
+		Sets the time, at which the event's cache time is checked next. An
+		existing entry for the event is replaced. Events, which are no longer
+		in the cache, are ignored.
 		"""
-		bisect.insort_right(self.cache_list, (timestamp, event))
+		if event in self.events:
+			self.cache_list.set(event, timestamp)
 
 	def insertEventCacheAndDelayTime(self, event):
 		"""
-		Insert event's delay and cache timestamp into the corresponding lists.
+		Insert event's delay and cache timestamp into the timer indexes.
 		"""
 		self.insertCacheTimestamp(event.getCacheTime(), event)
 		self.insertDelayTimestamp(event.getDelayTime(), event)
 
+	def updateEventsCacheAndDelayTime(self, events, rulemanager):
+		"""
+		Reevaluates the cache and delay times of the given events (which must be
+		in the cache) with the rule manager and updates the timer indexes.
+		
+		@param events: list with events
+		@param rulemanager: RuleManager instance
+		"""
+		for event in events:
+			self.removeEventCacheAndDelayTime(event)
+		rulemanager.updateCacheAndDelayTimes(events)
+		for event in events:
+			self.insertEventCacheAndDelayTime(event)
+
 	def removeEventCacheAndDelayTime(self, event):
 		"""
 		Remove cache and delay timestamps.
 		"""
-		# cache time
-		cachetime = event.getCacheTime()
-		cachepos = bisect.bisect_left(self.cache_list, (cachetime, event))
-		if self.cache_list[cachepos][1] == event:
-			self.logger.logDebug("Removing event from cache_list: ", event)
-			self.cache_list.pop(cachepos)
-		else:
+		if not self.cache_list.remove(event):
 			self.logger.logDebug("Event not in cache_list: ", event)
-		# delay time
-		delaytime = event.getDelayTime()
-		delaypos = bisect.bisect_left(self.delay_list, (delaytime, event))
-		if self.delay_list[delaypos][1] == event:
-			self.logger.logDebug("Removing event from delay list: ", event)
-			self.delay_list.pop(delaypos)
-		else:
+		if not self.removeDelayEntry(event):
 			self.logger.logDebug("Not in delay_list: ", event)
 
+	def removeDelayEntry(self, event):
+		"""
+		Removes the event's entry from the delay timer index. Returns True, if
+		there was an entry.
+		"""
+		if self.delay_list.remove(event):
+			if self.isPending(event):
+				self.pending_events -= 1
+			return True
+		return False
+
 	def getEvents(self):
+		"""
+		Returns the set of events in memory (without the events in the
+		overflow store).
+		"""
 		return self.events
 
-	def addEvent(self, event):
+	def getAllEvents(self):
 		"""
-		Adds the given event to the cache.
+		Returns all events in the cache. If there are events in the overflow
+		store, they are not paged in: a list with the events in memory and
+		copies of the stored events is returned (the same copies, until they
+		are released at the next cache update), so that queries can filter
+		them, and only the events selected for actions have to be paged in
+		(see pageInCopies).
+		"""
+		if self.overflow != None and len(self.overflow) > 0:
+			return list(self.events)+self.overflow.readAll()
+		return self.events
+
+	def getAllEventsOrdered(self, time_source):
+		"""
+		Returns a list with all events in the cache, ordered by the timestamp
+		(see getAllEvents).
+		
+		@param time_source: creation or arrival
+		"""
+		if self.overflow != None and len(self.overflow) > 0:
+			return sorted(self.getAllEvents(), key=lambda e: (e.getTimestamp(time_source), e.id))
+		ids = self.ids
+		return [ids[entry[1]] for entry in self.time_index[time_source]]
+
+	def addEvent(self, event, compressed=False):
+		"""
+		Adds the given event to the cache. With the 'refuse_local' eviction
+		policy, local events are dropped instead, if the cache is full.
 		
 		@param event: event to add
+		@param compressed: whether the event was built by compressEvents from
+		events, which were already in the cache (so it is not counted by the
+		window counters again)
 		"""
-		if not event in self.events:
+		if self.eviction_policy == 'refuse_local' and event.local\
+		   and len(self.events) >= self.config.cache_max_size:
+			self.logger.logDebug("Cache full - refusing local event: ", event)
+			self.dropped_events += 1
+			self.countEviction(event)
+		elif not event in self.events:
 			self.logger.logDebug("Adding to cache: ", event)
 			self.events.add(event)
+			self.ids[event.id] = event
+			self.noteModification()
+			if not event.wasForwarded():
+				self.delayed_events += 1
+			self.indexEvent(event)
 			self.insertEventCacheAndDelayTime(event)
+			if len(self.window_counters) > 0 and not compressed:
+				tick = self.ticker.getTick()
+				for counter in self.window_counters.itervalues():
+					counter.add(event, tick)
 		else:
 			self.logger.logErr("Duplicate event: %s" % event)
 
@@ -287,7 +1215,7 @@ class EventCache:
 		"""
 		if event in self.events:
 			self.dropped_events += 1
-			self.events.remove(event)
+			self.removeEvent(event)
 			self.removeEventCacheAndDelayTime(event)
 
 	def dropEvents(self, events):
@@ -314,6 +1242,9 @@ class EventCache:
 			assert(event in self.events)
 			if event.forwarded == False and event.local == False:
 				self.logger.logDebug("Forwarding event: ", event)
+				if event in self.delay_list:
+					self.pending_events -= 1
+				self.delayed_events -= 1
 				event.forwarded = True
 				yield event
 
@@ -346,72 +1277,89 @@ class EventCache:
 		Compresses multiple events with the same name into one event with a
 		count.
 		
-		This is a generator functions, which yields new events.
+		The events are grouped by name in a single pass. If a group contains
+		the compressed event, which was produced by the last compression of
+		events with this name (and is still in the cache), the other events of
+		the group are folded into it, instead of building a new compressed
+		event from scratch. Its cache and delay time have to be reevaluated.
+		
+		This is a generator functions, which yields new events and updated
+		compressed events (which are still in the cache).
 		"""
 		self.removeStaleEventsFromList(events)
-		raw_or_compressed = [e for e in events
-		                       if (e.getType() in ['raw', 'compressed'])
-		                          and not e.wasForwarded()
-		                          and not e.hasCacheContexts()  # Note: maybe still allow compression?
-		                          and not e.hasDelayContexts()] # Note: maybe still allow compression?
-		names = set([e.getName() for e in raw_or_compressed])
-		for name in names:
-			evts = [e for e in raw_or_compressed if e.getName() == name]
+		groups = {}
+		for e in events:
+			if (e.getType() in ['raw', 'compressed'])\
+			   and not e.wasForwarded()\
+			   and not e.hasCacheContexts()\
+			   and not e.hasDelayContexts(): # Note: maybe still allow compression?
+				if e.name in groups:
+					groups[e.name].append(e)
+				else:
+					groups[e.name] = [e]
+		for (name, evts) in groups.iteritems():
 			if len(evts)<=1:
 				continue
-			# build the new event:
-			newevent = {'name': name, 'type': 'compressed'}
-			newevent['count'] = sum([e.getCount() for e in evts])
-			# description
-			if len(set([e.getDescription() for e in evts])) == 1: # same description everywhere
-				newevent['description'] = evts[0].getDescription()
-			else:
-				newevent['description'] = ""
-			# host
-			if len(set([e.getHost() for e in evts])) == 1: # same host everywhere
-				newevent['host'] = evts[0].getHost()
-			else:
-				newevent['host'] = self.config.hostname
-			# status
-			if len(set([e.getStatus() for e in evts])) == 1:
-				newevent['status'] = evts[0].getStatus()
-			else:
-				newevent['status'] = 'active'
-			# creation timestamp
-			newevent['creation'] = min([e.getCreationTime() for e in evts])
-			# attributes
-			newevent['attributes'] = dict()
-			keys = []
-			for e in evts:
-				keys.extend(e.getAttributes().keys())
-			keys = list(set(keys)) # make unique
-			for key in keys:
-				values = [e.getAttribute(key) for e in evts if e.hasAttribute(key)]
-				if len(set(values)) == 1:
-					newevent['attributes'][key] = values[0]
-				else:
-					newevent['attributes'][key] = "[multiple values]"
-			# references
-			newevent['references'] = {}
-			for eventtype in constants.EVENT_REFERENCE_TYPES:
-				newreferences = set()
+			target = self.compressors.get(name)
+			if target != None and target in evts:
+				# fold the other events into the existing compressed event
+				evts.remove(target)
+				self.removeEventCacheAndDelayTime(target)
+				self.unindexEvent(target)
 				for e in evts:
-					newreferences.update(e.getReferences(eventtype))
-					if len(newreferences) > 0:
-						newevent['references'][eventtype] = list(newreferences)
-			# local field
-			if len(set([e.getLocal() for e in evts])) == 1:
-				newevent['local'] = evts[0].getLocal()
+					self.foldEvent(target, e)
+				self.indexEvent(target)
+				self.noteModification()
+				yield target
 			else:
-				newevent['local'] = False
-			# arrival time
-			newevent['arrival'] = min([e.getArrivalTime() for e in evts])
-			# add new event
-			self.new_compressed += 1
-			new = Event(**newevent)
-			yield new
+				# build the new event:
+				first = evts[0]
+				new = Event(name=name, type='compressed', count=first.getCount(),
+				            description=first.getDescription(), host=first.getHost(),
+				            status=first.getStatus(), creation=first.getCreationTime(),
+				            arrival=first.getArrivalTime(), local=first.getLocal(),
+				            attributes=dict(first.getAttributes()),
+				            references=dict([(reftype, list(first.getReferences(reftype)))
+				                             for reftype in constants.EVENT_REFERENCE_TYPES
+				                             if len(first.getReferences(reftype)) > 0]))
+				for e in evts[1:]:
+					self.foldEvent(new, e)
+				self.new_compressed += 1
+				self.compressors[name] = new
+				yield new
 			# remove old ones
 			self.compressed_events += len(evts)
 			for e in evts:
-				self.events.remove(e)
+				self.removeEvent(e)
 				self.removeEventCacheAndDelayTime(e)
+
+	def foldEvent(self, target, event):
+		"""
+		Folds the given event into the compressed target event: counts are
+		added up, fields with differing values are replaced by a generic value,
+		and references are merged.
+		
+		@param target: compressed event (which is not indexed at the moment)
+		@param event: raw or compressed event
+		"""
+		target.count += event.getCount()
+		if target.description != event.getDescription():
+			target.description = ""
+		if target.host != event.getHost():
+			target.host = self.config.hostname
+		if target.status != event.getStatus():
+			target.status = 'active'
+		if target.local != event.getLocal():
+			target.local = False
+		target.creation = min(target.creation, event.getCreationTime())
+		target.arrival = min(target.arrival, event.getArrivalTime())
+		for (key, value) in event.getAttributes().iteritems():
+			if not target.attributes.has_key(key):
+				target.attributes[key] = value
+			elif target.attributes[key] != value:
+				target.attributes[key] = "[multiple values]"
+		for reftype in constants.EVENT_REFERENCE_TYPES:
+			references = event.getReferences(reftype)
+			if len(references) > 0:
+				current = target.references.setdefault(reftype, [])
+				current.extend([ref for ref in set(references) if not ref in current])
@@ -30,6 +30,7 @@ class ContextManager:
 		self.contexts = {}
 		self.contexts_to_delete = Queue.Queue() # Queue with locking -> avoid synchronisation problems
 		self.context_timeouts = []
+		self.timeout_event_contexts = 0 #: number of contexts, which may generate a timeout event
 
 	def getContent(self):
 		"""
@@ -92,11 +93,34 @@ class ContextManager:
 		Checks, whether there is at least one context in the context manager,
 		which might yet produce a context timeout event.
 		"""
-		for group in self.contexts.values():
-			for context in group.values():
-				if context.eventtuple != None and context.timeout != 0:
-					return True
-		return False
+		return self.timeout_event_contexts > 0
+
+	def mayGenerateTimeoutEvent(self, context):
+		"""
+		Returns True, if the given context may produce a timeout event.
+		"""
+		return context.eventtuple != None and context.timeout != 0
+
+	def getState(self):
+		"""
+		Returns the state of the context manager (for snapshots).
+		"""
+		return {
+		  'contexts': self.contexts,
+		  'context_timeouts': self.context_timeouts
+		}
+
+	def setState(self, state):
+		"""
+		Restores the state of the context manager from a snapshot.
+		
+		@param state: dict returned by getState
+		"""
+		self.contexts = state['contexts']
+		self.context_timeouts = state['context_timeouts']
+		self.timeout_event_contexts = len([context for group in self.contexts.values()
+		                                   for context in group.values()
+		                                   if self.mayGenerateTimeoutEvent(context)])
 
 	def hasGroup(self, group):
 		"""
@@ -149,6 +173,8 @@ class ContextManager:
 		else:
 			context = Context(group, name, rule, self.ticker.getTick(), event, **contextattribs)
 			self.contexts[group][name] = context
+			if self.mayGenerateTimeoutEvent(context):
+				self.timeout_event_contexts += 1
 			self.insertContextTimeout(context)
 
 	def insertContextTimeout(self, context):
@@ -173,6 +199,8 @@ class ContextManager:
 		if self.contexts.has_key(group):
 			if self.contexts[group].has_key(name):
 				context = self.contexts[group].pop(name)
+				if self.mayGenerateTimeoutEvent(context):
+					self.timeout_event_contexts -= 1
 				self.forwardAssociatedEvents(context)
 				if len(self.contexts[group]) == 0:
 					self.contexts.pop(group)
@@ -250,6 +278,7 @@ class ContextManager:
 		"""
 		if self.contexts.has_key(group):
 			if self.contexts[group].has_key(name):
+				self.cache.noteModification() # in_context queries may select other events now
 				self.contexts[group][name].associateWithEvents(events)
 				if self.contexts[group][name].delay_associated:
 					for event in events:
@@ -268,6 +297,7 @@ class ContextManager:
 		For convenience, we just insert new timestamps in the cache and let the
 		cache do the work.
 		"""
+		self.cache.noteModification() # the events are no longer associated with the context
 		for event in context.getAssociatedEvents():
 			if context.delay_associated:
 				event.removeDelayContext(context.group, context.name)
@@ -380,7 +410,8 @@ class Context:
 		    "Repeat: "+str(self.repeat),
 		    "Delay associated events: "+str(self.delay_associated),
 		    "Number of associated events: %d" % len(self.associated_events),
-		    ["Rule responsible for creation: "]+self.rule.getLink(),
+		    ["Rule responsible for creation: "]+
+		    (self.rule.getLink() if self.rule != None else ["n/a"]),
 		  ]
 		},{
 		  'title': "Associated events",
@@ -18,6 +18,8 @@ from ace import rulebase
 from ace import cache
 from ace import contexts
 from ace import event
+from ace import snapshot
+from ace import querycache
 
 class EventHandler(threading.Thread):
 	"""
@@ -48,8 +50,20 @@ class EventHandler(threading.Thread):
 		self.rulemanager = rulebase.RuleManager(self.config, self.logger)
 		# event cache
 		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		self.cache.setClasstable(self.rulemanager.classtable)
+		self.cache.setIndexedAttributes(self.rulemanager.names.query_attributes)
 		# context manager
 		self.contextmanager = contexts.ContextManager(self.config, self.logger, self.ticker, self.cache)
+		# memoized query results (per trigger)
+		if self.config.query_cache:
+			self.querycache = querycache.QueryCache(self.config, self.logger, self.ticker, self.cache)
+		else:
+			self.querycache = None
+		# snapshots of the engine state
+		if self.config.snapshot_file != "":
+			self.snapshot = snapshot.Snapshot(self.config, self.logger)
+		else:
+			self.snapshot = None
 
 	def getContent(self):
 		"""
@@ -66,7 +80,8 @@ class EventHandler(threading.Thread):
 		      "Events waiting in internal queue: %d" % len(self.generated_input_events),
 		      "Generated output events: %d" % self.output_generated,
 		      "Modified events requiring timestamp update: %d" % len(self.modified_events),
-		    ]
+		    ]+(self.querycache.getContent() if self.querycache != None else [])\
+		     +(self.snapshot.getContent() if self.snapshot != None else [])
 		  },{
 		    'title': "Control",
 		    'type': 'list',
@@ -97,6 +112,26 @@ class EventHandler(threading.Thread):
 		       -self.cache.compressed_events
 		       -self.output_generated)
 
+	def getState(self):
+		"""
+		Returns the state of the core (for snapshots).
+		"""
+		return {
+		  'generated_input_events': self.generated_input_events,
+		  'input_processed': self.input_processed,
+		  'output_generated': self.output_generated,
+		  'new_events': self.new_events
+		}
+
+	def setState(self, state):
+		"""
+		Restores the state of the core from a snapshot.
+		
+		@param state: dict returned by getState
+		"""
+		for (name, value) in state.iteritems():
+			setattr(self, name, value)
+
 	def processingRate(self):
 		"""
 		Returns the average processing rate in events per second.
@@ -179,6 +214,8 @@ class EventHandler(threading.Thread):
 		if not self.config.fast_exit:
 			for event in self.cache.forwardAll():
 				self.generateOutputEvent(event)
+		if self.snapshot != None:
+			self.snapshot.save(self, background=False)
 		# end of main processing loop
 		self.logger.logInfo("EventHandler: exiting - %d input events " % self.input_processed\
 		                   +"processed and %d output events generated." % self.output_generated)
@@ -190,6 +227,8 @@ class EventHandler(threading.Thread):
 		processes the events according to the following plan:
 		
 		 - if a rule reload has been requested: ask the rule manager to do it
+		   (in the background, if configured - the new rules are swapped in at
+		   the start of a step)
 		 - update contexts (check whether there are timeouts)
 		   - if necessary generate events for context timeouts
 		 - clean up the event cache
@@ -205,10 +244,22 @@ class EventHandler(threading.Thread):
 		"""
 		# rule reload?
 		if self.reload_rules:
-			changedgroups = self.rulemanager.reloadRules()
+			if self.config.background_reload:
+				self.rulemanager.startReload()
+				changedgroups = None
+			else:
+				changedgroups = self.rulemanager.reloadRules()
+			self.reload_rules = False
+		else:
+			changedgroups = self.rulemanager.finishReload()
+		if changedgroups != None: # new rules in use
 			self.contextmanager.deleteGroups(changedgroups)
 			self.contextmanager.cleanupContexts(self.rulemanager.rulegroups.keys())
-			self.reload_rules = False
+			self.cache.setClasstable(self.rulemanager.classtable)
+			self.cache.setIndexedAttributes(self.rulemanager.names.query_attributes)
+			self.cache.clearViews()
+			self.cache.clearWindowCounters([group for group in self.rulemanager.rulegroups.keys()
+			                                if not group in changedgroups])
 		# update contexts
 		for event in self.contextmanager.updateContexts():
 			self.createEvent(event[0], event[1])
@@ -249,11 +300,12 @@ class EventHandler(threading.Thread):
 			self.cache.clearCache()
 			self.clear_cache = False
 		# reevaluate cache and delay times of modified events
-		while len(self.modified_events) > 0:
-			event = self.modified_events.pop()
-			if event in self.cache.getEvents():
-				self.cache.removeEventCacheAndDelayTime(event)
-				self.rulemanager.updateCacheAndDelayTime(event)
-				self.cache.insertEventCacheAndDelayTime(event)
+		if len(self.modified_events) > 0:
+			events = [event for event in self.modified_events if event in self.cache.getEvents()]
+			self.modified_events.clear()
+			self.cache.updateEventsCacheAndDelayTime(events, self.rulemanager)
+		# snapshot of the engine state
+		if self.snapshot != None:
+			self.snapshot.checkpoint(self)
 		# advance ticker	
 		self.ticker.advance()
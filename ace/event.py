@@ -158,9 +158,12 @@ class Event:
 		return self.name+' (type: '+self.type+', status: '+self.status\
 				 +', host: '+self.host+', creation: '+str(self.creation)+'...)'
 
-	def getContent(self):
+	def getContent(self, cache=None):
 		"""
 		Returns the event content for the RPC server.
+		
+		@param cache: if given, references are resolved in bulk from this cache
+		              (EventCache), so that the referenced events can be shown
 		"""
 		return [{
 		  'title': "Event information",
@@ -213,18 +216,15 @@ class Event:
 		},{
 		  'title': "Child references",
 		  'type': "list",
-		  'content': [[{'action':"show_event", 'args':{'event':reference}, 'text':"%s"%reference}]
-		              for reference in self.getReferences('child')]
+		  'content': self.getReferenceContent('child', cache)
 		},{
 		  'title': "Cross references",
 		  'type': "list",
-		  'content': [[{'action':"show_event", 'args':{'event':reference}, 'text':"%s"%reference}]
-		              for reference in self.getReferences('cross')]
+		  'content': self.getReferenceContent('cross', cache)
 		},{
 		  'title': "Parent references",
 		  'type': "list",
-		  'content': [[{'action':"show_event", 'args':{'event':reference}, 'text':"%s"%reference}]
-		              for reference in self.getReferences('parent')]
+		  'content': self.getReferenceContent('parent', cache)
 		},{
 		  'title': "Event history",
 		  'type': "table",
@@ -369,6 +369,21 @@ class Event:
 				return self.references[reftype]
 		return []
 
+	def getReferenceContent(self, reftype, cache=None):
+		"""
+		Returns a content list with links to the referenced events of the
+		given type. If a cache is given, the references are resolved with a
+		single bulk lookup and events, which are still in the cache, are shown
+		by name.
+		"""
+		references = self.getReferences(reftype)
+		if cache == None:
+			return [[{'action':"show_event", 'args':{'event':reference}, 'text':"%s"%reference}]
+			        for reference in references]
+		return [[{'action':"show_event", 'args':{'event':reference}, 'text':"%s"%event}]
+		        if event != None else ["%s (no longer in cache)" % reference]
+		        for (reference, event) in zip(references, cache.getEventsByIDs(references))]
+
 	def getAllReferences(self):
 		if hasattr(self, 'references'):
 			return self.references
@@ -72,6 +72,9 @@ class Master:
 		                              self.ticker,
 		                              self.input_queue,
 		                              self.output_queues)
+		# restore the engine state from the last snapshot
+		if self.core.snapshot != None and self.config.snapshot_restore:
+			self.core.snapshot.restore(self.core)
 		# output
 		self.sinks = []
 		for i in range(self.num_outputs):
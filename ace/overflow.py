@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Overflow store for the event cache - keeps events, which only need to be
+cached for a long time, on disk (in an SQLite database).
+"""
+
+import sqlite3
+import threading
+import cPickle as pickle
+
+class OverflowStore:
+	"""
+	Disk backed store for events. Events are stored as pickles together with
+	their cache time and the fields, which are indexed by the event cache.
+	Events, which are read back, are removed from the store.
+
+	The events can also be read without removing them (readAll, readByField,
+	readSince and readCopies): the copies are kept and returned again, until
+	they are released (see releaseCopies), so that the event cache can
+	filter them like the events in memory and only page in the selected ones
+	(see takeCopies). readByIDs returns copies for the RPC thread, so all
+	access to the database is serialized with a lock.
+
+	Note: the store does not care about references to rules (which can not be
+	pickled) - the caller has to remove them before the event is stored.
+	"""
+
+	# event fields, which are stored in separate columns (and can be queried)
+	FIELDS = ['name', 'type', 'status', 'host']
+
+	# event timestamps, which are stored in separate columns
+	TIME_SOURCES = ['creation', 'arrival']
+
+	def __init__(self, filename):
+		"""
+		Opens the database and removes any events from a previous run.
+
+		@param filename: file name of the SQLite database (or ':memory:')
+		"""
+		self.filename = filename
+		self.db = sqlite3.connect(filename, check_same_thread=False)
+		self.lock = threading.Lock() #: serializes the access to the database (see readByIDs)
+		self.db.execute("CREATE TABLE IF NOT EXISTS events ("
+		               +"id TEXT PRIMARY KEY, cachetime INTEGER, "
+		               +", ".join(["%s TEXT" % field for field in self.FIELDS])
+		               +", "
+		               +", ".join(["%s INTEGER" % time_source for time_source in self.TIME_SOURCES])
+		               +", data BLOB)")
+		self.db.execute("CREATE INDEX IF NOT EXISTS events_cachetime ON events (cachetime)")
+		for field in self.FIELDS+self.TIME_SOURCES:
+			self.db.execute("CREATE INDEX IF NOT EXISTS events_%s ON events (%s)" % (field, field))
+		self.db.execute("DELETE FROM events")
+		self.db.commit()
+		self.size = 0      #: number of events in the store
+		self.written = 0   #: number of events written to the store
+		self.read = 0      #: number of events read back from the store
+		self.expired = 0   #: number of events removed from the store, because their cache time is over
+		self.copies = {}   #: event id -> copy of a stored event, which was read without removing it
+		self.complete = False #: whether the copies include all stored events (see readAll)
+
+	def __len__(self):
+		return self.size
+
+	def put(self, events):
+		"""
+		Writes the given events to the store.
+
+		@param events: list with events
+		"""
+		columns = len(self.FIELDS)+len(self.TIME_SOURCES)
+		self.lock.acquire()
+		try:
+			self.db.executemany("INSERT OR REPLACE INTO events VALUES (?, ?, %s, ?)" % ", ".join(["?"]*columns),
+			                    [tuple([e.id, e.getCacheTime()]+[getattr(e, field) for field in self.FIELDS]
+			                           +[e.getTimestamp(ts) for ts in self.TIME_SOURCES]
+			                           +[sqlite3.Binary(pickle.dumps(e, 2))])
+			                     for e in events])
+			self.db.commit()
+		finally:
+			self.lock.release()
+		self.complete = False
+		self.size += len(events)
+		self.written += len(events)
+
+	def takeCopies(self, events):
+		"""
+		Removes the given events, which are copies returned by readAll (or
+		one of the other read methods), from the store (the copies are used
+		instead of reading the events again).
+
+		@param events: list with copies of stored events
+		"""
+		self.lock.acquire()
+		try:
+			self.db.executemany("DELETE FROM events WHERE id = ?", [(e.id,) for e in events])
+			self.db.commit()
+		finally:
+			self.lock.release()
+		for event in events:
+			del self.copies[event.id]
+		self.size -= len(events)
+		self.read += len(events)
+
+	def readByIDs(self, eventids):
+		"""
+		Returns copies of the events with the given ids, which are in the store
+		(without removing them). Unlike the other methods, this may be called
+		from other threads than the one using the store.
+		"""
+		self.lock.acquire()
+		try:
+			rows = []
+			for eventid in eventids:
+				rows.extend(self.db.execute("SELECT data FROM events WHERE id = ?", (eventid,)).fetchall())
+		finally:
+			self.lock.release()
+		return [pickle.loads(str(row[0])) for row in rows]
+
+	def readAll(self):
+		"""
+		Returns copies of all events in the store (without removing them).
+		"""
+		if not self.complete:
+			self.readCopies("")
+			self.complete = True
+		return self.copies.values()
+
+	def readByField(self, field, value):
+		"""
+		Returns copies of the stored events with the given value in the given
+		field (without removing them).
+		"""
+		assert(field in self.FIELDS)
+		return self.readCopies("%s = ?" % field, (value,))
+
+	def readSince(self, time_source, since):
+		"""
+		Returns copies of the stored events with a timestamp of at least the
+		given time (without removing them).
+		"""
+		assert(time_source in self.TIME_SOURCES)
+		return self.readCopies("%s >= ?" % time_source, (since,))
+
+	def readCopies(self, where, args=()):
+		"""
+		Returns copies of the events matching the given condition, without
+		removing them. Events, which were read before, are not read again, but
+		the same copies are returned, until they are released.
+
+		@param where: SQL condition (without 'WHERE'), or an empty string for
+		all events
+		@param args: arguments for the placeholders in the condition
+		"""
+		condition = (" WHERE "+where) if where != "" else ""
+		copies = self.copies
+		self.lock.acquire()
+		try:
+			ids = [row[0] for row in self.db.execute("SELECT id FROM events"+condition, args).fetchall()]
+			missing = [eventid for eventid in ids if not eventid in copies]
+			if self.complete or len(missing) == 0:
+				rows = []
+			elif len(missing) == len(ids):
+				rows = self.db.execute("SELECT id, data FROM events"+condition, args).fetchall()
+			else:
+				rows = []
+				for eventid in missing:
+					rows.extend(self.db.execute("SELECT id, data FROM events WHERE id = ?", (eventid,)).fetchall())
+		finally:
+			self.lock.release()
+		self.loadRows(rows)
+		return [copies[eventid] for eventid in ids]
+
+	def getCopies(self, eventids):
+		"""
+		Returns copies of the stored events with the given ids (like
+		readCopies).
+		"""
+		copies = self.copies
+		missing = [eventid for eventid in eventids if not eventid in copies]
+		if len(missing) > 0:
+			self.lock.acquire()
+			try:
+				rows = []
+				for eventid in missing:
+					rows.extend(self.db.execute("SELECT id, data FROM events WHERE id = ?", (eventid,)).fetchall())
+			finally:
+				self.lock.release()
+			self.loadRows(rows)
+		return [copies[eventid] for eventid in eventids if eventid in copies]
+
+	def loadRows(self, rows):
+		"""
+		Returns the events for the given rows (id, data) - the existing copies
+		are used, and the other events are added to the copies.
+		"""
+		copies = self.copies
+		for (eventid, data) in rows:
+			if not eventid in copies:
+				copies[eventid] = pickle.loads(str(data))
+		return [copies[row[0]] for row in rows]
+
+	def releaseCopies(self):
+		"""
+		Releases the copies of the stored events (so that they don't use
+		memory after they have been filtered - called by the event cache once
+		per tick).
+		"""
+		self.copies = {}
+		self.complete = False
+
+	def expire(self, tick):
+		"""
+		Removes all events with a cache time before the given tick.
+
+		@return: list with tuples (id, name, type, status, host) of the removed
+		events
+		"""
+		self.lock.acquire()
+		try:
+			rows = self.db.execute("SELECT id, %s FROM events WHERE cachetime < ?" % ", ".join(self.FIELDS),
+			                       (tick,)).fetchall()
+			if len(rows) > 0:
+				self.db.execute("DELETE FROM events WHERE cachetime < ?", (tick,))
+				self.db.commit()
+		finally:
+			self.lock.release()
+		for row in rows:
+			self.copies.pop(row[0], None)
+		self.size -= len(rows)
+		self.expired += len(rows)
+		return rows
+
+	def clear(self):
+		"""
+		Removes all events.
+		"""
+		self.lock.acquire()
+		try:
+			self.db.execute("DELETE FROM events")
+			self.db.commit()
+		finally:
+			self.lock.release()
+		self.releaseCopies()
+		self.size = 0
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Query cache module - memoizes the results of event queries during the
+processing of a trigger event.
+"""
+
+class QueryCache:
+	"""
+	Stores the results of event queries, so that structurally identical
+	queries (in different rules, or referenced with match_query) are only
+	evaluated once per trigger event.
+
+	Queries are identified by a fingerprint, which is computed by the rule
+	parser. The result of a query only depends on the trigger, the current
+	tick and the events in the cache (including their context associations),
+	so the stored results are discarded, as soon as one of these changes (the
+	event cache counts all modifications of its events).
+	"""
+
+	def __init__(self, config, logger, ticker, cache):
+		self.config = config
+		self.logger = logger
+		self.ticker = ticker
+		self.cache = cache
+		self.state = None        #: (trigger, tick, cache modifications), for which the results are valid
+		self.results = {}        #: query fingerprint -> list with events
+		self.evaluations = 0     #: number of evaluated queries
+		self.hits = 0            #: number of evaluations saved
+		self.invalidations = 0   #: number of times, stored results were discarded due to modified events
+
+	def getContent(self):
+		"""
+		Returns the query cache information for display in a UI.
+		"""
+		return [
+		  "Query cache: %d queries evaluated, %d evaluations saved, %d invalidations"\
+		    % (self.evaluations, self.hits, self.invalidations)
+		]
+
+	def validate(self, trigger):
+		"""
+		Discards the stored results, if they are not valid for the given
+		trigger (or the cache was modified in the meantime).
+		"""
+		state = (trigger, self.ticker.getTick(), self.cache.getModifications())
+		if state != self.state:
+			if self.state != None and len(self.results) > 0\
+			   and self.state[0] is trigger and self.state[1] == state[1]:
+				self.invalidations += 1
+			self.state = state
+			self.results = {}
+
+	def get(self, fingerprint, trigger):
+		"""
+		Returns the stored result of the query with the given fingerprint, or
+		None, if the query must be evaluated. The caller may modify the
+		returned list.
+		"""
+		self.validate(trigger)
+		if fingerprint in self.results:
+			self.hits += 1
+			return list(self.results[fingerprint])
+		return None
+
+	def put(self, fingerprint, trigger, events):
+		"""
+		Stores the result of the query with the given fingerprint.
+		"""
+		self.validate(trigger)
+		self.evaluations += 1
+		self.results[fingerprint] = list(events)
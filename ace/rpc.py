@@ -39,6 +39,8 @@ class RPCHandler(Thread):
 		  "show_querytable": {'args': [], 'function': self.execActionShowQuerytable},
 		  "show_rulegroup": {'args': ['group'], 'function': self.execActionShowRulegroup},
 		  "show_rule": {'args': ['group', 'rule'], 'function': self.execActionShowRule},
+		  "explain_rule": {'args': ['group', 'rule'], 'function': self.execActionExplainRule},
+		  "show_rule_profile": {'args': [], 'function': self.execActionShowRuleProfile},
 		  "show_context": {'args': ['group', 'name'], 'function': self.execActionShowContext},
 		  "delete_context": {'args': ['group', 'name'], 'function': self.execActionDeleteContext},
 		  "reload_rules": {'args': [], 'function': self.execActionReloadRules},
@@ -124,15 +126,16 @@ class RPCHandler(Thread):
 		"""
 		Returns content for an event.
 		"""
-		event = self.core.cache.getEventByID(event)
+		eventid = event
+		event = self.core.cache.getEventByID(eventid)
 		if event == None:
 			return [{
 			  'title': "Error in execAction",
 			  'type': "text",
-			  'content': "No event with ID '%s' in cache." % event
+			  'content': "No event with ID '%s' in cache." % eventid
 			}]
 		else:
-			return event.getContent() + [{
+			return event.getContent(self.core.cache) + [{
 			  'title': "Relevant rules",
 			  'type': 'list',
 			  'content': [rule.getLink() for rule in self.core.rulemanager.getRelevantRules(event)]
@@ -150,9 +153,18 @@ class RPCHandler(Thread):
 				return rules[0].getLink()
 			else:
 				return reduce(lambda a, b: a+[", "]+b, [rule.getLink() for rule in rules])
-		table = self.core.rulemanager.ruletable
+		rulemanager = self.core.rulemanager
+		table = rulemanager.ruletable
 		types = constants.EVENT_TYPES_ANY
 		return [{
+		  'title': "Dispatch table",
+		  'type': 'list',
+		  'content': [
+		    "Cached (name, type) combinations: %d" % len(rulemanager.dispatch_table),
+		    "Lookups (hits/misses): %d/%d" % (rulemanager.dispatch_hits, rulemanager.dispatch_misses),
+		    "Hit rate: %.1f%%" % (100*rulemanager.getDispatchHitRate())
+		  ]
+		},{
 		  'title': "Rules for events with any name and given type",
 		  'type': 'table',
 		  'headers': ["Type", "Rules"],
@@ -205,7 +217,7 @@ class RPCHandler(Thread):
 				eventnames.update(table[delay][time_source]['by_event'].keys())
 		eventnames = list(eventnames)
 		eventnames.sort()
-		content = [{
+		content = self.core.rulemanager.getVerificationContent()+[{
 		  'title': "Default delay and cache times for any event",
 		  'type': 'table',
 		  'headers': headers,
@@ -280,6 +292,26 @@ class RPCHandler(Thread):
 			  'content': "RuleManager has no group '%s'." % group
 			}]
 
+	def execActionShowRuleProfile(self):
+		"""
+		Returns the execution profiles of all rules.
+		"""
+		return self.core.rulemanager.getProfileContent()
+
+	def execActionExplainRule(self, group, rule):
+		"""
+		Returns the query plans for the event queries of a single rule.
+		"""
+		if self.core.rulemanager.hasGroup(group) and self.core.rulemanager.getGroup(group).hasRule(rule):
+			rule = self.core.rulemanager.getRule(group, rule)
+			return [{'title': "Rule", 'type': "list", 'content': [rule.getLink()]}]+rule.getQueryPlans(self.core)
+		else:
+			return [{
+			  'title': "No such rule",
+			  'type': "text",
+			  'content': "RuleManager has no rule '%s::%s'." % (group, rule)
+			}]
+
 	def execActionShowContext(self, group, name):
 		"""
 		Returns the content of a context.
@@ -10,15 +10,21 @@
 Rule parsing and management.
 """
 
+import bisect
 import hashlib
+import heapq
 import re
 import sys
+import time
+from threading import Thread
 from lxml import etree
 from ace.util.exceptions import RuleParserException
 from ace.util.constants import *
 from ace.basisfunctions import rulecomponents
 from ace.basisfunctions import querycomponents
+from ace.basisfunctions.rulecompiler import RuleCompiler
 from ace.event import MetaEvent
+from ace.rulebundle import RuleBundle
 
 class NameRecord:
 	"""
@@ -27,6 +33,7 @@ class NameRecord:
 	def __init__(self):
 		self.query_names = None
 		self.query_classes = None
+		self.query_attributes = None
 		self.trigger_names = None
 		self.trigger_classes = None
 
@@ -39,28 +46,63 @@ class EventRecord:
 		self.when_class = None
 		self.when_event = None
 
+class GroupTables:
+	"""
+	Entries of a single rule group for the rule table and the query table
+	(see RuleManager.buildRuletable and RuleManager.buildQuerytable). The
+	entries are not changed after they were built, so that the rule manager
+	of a reload can reuse them for unchanged groups.
+	"""
+
+	def __init__(self, group, rule_entries, signature=None, classifications=None):
+		self.group = group                     #: RuleGroup
+		self.rule_entries = rule_entries       #: list with (table, key, event type, rule tuple) for the rule table
+		self.signature = signature             #: query table signature of the classifications
+		self.classifications = classifications #: classifications of group.query_determinators
+
 class RuleManager:
 	"""
 	Manages the rules in the correlation engine.
 	"""
 
-	def __init__(self, config, logger):
+	# possible values for the querytable_verification configuration option
+	VERIFICATION_MODES = ['off', 'sampled', 'full']
+
+	# number of discrepancies, which are kept for display
+	MAX_DISCREPANCIES = 10
+
+	def __init__(self, config, logger, current=None):
+		"""
+		@param current: the running rule manager, if the rule manager is
+		created to reload the rules (see RuleReloader) - in this case,
+		unchanged groups and their table entries are reused (but not
+		modified), and errors are raised instead of exiting
+		"""
 		self.config = config
 		self.logger = logger
-		self.logger.logInfo("RuleManager: init.")
 		self.ruleparser = RuleParser(config, logger)
-		try:
-			(self.rulegroups, self.names, self.query_determinators, self.named_queries) =\
-			  self.ruleparser.parseRules(current=dict())
-			self.logger.logInfo("Parsed %d rule groups." % len(self.rulegroups))
-			self.eventclasses = self.ruleparser.parseEventClasses()
-			self.logger.logInfo("Parsed %d event classes." % len(self.eventclasses))
-		except (RuleParserException, IOError, etree.XMLSyntaxError) as e:
-			self.logger.logErr("RuleManager: %s" % e)
-			sys.exit(1)
-		self.ruletable = self.buildRuletable()
-		self.classtable = self.buildClasstable()
-		self.querytable = self.buildQuerytable()
+		if current == None:
+			self.logger.logInfo("RuleManager: init.")
+			try:
+				self.loadRules(None)
+			except (RuleParserException, IOError, etree.XMLSyntaxError) as e:
+				self.logger.logErr("RuleManager: %s" % e)
+				sys.exit(1)
+		else:
+			self.loadRules(current)
+		self.dispatch_table = {} #: (event name, event type) -> ordered list with relevant rules
+		self.dispatch_hits = 0   #: number of getRelevantRules calls answered by the dispatch table
+		self.dispatch_misses = 0 #: number of getRelevantRules calls, which had to compute the rule list
+		self.reloader = None     #: RuleReloader of a reload, which was not swapped in yet
+		self.verification = config.querytable_verification
+		if not self.verification in self.VERIFICATION_MODES:
+			self.logger.logErr("RuleManager: unknown query table verification mode '%s' - using 'sampled'."\
+			                   % self.verification)
+			self.verification = 'sampled'
+		self.verification_countdown = 0  #: number of events until the next event is verified (sampled mode)
+		self.verified_results = 0        #: number of cache and delay times from the query table, which were verified
+		self.discrepancy_count = 0       #: number of wrong query table results found by the verification
+		self.discrepancies = []          #: the last discrepancies (dicts with event, delay, results and rule)
 
 	def getNumberOfRules(self):
 		return sum([len(group.rules) for group in self.rulegroups.values()])
@@ -82,7 +124,8 @@ class RuleManager:
 		    'type': 'list',
 		    'content': [
 		      [{'action': "show_ruletable", 'text': "Show rule table", 'args':{}}],
-		      [{'action': "show_querytable", 'text': "Show query table", 'args':{}}]
+		      [{'action': "show_querytable", 'text': "Show query table", 'args':{}}],
+		      [{'action': "show_rule_profile", 'text': "Show rule profiles", 'args':{}}]
 		    ]
 		  },{
 		    'title': "Event classes",
@@ -124,44 +167,187 @@ class RuleManager:
 		  }
 		]
 
+	def loadRules(self, current):
+		"""
+		Parses the rules and event classes, and builds the tables.
+		
+		@param current: running RuleManager (unchanged groups are reused), or None
+		"""
+		if current != None:
+			groups = current.rulegroups
+		else:
+			groups = dict()
+		bundle = None
+		if self.config.rule_bundle != "":
+			bundle = RuleBundle(self.config, self.logger).load(self.ruleparser)
+		if bundle != None:
+			names = NameRecord()
+			names.__dict__.update(bundle['names'])
+			(self.rulegroups, self.names, self.query_determinators, self.named_queries) =\
+			  self.ruleparser.parseRules(current=groups, names=names)
+			self.eventclasses = bundle['eventclasses']
+		else:
+			(self.rulegroups, self.names, self.query_determinators, self.named_queries) =\
+			  self.ruleparser.parseRules(current=groups)
+			self.eventclasses = self.ruleparser.parseEventClasses()
+		self.logger.logInfo("Parsed %d rule groups." % len(self.rulegroups))
+		self.logger.logInfo("Parsed %d event classes." % len(self.eventclasses))
+		# the table entries of reused groups are shared with the running rule manager
+		self.grouptables = dict() #: group name -> GroupTables
+		if current != None:
+			for (name, tables) in current.grouptables.iteritems():
+				if self.rulegroups.get(name) is tables.group:
+					self.grouptables[name] = tables
+		self.ruletable = self.buildRuletable()
+		if current != None and current.eventclasses == self.eventclasses:
+			self.classtable = current.classtable
+		else:
+			self.classtable = self.buildClasstable()
+		restored = None
+		if bundle != None:
+			restored = self.restoreClassifications(bundle['classifications'])
+		self.querytable = self.buildQuerytable(restored)
+
+	def getDeterminatorKey(self, qdet):
+		"""
+		Returns a key, which identifies the query determinator in the rules.
+		"""
+		return (qdet['rule'].group.name, qdet['rule'].name, qdet['name'], qdet['max_age'],
+		        qdet['time_source'], qdet['delay'])
+
+	def getClassifications(self):
+		"""
+		Returns a list with (determinator key, classification) for all query
+		determinators (see buildQuerytable), for the rule bundle.
+		"""
+		return [(self.getDeterminatorKey(qdet), self.classifications[id(qdet)])
+		        for qdet in self.query_determinators]
+
+	def restoreClassifications(self, classifications):
+		"""
+		Returns the query determinator classifications from a rule bundle (see
+		buildQuerytable), if the bundle matches the parsed queries.
+		
+		@param classifications: list with (determinator key, classification)
+		@return: dict with id(query determinator) -> classification, or None
+		"""
+		keys = [self.getDeterminatorKey(qdet) for qdet in self.query_determinators]
+		if keys != [key for (key, classification) in classifications]:
+			self.logger.logWarn("RuleManager: queries in the rule bundle don't match - ignoring them.")
+			return None
+		return dict([(id(qdet), classification)
+		             for (qdet, (key, classification)) in zip(self.query_determinators, classifications)])
+
 	def reloadRules(self):
 		"""
-		Tries to reload to rules.
+		Tries to reload to rules (the rules are parsed in the calling thread,
+		see startReload for the background reload).
 		 - old groups are deleted and their contexts are removed
 		 - if a rulegroup is not changed (or only comments and whitespace were
 		   changed), the old rule is kept
+		
+		@return: list with the groups, whose contexts need to be deleted
 		"""
-		try:
-			self.ruleparser.resetState()
-			(newrules, names, qdets, named_queries) = self.ruleparser.parseRules(current=self.rulegroups)
-			self.eventclasses = self.ruleparser.parseEventClasses()
-		except (RuleParserException, IOError, etree.XMLSyntaxError) as e:
-			self.logger.logErr(str(e))
-			self.logger.logErr("Keeping current correlation rules.")
+		reloader = RuleReloader(self)
+		reloader.run()
+		if reloader.rules == None:
 			return []
+		return self.swapRules(reloader.rules)
+
+	def startReload(self):
+		"""
+		Starts to reload the rules on a background thread (see RuleReloader),
+		unless a reload is already running. The new rules are used after
+		finishReload is called.
+		"""
+		if self.reloader != None and self.reloader.isAlive():
+			self.logger.logWarn("RuleManager: rule reload already in progress.")
+			return
+		self.reloader = RuleReloader(self)
+		self.reloader.start()
+
+	def finishReload(self):
+		"""
+		Swaps in the rules, if a reload started with startReload has
+		finished. This should be called at a tick boundary, so that all events
+		in a tick are processed with the same rules.
+		
+		@return: list with the groups, whose contexts need to be deleted, or
+		None, if no reload has finished
+		"""
+		if self.reloader == None or self.reloader.isAlive():
+			return None
+		reloader = self.reloader
+		self.reloader = None
+		if reloader.rules == None:
+			return None
+		return self.swapRules(reloader.rules)
+
+	def swapRules(self, rules):
+		"""
+		Replaces the rules and tables with those of the given rule manager.
+		
+		@param rules: RuleManager with the reloaded rules
+		@return: list with the groups, whose contexts need to be deleted
+		"""
 		changedgroups = [] # groups, whose contexts need to be deleted
 		for group in self.rulegroups.keys():
-			if not group in newrules.keys():
+			if not group in rules.rulegroups.keys():
 				self.logger.logInfo("Rule group %s no longer exists." % group)
-			elif self.rulegroups[group].getHash() != newrules[group].getHash():
+			elif self.rulegroups[group].getHash() != rules.rulegroups[group].getHash():
 				self.logger.logInfo("Removing contexts of modified rule group %s." % group)
 				changedgroups.append(group)
-		self.rulegroups = newrules
-		self.names = names
-		self.query_determinators = qdets
-		self.named_queries = named_queries
-		self.ruletable = self.buildRuletable()
-		self.logger.logNotice("RuleManager: new rule table built.")
-		self.classtable = self.buildClasstable()
-		self.logger.logNotice("RuleManager: new table built.")
-		self.querytable = self.buildQuerytable()
-		self.logger.logNotice("RuleManager: new query table built.")
+		self.rulegroups = rules.rulegroups
+		self.names = rules.names
+		self.query_determinators = rules.query_determinators
+		self.named_queries = rules.named_queries
+		self.eventclasses = rules.eventclasses
+		self.grouptables = rules.grouptables
+		self.ruletable = rules.ruletable
+		self.classtable = rules.classtable
+		self.classifications = rules.classifications
+		self.querytable = rules.querytable
+		self.dispatch_table = {}
+		self.logger.logNotice("RuleManager: new rules and tables in use.")
 		return changedgroups
 
 	def getRelevantRules(self, event):
 		"""
 		Returns the relevant rules for the given event in the correct order for execution.
 		
+		The rules only depend on the event name and type, so the result is
+		stored in the dispatch table (which is cleared, when the rules are
+		reloaded, or when it is full - see dispatch_table_max_size). The
+		returned list must not be modified by the caller.
+		
+		@param event: trigger event
+		"""
+		key = (event.getName(), event.getType())
+		if key in self.dispatch_table:
+			self.dispatch_hits += 1
+			return self.dispatch_table[key]
+		self.dispatch_misses += 1
+		rules = self.computeRelevantRules(event)
+		if len(self.dispatch_table) >= self.config.dispatch_table_max_size:
+			self.dispatch_table = {}
+		self.dispatch_table[key] = rules
+		return rules
+
+	def getDispatchHitRate(self):
+		"""
+		Returns the fraction of getRelevantRules calls, which were answered by
+		the dispatch table (0.0, if there were no calls yet).
+		"""
+		calls = self.dispatch_hits+self.dispatch_misses
+		if calls == 0:
+			return 0.0
+		return float(self.dispatch_hits)/calls
+
+	def computeRelevantRules(self, event):
+		"""
+		Computes the relevant rules for the given event from the rule table (see
+		getRelevantRules).
+		
 		@param event: trigger event
 		"""
 		relevant_rules = []
@@ -189,49 +375,209 @@ class RuleManager:
 		
 		@param event: Event instance
 		"""
-		name = event.getName()
-		for delay in [True, False]:
-			max_time = 0
-			rule = None
-			relevant_queries = []
-			for time_source in ['creation', 'arrival']:
-				eventtime = event.getTimestamp(time_source)
-				# relevant_queries += self.querytable[delay][time_source]['any']['qdets']
-				entries = [self.querytable[delay][time_source]['any']]
-				if self.querytable[delay][time_source]['by_event'].has_key(name):
-					entries += [self.querytable[delay][time_source]['by_event'][name]]
-				for entry in entries:
-					if entry['max_age'] + eventtime > max_time:
-						max_time = entry['max_age'] + eventtime
+		self.updateCacheAndDelayTimes([event])
+
+	def updateCacheAndDelayTimes(self, events):
+		"""
+		Update the cache and delay times of the given events (e.g. of all
+		events modified in a tick) according to the query table.
+
+		The query table entries are looked up and sorted only once per event
+		name, and each determinator is evaluated at most once per combination
+		of the event fields it depends on (see getDeterminatorFields).
+		
+		@param events: list with Event instances
+		"""
+		entries = {}
+		determinations = {}
+		for event in events:
+			name = event.getName()
+			if not entries.has_key(name):
+				entries[name] = self.getQuerytableEntries(name)
+			fields = self.getDeterminatorFields(event)
+			verify = self.shouldVerify()
+			for delay in [True, False]:
+				(table_entries, qdets) = entries[name][delay]
+				timestamps = dict([(time_source, event.getTimestamp(time_source))
+				                   for time_source in ['creation', 'arrival']])
+				max_time = 0
+				rule = None
+				for (time_source, entry) in table_entries:
+					if entry['max_age'] + timestamps[time_source] > max_time:
+						max_time = entry['max_age'] + timestamps[time_source]
 						rule = entry['rule']
-					relevant_queries.extend([(det['max_age'] + eventtime, det) for det in entry['qdets']])
-			relevant_queries.sort(reverse=True)
-			for (cur_max, qdet) in relevant_queries:
-				if cur_max <= max_time:
-					break
+				# determinators by descending time (the lists are sorted by max_age)
+				candidates = heapq.merge(*[
+				  ((-(qdet['max_age'] + timestamps[time_source]), position, qdet)
+				   for (position, qdet) in qdets[time_source])
+				  for time_source in ['creation', 'arrival']])
+				for (cur_max, position, qdet) in candidates:
+					cur_max = -cur_max
+					if cur_max <= max_time:
+						break
+					key = (fields, id(qdet))
+					if fields == None or not determinations.has_key(key):
+						result = qdet['determinator'](event=event, rulemanager=self)
+						if fields != None:
+							determinations[key] = result
+					else:
+						result = determinations[key]
+					if result != False:
+						max_time = cur_max
+						rule = qdet['rule']
+				# brute force solution
+				if verify:
+					self.verifyCacheOrDelayTime(event, delay, max_time, rule)
+				# update event timestamp and rule
+				if delay:
+					event.setDelayTime(max_time, rule)
 				else:
+					event.setCacheTime(max_time, rule)
+
+	def getQuerytableEntries(self, name):
+		"""
+		Returns the query table entries relevant for events with the given name:
+		a dict with a tuple (entries, determinators) for delay True and False,
+		where entries is a list of (time_source, entry) and determinators a dict
+		with a list of (position, qdet), sorted by descending max_age, for each
+		time source.
+		
+		@param name: event name
+		"""
+		result = {}
+		position = 0
+		for delay in [True, False]:
+			table_entries = []
+			qdets = {}
+			for time_source in ['creation', 'arrival']:
+				table = self.querytable[delay][time_source]
+				time_source_entries = [table['any']]
+				if table['by_event'].has_key(name):
+					time_source_entries.append(table['by_event'][name])
+				qdets[time_source] = []
+				for entry in time_source_entries:
+					table_entries.append((time_source, entry))
+					qdets[time_source].extend(entry['qdets'])
+				qdets[time_source].sort(key=lambda qdet: qdet['max_age'], reverse=True)
+				qdets[time_source] = [(position+i, qdet) for (i, qdet) in enumerate(qdets[time_source])]
+				position += len(qdets[time_source])
+			result[delay] = (table_entries, qdets)
+		return result
+
+	def getDeterminatorFields(self, event):
+		"""
+		Returns the values of the event fields, on which the query determinators
+		can depend (name, type, status, host, attributes and the difference
+		between arrival and creation time), or None, if they aren't hashable.
+		
+		@param event: Event instance
+		"""
+		try:
+			fields = (event.getName(), event.getType(), event.getStatus(), event.getHost(),
+			          frozenset(event.getAttributes().items()),
+			          event.getArrivalTime()-event.getCreationTime())
+			hash(fields)
+		except TypeError:
+			return None
+		return fields
+
+	def getProfileContent(self):
+		"""
+		Returns the profiles of all rules (sorted by the time spent in the
+		rule) for display in a UI.
+		"""
+		if not self.config.rule_profiling:
+			return [{
+			  'title': "Rule profiles",
+			  'type': "text",
+			  'content': "Rule profiling is disabled (see the rule_profiling option)."
+			}]
+		rules = [rule for group in self.rulegroups.values() for rule in group.rules.values()
+		         if rule.profile != None]
+		rules.sort(key=lambda rule: rule.profile.getTotalTime(), reverse=True)
+		return [{
+		  'title': "Rule profiles",
+		  'type': "table",
+		  'headers': RuleProfile.SUMMARY_HEADERS,
+		  'content': [[rule.getLink()]+rule.profile.getSummary() for rule in rules]
+		}]
+
+	def getVerificationContent(self):
+		"""
+		Returns the results of the query table verification for display in a UI.
+		"""
+		return [{
+		    'title': "Query table verification",
+		    'type': 'list',
+		    'content': [
+		      "Mode: %s" % (self.verification if self.verification != 'sampled'
+		                    else "sampled (1 in %d events)" % self.config.querytable_verification_interval),
+		      "Verified cache and delay times: %d" % self.verified_results,
+		      "Discrepancies: %d" % self.discrepancy_count
+		    ]
+		  },{
+		    'title': "Last discrepancies",
+		    'type': 'table',
+		    'headers': ["Event", "Name", "Delay?", "Brute force result", "Table result", "Rule"],
+		    'content': [[
+		      [{'action': "show_event", 'args': {'event': entry['event']}, 'text': entry['event']}],
+		      entry['name'],
+		      entry['delay'],
+		      entry['bruteforce'],
+		      entry['table'],
+		      entry['rule'].getLink() if entry['rule'] != None else "n/a"
+		    ] for entry in reversed(self.discrepancies)]
+		  }]
+
+	def shouldVerify(self):
+		"""
+		Decides, whether the result of the query table should be verified for
+		the next event (see querytable_verification).
+		"""
+		if self.verification == 'full':
+			return True
+		elif self.verification == 'sampled':
+			if self.verification_countdown > 0:
+				self.verification_countdown -= 1
+				return False
+			self.verification_countdown = self.config.querytable_verification_interval-1
+			return True
+		return False
+
+	def verifyCacheOrDelayTime(self, event, delay, max_time, rule):
+		"""
+		Compares the cache or delay time found with the query table with the
+		brute force solution (evaluating all query determinators), and records
+		a discrepancy.
+		
+		@param event: Event instance
+		@param delay: True for the delay time, False for the cache time
+		@param max_time: result of the query table
+		@param rule: rule responsible for the result
+		"""
+		self.verified_results += 1
+		bfsolution = max(event.getCreationTime(), event.getArrivalTime())
+		for qdet in self.query_determinators:
+			eventtime = event.getTimestamp(qdet['time_source'])
+			if qdet['delay'] == delay:
+				if qdet['max_age'] + eventtime > bfsolution:
 					if qdet['determinator'](event=event, rulemanager=self) != False:
-						max_time = qdet['max_age'] + eventtime
-						rule = qdet['rule']
-			# brute force solution
-			if DEBUG:
-				bfsolution = max(event.getCreationTime(), event.getArrivalTime())
-				for qdet in self.query_determinators:
-					eventtime = event.getTimestamp(qdet['time_source'])
-					if qdet['delay'] == delay:
-						if qdet['max_age'] + eventtime > bfsolution:
-							if qdet['determinator'](event=event, rulemanager=self) != False:
-								bfsolution = qdet['max_age'] + eventtime
-				if bfsolution != max_time:
-					self.logger.logWarn(
-					  "RuleManager: updateCacheAndDelayTime: Discrepancy - brute force result: "\
-					 +"%d table result: %d (delay: %s, rule: %s)."\
-					 %(bfsolution, max_time, str(delay), rule))
-			# update event timestamp and rule
-			if delay:
-				event.setDelayTime(max_time, rule)
-			else:
-				event.setCacheTime(max_time, rule)
+						bfsolution = qdet['max_age'] + eventtime
+		if bfsolution != max_time:
+			self.logger.logWarn(
+			  "RuleManager: updateCacheAndDelayTime: Discrepancy - brute force result: "\
+			 +"%d table result: %d (delay: %s, rule: %s)."\
+			 %(bfsolution, max_time, str(delay), rule))
+			self.discrepancy_count += 1
+			self.discrepancies.append({
+			  'event': event.getID(),
+			  'name': event.getName(),
+			  'delay': delay,
+			  'bruteforce': bfsolution,
+			  'table': max_time,
+			  'rule': rule
+			})
+			del self.discrepancies[:-self.MAX_DISCREPANCIES]
 
 	def getEventClasses(self, event):
 		name = event.getName()
@@ -256,35 +602,53 @@ class RuleManager:
 		  [(event_name, dict([(event_type, []) for event_type in EVENT_TYPES_ANY]))
 		    for event_name in self.names.trigger_names])
 		for group in sorted(self.rulegroups.values()):
-			for rule in sorted(group.rules.values()):
-				ruletuple = (group.order, rule.order, rule)
-				types = EVENT_TYPES[:]
-				# when_any
-				if 'any' in rule.events.when_any: # rule always triggers (any event/any type)
-					ruletable.when_any['any'].append(ruletuple)
-					continue
-				for eventtype in EVENT_TYPES:
-					if eventtype in rule.events.when_any:
-						ruletable.when_any[eventtype].append(ruletuple)
-						types.remove(eventtype)
-				# when_class
-				for class_ in rule.events.when_class:
-					if 'any' in rule.events.when_class[class_]: # specific class / any type
-						ruletable.when_class[class_].append(ruletuple)
-						continue
-					for eventtype in types:
-						if eventtype in rule.events.when_class[class_]: # specific class and type
-							ruletable.when_class[class_][eventtype].append(ruletuple)
-				# when_event
-				for event in rule.events.when_event:
-					if 'any' in rule.events.when_event[event]: # specific name / any type
-						ruletable.when_event[event].append(ruletuple)
-						continue
-					for eventtype in types:
-						if eventtype in rule.events.when_event[event]: # specific name and type
-							ruletable.when_event[event][eventtype].append(ruletuple)
+			if not group.name in self.grouptables:
+				self.grouptables[group.name] = GroupTables(group, self.getRuleEntries(group))
+			for (table, key, eventtype, ruletuple) in self.grouptables[group.name].rule_entries:
+				if table == 'when_any':
+					ruletable.when_any[eventtype].append(ruletuple)
+				else:
+					getattr(ruletable, table)[key][eventtype].append(ruletuple)
 		return ruletable
 
+	def getRuleEntries(self, group):
+		"""
+		Returns the rule table entries of a single group (see buildRuletable),
+		as a list with (table, key, event type, rule tuple), where table is
+		'when_any' (key is None), 'when_class' or 'when_event'.
+		
+		@param group: RuleGroup
+		"""
+		entries = []
+		for rule in sorted(group.rules.values()):
+			ruletuple = (group.order, rule.order, rule)
+			types = EVENT_TYPES[:]
+			# when_any
+			if 'any' in rule.events.when_any: # rule always triggers (any event/any type)
+				entries.append(('when_any', None, 'any', ruletuple))
+				continue
+			for eventtype in EVENT_TYPES:
+				if eventtype in rule.events.when_any:
+					entries.append(('when_any', None, eventtype, ruletuple))
+					types.remove(eventtype)
+			# when_class
+			for class_ in rule.events.when_class:
+				if 'any' in rule.events.when_class[class_]: # specific class / any type
+					entries.append(('when_class', class_, 'any', ruletuple))
+					continue
+				for eventtype in types:
+					if eventtype in rule.events.when_class[class_]: # specific class and type
+						entries.append(('when_class', class_, eventtype, ruletuple))
+			# when_event
+			for event in rule.events.when_event:
+				if 'any' in rule.events.when_event[event]: # specific name / any type
+					entries.append(('when_event', event, 'any', ruletuple))
+					continue
+				for eventtype in types:
+					if eventtype in rule.events.when_event[event]: # specific name and type
+						entries.append(('when_event', event, eventtype, ruletuple))
+		return entries
+
 	def buildClasstable(self):
 		"""
 		Builds a reverse lookup table with classes for a given event name.
@@ -297,9 +661,16 @@ class RuleManager:
 				classtable[eventname].add(eventclass)
 		return classtable
 
-	def buildQuerytable(self): # Note: requires verification
+	def buildQuerytable(self, restored=None): # Note: requires verification
 		"""
 		Builds a lookup table to find relevant queries for a given event.
+		
+		The classifications of the query determinators (see classifyQuery)
+		are stored per group, and are reused for unchanged groups, as long as
+		the query table signature doesn't change.
+		
+		@param restored: classifications from a rule bundle (see
+		restoreClassifications)
 		"""
 		# query table: 1. key: delay, 2. key: time_source 3. key: criteria
 		qtable = {}
@@ -311,75 +682,47 @@ class RuleManager:
 				qtable[delay][time_source]['by_event'] = {}
 		# all names, which appear directly in a query, or via an event class:
 		eventnames = set.union(self.names.query_names, self.classtable.keys()).union(set([None]))
+		# classify the queries
+		signature = self.getQuerytableSignature()
+		self.classifications = dict() #: id(query determinator) -> classification
+		for group in self.rulegroups.values():
+			tables = self.grouptables[group.name]
+			if tables.signature != signature:
+				if restored != None:
+					classifications = [restored[id(qdet)] for qdet in group.query_determinators]
+				else:
+					classifications = [self.classifyQuery(qdet, eventnames) for qdet in group.query_determinators]
+				tables = GroupTables(group, tables.rule_entries, signature, classifications)
+				self.grouptables[group.name] = tables
+			for (qdet, classification) in zip(group.query_determinators, tables.classifications):
+				self.classifications[id(qdet)] = classification
 		# build the table
 		for qdet in self.query_determinators:
 			qname = qdet['name']
-			longname = "%s::%s" % (qdet['rule'], qname)
-			det = qdet['determinator']
 			max_age = qdet['max_age']
 			delay = qdet['delay']
 			time_source = qdet['time_source']
 			rule = qdet['rule']
-			if det(predetermined_fields={'default': UNDEFINED}) == False:
-				# independently of the event fields, this query *never*
-				# delays/caches an event
-				self.logger.logDebug("Query %s always false - ignoring." % longname)
-			elif det(predetermined_fields={'default': UNDEFINED}) == True:
-				# independently of the event fields, this query *always*
-				# delays or caches an event (such queries should be avoided,
-				# because they keep all events back; the advantage on the other
-				# hand is that we only have to store the largest cache and
-				# delay times)
-				if max_age > qtable[delay][time_source]['any']['max_age']:
-					qtable[delay][time_source]['any']['max_age'] = max_age
-					qtable[delay][time_source]['any']['rule'] = rule
-					qtable[delay][time_source]['any']['name'] = qname
-					self.logger.logDebug("Query %s always true - extending global max." % longname)
-				else:
-					self.logger.logDebug("Query %s always true, but max_age < global max." % longname)
-			elif det(predetermined_fields={'default': DEFINED}) == UNDEFINED:
-				# query is undefined even with all event info available -> we
-				# have to delay / cache all events due to this query
+			(kind, values) = self.classifications[id(qdet)]
+			if kind == 'any':
 				if max_age > qtable[delay][time_source]['any']['max_age']:
 					qtable[delay][time_source]['any']['max_age'] = max_age
 					qtable[delay][time_source]['any']['rule'] = rule
 					qtable[delay][time_source]['any']['name'] = qname
-					self.logger.logDebug("Query %s always undefined - extending global max." % longname)
-				else:
-					self.logger.logDebug("Query %s always undefined, but max_age < global max." % longname)
-			else:
-				assert(det(predetermined_fields={'default': DEFINED}) == DEFINED)
-				# we can decide according to event info
-				predet = {'default': UNDEFINED, 'event_name': False, 'event_class': False}
-				if det(predetermined_fields=predet) == False:
-					# this query is relevant only for some given (matching)
-					# event names. this is good and should ideally be the case
-					# for many queries
-					self.logger.logDebug("Query %s applies to specific names/classes only." % longname)
-					predet = {
-					  'in_context': UNDEFINED,
-					  'event_host': UNDEFINED,
-					  'event_attribute': UNDEFINED,
-					  'event_status': UNDEFINED,
-					  'event_type': UNDEFINED
-					}
-					for name in eventnames:
-						val = det(event=MetaEvent(name=name), predetermined_fields=predet, rulemanager=self)
-						assert(val == True or val == False or val == UNDEFINED)
-						if val != False:
-							self.logger.logDebug("Query %s applies to %s." % (longname, name))
-							if not qtable[delay][time_source]['by_event'].has_key(name):
-								qtable[delay][time_source]['by_event'][name] = \
-								  {'max_age': 0, 'rule': None, 'name': "n/a", 'qdets': []}
-							if val == True: # store value
-								if max_age > qtable[delay][time_source]['by_event'][name]['max_age']:
-									qtable[delay][time_source]['by_event'][name]['max_age'] = max_age
-									qtable[delay][time_source]['by_event'][name]['rule'] = rule
-									qtable[delay][time_source]['by_event'][name]['name'] = qname
-							elif val == UNDEFINED: # store query
-								qtable[delay][time_source]['by_event'][name]['qdets'].append(qdet)
-				else: # decidable according to event info, but name is irrelevant
-					qtable[delay][time_source]['any']['qdets'].append(qdet)
+			elif kind == 'by_event':
+				for (name, val) in values.iteritems():
+					if not qtable[delay][time_source]['by_event'].has_key(name):
+						qtable[delay][time_source]['by_event'][name] = \
+						  {'max_age': 0, 'rule': None, 'name': "n/a", 'qdets': []}
+					if val == True: # store value
+						if max_age > qtable[delay][time_source]['by_event'][name]['max_age']:
+							qtable[delay][time_source]['by_event'][name]['max_age'] = max_age
+							qtable[delay][time_source]['by_event'][name]['rule'] = rule
+							qtable[delay][time_source]['by_event'][name]['name'] = qname
+					elif val == UNDEFINED: # store query
+						qtable[delay][time_source]['by_event'][name]['qdets'].append(qdet)
+			elif kind == 'any_qdet':
+				qtable[delay][time_source]['any']['qdets'].append(qdet)
 		# delete all queries that have become irrelevant, because the default
 		# max_age is larger, and sort the queries by max_age (largest last)
 		for delay in [True, False]:
@@ -397,6 +740,72 @@ class RuleManager:
 						qtable[delay][time_source]['by_event'].remove(item[0])
 		return qtable
 
+	def getQuerytableSignature(self):
+		"""
+		Returns the data, on which the classification of the query
+		determinators depends (besides the determinators themselves): the
+		names, which appear in queries or classes, and the class table.
+		"""
+		eventnames = set.union(self.names.query_names, self.classtable.keys()).union(set([None]))
+		return (frozenset(eventnames), self.classtable)
+
+	def classifyQuery(self, qdet, eventnames):
+		"""
+		Evaluates the determinator of a query, to decide, for which events the
+		query is relevant (see buildQuerytable).
+
+		@param qdet: query determinator entry
+		@param eventnames: all names, which appear in a query or in a class
+		@return: tuple (kind, values), where kind is 'never', 'any' (the query
+		applies to all events), 'any_qdet' (the determinator must be evaluated
+		for all events) or 'by_event' (values is a dict with the event names,
+		for which the query is relevant, and True or UNDEFINED)
+		"""
+		longname = "%s::%s" % (qdet['rule'], qdet['name'])
+		det = qdet['determinator']
+		if det(predetermined_fields={'default': UNDEFINED}) == False:
+			# independently of the event fields, this query *never*
+			# delays/caches an event
+			self.logger.logDebug("Query %s always false - ignoring." % longname)
+			return ('never', None)
+		elif det(predetermined_fields={'default': UNDEFINED}) == True:
+			# independently of the event fields, this query *always*
+			# delays or caches an event (such queries should be avoided,
+			# because they keep all events back; the advantage on the other
+			# hand is that we only have to store the largest cache and
+			# delay times)
+			self.logger.logDebug("Query %s always true." % longname)
+			return ('any', None)
+		elif det(predetermined_fields={'default': DEFINED}) == UNDEFINED:
+			# query is undefined even with all event info available -> we
+			# have to delay / cache all events due to this query
+			self.logger.logDebug("Query %s always undefined." % longname)
+			return ('any', None)
+		assert(det(predetermined_fields={'default': DEFINED}) == DEFINED)
+		# we can decide according to event info
+		predet = {'default': UNDEFINED, 'event_name': False, 'event_class': False}
+		if det(predetermined_fields=predet) != False:
+			# decidable according to event info, but name is irrelevant
+			return ('any_qdet', None)
+		# this query is relevant only for some given (matching) event names.
+		# this is good and should ideally be the case for many queries
+		self.logger.logDebug("Query %s applies to specific names/classes only." % longname)
+		predet = {
+		  'in_context': UNDEFINED,
+		  'event_host': UNDEFINED,
+		  'event_attribute': UNDEFINED,
+		  'event_status': UNDEFINED,
+		  'event_type': UNDEFINED
+		}
+		values = {}
+		for name in eventnames:
+			val = det(event=MetaEvent(name=name), predetermined_fields=predet, rulemanager=self)
+			assert(val == True or val == False or val == UNDEFINED)
+			if val != False:
+				self.logger.logDebug("Query %s applies to %s." % (longname, name))
+				values[name] = val
+		return ('by_event', values)
+
 	def hasGroup(self, group):
 		"""
 		Checks, whether a rulegroup with the given name exists in the rule
@@ -425,6 +834,35 @@ class RuleManager:
 	def getNamedQueryDeterminator(self, group, name):
 		return self.named_queries[group][name][1]
 
+class RuleReloader(Thread):
+	"""
+	Parses the rules and builds the tables in a new rule manager, while the
+	current rules are still used for correlation. The rule manager swaps in
+	the new rules, when the reloader has finished (see
+	RuleManager.finishReload).
+	"""
+
+	def __init__(self, rulemanager):
+		"""
+		@param rulemanager: the running rule manager
+		"""
+		Thread.__init__(self)
+		self.setDaemon(True)
+		self.config = rulemanager.config
+		self.logger = rulemanager.logger
+		self.current = rulemanager #: running rule manager (unchanged groups are reused)
+		self.rules = None #: RuleManager with the new rules (None, if the rules could not be loaded)
+
+	def run(self):
+		start = time.time()
+		try:
+			self.rules = RuleManager(self.config, self.logger, self.current)
+		except (RuleParserException, IOError, etree.XMLSyntaxError) as e:
+			self.logger.logErr(str(e))
+			self.logger.logErr("Keeping current correlation rules.")
+			return
+		self.logger.logNotice("RuleReloader: rules loaded in %.2f seconds." % (time.time()-start))
+
 class RuleGroup:
 	"""
 	Represents a single rule group.
@@ -437,6 +875,8 @@ class RuleGroup:
 		self.grouphash = grouphash
 		self.description = description
 		self.rules = {}
+		self.query_determinators = [] #: query determinators of the rules (reused, when the group is unchanged)
+		self.named_queries = {}       #: query name -> (query, determinator) for the named queries in the group
 
 	def getLink(self):
 		return [{
@@ -474,7 +914,14 @@ class RuleGroup:
 		      }]
 		    ] for rule in sorted(self.rules.values())]
 		  }
-		]
+		]+([{
+		    'title': "Rule profiles",
+		    'type': "table",
+		    'headers': RuleProfile.SUMMARY_HEADERS,
+		    'content': [[rule.getLink()]+rule.profile.getSummary()
+		                for rule in sorted([rule for rule in self.rules.values() if rule.profile != None],
+		                                   key=lambda rule: rule.profile.getTotalTime(), reverse=True)]
+		  }] if self.config.rule_profiling else [])
 
 	def addRule(self, rule):
 		"""
@@ -508,7 +955,7 @@ class Rule:
 	Represents a single rule.
 	"""
 	def __init__(self, group, name, order, description, events, condition,
-	             actions, alternative_actions, ruletext):
+	             actions, alternative_actions, ruletext, source=None, queries=None):
 		self.group = group
 		self.name = name
 		self.order = order
@@ -521,9 +968,12 @@ class Rule:
 		self.actions = actions
 		self.alternative_actions = alternative_actions
 		self.ruletext = ruletext
+		self.source = source # generated source code (if the rule was compiled)
+		self.queries = queries if queries != None else [] # list with (query name, query) for the event queries in the rule
 		self.exec_count = 0
 		self.exec_count_true = 0
 		self.exec_count_false = 0
+		self.profile = RuleProfile() if group.config.rule_profiling else None #: execution profile (see rule_profiling)
 
 	def __str__(self):
 		return self.group.name+"::"+self.name
@@ -559,7 +1009,12 @@ class Rule:
 		      "Execution count (total): %d" % self.exec_count,
 		      "Execution count (conditions true): %d" % self.exec_count_true,
 		      "Execution count (conditions false): %d" % self.exec_count_false
-		    ]
+		    ]+([[ "Event queries: %d " % len(self.queries),
+		          {
+		            'action': "explain_rule",
+		            'text': "(show query plans)",
+		            'args': {'group': self.group.name, 'rule': self.name}
+		          }]] if len(self.queries) > 0 else [])
 		  },{
 		    'title': "Triggers",
 		    'type': 'table',
@@ -576,7 +1031,31 @@ class Rule:
 		    'title': "Reconstructed content of '%s' element" % entry[0],
 		    'type': 'pre',
 		    'content': entry[1]
-		  } for entry in self.ruletext]
+		  } for entry in self.ruletext]+([{
+		    'title': "Generated source code",
+		    'type': 'pre',
+		    'content': self.source
+		  }] if self.source != None else [])+(
+		  self.profile.getContent() if self.profile != None else [])
+
+	def getQueryPlans(self, core):
+		"""
+		Returns the plans of the event queries in this rule for the current
+		cache content (see rulecomponents.plan_queries). Values taken from the
+		trigger are undefined. The plans are based on the counts of the cache
+		indexes only, so that the cache isn't modified (this is called from
+		the RPC thread).
+		
+		@param core: reference to core
+		@type  core: EventHandler
+		"""
+		kwargs = {'rule': self, 'trigger': MetaEvent(), 'core': core, 'rulemanager': core.rulemanager,
+		          'cache': core.cache, 'contexts': core.contextmanager, 'querycache': None}
+		return [{
+		    'title': "Query plan for '%s'" % name,
+		    'type': 'list',
+		    'content': query.explain(**kwargs)
+		  } for (name, query) in self.queries]
 
 	def execute(self, trigger, core, rulemanager, cache, contexts):
 		"""
@@ -592,22 +1071,122 @@ class Rule:
 		"""
 		self.exec_count += 1
 		kwargs = {'rule': self, 'trigger': trigger, 'core': core, 'rulemanager': rulemanager,
-		          'cache': cache, 'contexts': contexts, 'selected_events': [trigger]}
-		if self.condition(**kwargs):
+		          'cache': cache, 'contexts': contexts, 'querycache': core.querycache,
+		          'selected_events': [trigger]}
+		if self.profile == None:
+			condition = self.condition(**kwargs)
+		else:
+			start = time.time()
+			condition = self.condition(**kwargs)
+			self.profile.record('condition', time.time()-start)
+		if condition:
 			self.group.logger.logDebug("Rule condition true -> executing actions.")
 			self.exec_count_true += 1
-			for action in self.actions:
-				action(**kwargs)
+			actions = self.actions
 		else:
 			self.group.logger.logDebug("Rule condition false -> executing alternative actions.")
 			self.exec_count_false += 1
-			for action in self.alternative_actions:
+			actions = self.alternative_actions
+		if self.profile == None:
+			for action in actions:
+				action(**kwargs)
+		else:
+			start = time.time()
+			for action in actions:
 				action(**kwargs)
+			self.profile.record('actions', time.time()-start)
+
+class RuleProfile:
+	"""
+	Execution profile of a single rule (see rule_profiling): the cumulative
+	time and a latency histogram for the condition (including the queries in
+	the condition), the actions and the event queries, and the number of
+	events scanned and returned by the queries.
+	"""
+
+	COMPONENTS = ['condition', 'actions', 'queries'] #: profiled parts of the rule
+	BUCKETS = [0.00001, 0.0001, 0.001, 0.01, 0.1]   #: upper limits of the histogram buckets in seconds (plus one bucket for longer times)
+	SUMMARY_HEADERS = ["Rule", "Condition time [ms]", "Action time [ms]", "Query time [ms]",
+	                   "Events scanned", "Events returned"] #: headers for tables with the rows from getSummary
+
+	def __init__(self):
+		self.count = dict([(component, 0) for component in self.COMPONENTS])
+		self.time = dict([(component, 0.0) for component in self.COMPONENTS])
+		self.histogram = dict([(component, [0]*(len(self.BUCKETS)+1)) for component in self.COMPONENTS])
+		self.events_scanned = 0  #: candidate events, to which the filters of the queries were applied
+		self.events_returned = 0 #: events selected by the queries
+
+	def record(self, component, duration):
+		"""
+		Records the duration of one execution of the given component.
+		
+		@param component: one of COMPONENTS
+		@param duration: time in seconds
+		"""
+		self.count[component] += 1
+		self.time[component] += duration
+		self.histogram[component][bisect.bisect_left(self.BUCKETS, duration)] += 1
+
+	def recordQuery(self, duration, scanned, returned):
+		"""
+		Records the evaluation of an event query.
+		
+		@param duration: time in seconds
+		@param scanned: number of candidate events
+		@param returned: number of selected events
+		"""
+		self.record('queries', duration)
+		self.events_scanned += scanned
+		self.events_returned += returned
+
+	def getTotalTime(self):
+		"""
+		Returns the time spent in the rule (the queries are part of the
+		condition or the actions).
+		"""
+		return self.time['condition']+self.time['actions']
+
+	def getSummary(self):
+		"""
+		Returns a table row with the cumulative times (in milliseconds) and
+		the number of events scanned and returned by the queries.
+		"""
+		return ["%.3f" % (self.time[component]*1000) for component in self.COMPONENTS]\
+		      +[self.events_scanned, self.events_returned]
+
+	def getContent(self):
+		"""
+		Returns a content list for display in a UI.
+		"""
+		limits = ["%gms" % (limit*1000) for limit in self.BUCKETS]
+		return [{
+		    'title': "Execution profile",
+		    'type': 'table',
+		    'headers': ["Component", "Executions", "Total time [ms]", "Average time [ms]"]
+		              +["< %s" % limit for limit in limits]+[">= %s" % limits[-1]],
+		    'content': [[
+		      component,
+		      self.count[component],
+		      "%.3f" % (self.time[component]*1000),
+		      "%.3f" % (self.time[component]*1000/self.count[component]) if self.count[component] > 0 else "n/a"
+		    ]+self.histogram[component] for component in self.COMPONENTS]
+		  },{
+		    'title': "Events scanned by the queries",
+		    'type': 'list',
+		    'content': [
+		      "Events scanned: %d" % self.events_scanned,
+		      "Events returned: %d" % self.events_returned
+		    ]
+		  }]
 
 class RuleParser:
 	"""
 	Parses the XML rules.
 	"""
+
+	# possible values for the rule_backend configuration option
+	RULE_BACKENDS = ['closures', 'compiled']
+
 	def __init__(self, config, logger):
 		self.config = config
 		self.logger = logger
@@ -616,14 +1195,26 @@ class RuleParser:
 		                              load_dtd=True,
 		                              remove_comments=True,
 		                              remove_blank_text=True)
+		self.trusted_parser = etree.XMLParser(attribute_defaults=True, # for rules from a rule bundle
+		                                      load_dtd=True,
+		                                      remove_comments=True,
+		                                      remove_blank_text=True)
 		self.parse_errors = []
 		self.named_queries = {}
 		self.query_references = {}
 		self.query_determinators = []
+		self.reused_determinators = [] #: query determinators of unchanged groups
 		self.currentgroup = None
 		self.currentrule = None
 		self.currentquery = None
+		self.currentqueries = [] #: (name, query) for the event queries of the current rule
 		self.components = rulecomponents
+		if not config.rule_backend in self.RULE_BACKENDS:
+			self.logger.logErr("RuleParser: unknown rule backend '%s' - using closures." % config.rule_backend)
+		if config.rule_backend == 'compiled':
+			self.compiler = RuleCompiler(self)
+		else:
+			self.compiler = None
 
 	def resetState(self):
 		"""
@@ -633,8 +1224,10 @@ class RuleParser:
 		self.named_queries = {}
 		self.query_references = {}
 		self.query_determinators = []
+		self.reused_determinators = []
 		self.currentgroup = None
 		self.currentrule = None
+		self.currentqueries = []
 		self.components = rulecomponents
 
 	def detectQueryLoops(self, referenced_so_far, group, query):
@@ -657,43 +1250,41 @@ class RuleParser:
 			else:
 				self.detectQueryLoops(referenced_so_far+[query], group, reference)
 
-	def parseRules(self, current):
+	def parseRules(self, current, names=None):
 		"""
 		Parse the rules from the rule file - the lxml etree parser generates a
 		tree with iterable nodes.
 		
 		@param current: current rulegroups 
+		@param names: NameRecord with the names in the rules (from a rule
+		bundle) - if given, the rules were already validated, so the DTD
+		validation and the scans for the names are skipped
 		"""
-		config = self.config.rulesource.split(":")
-		source = config[0]
-		if len(config)>1:
-			options = dict([kv.split('=') for kv in config[1:] if kv.find('=')>=0])
-		else:
-			options = dict()
-		if source == 'file':
-			if not options.has_key('filename'):
-				raise RuleParserException("'file' rulesource needs option 'filename'.")
-			else:
-				rules = etree.parse(options['filename'], self.parser)
-		else:
-			raise RuleParserException("Unknown rule source '%s'." % source)
+		filename = self.getSourceFilename(self.config.rulesource, "rulesource")
+		if names == None:
+			rules = etree.parse(filename, self.parser)
+		else: # already validated
+			rules = etree.parse(filename, self.trusted_parser)
 		root = rules.getroot()
 		# check root tag
 		if root.tag != TAG_ROOT:
 			raise RuleParserException("Unexpected root tag '%s'." % root.tag)
 		# get event names end classes
-		names = NameRecord()
-		names.trigger_classes = set([str(i) for i in root.xpath("//when_class/text()")])
-		names.trigger_names = set([str(i) for i in root.xpath("//when_event/text()")])
-		names.query_classes = set([str(i) for i in root.xpath("//event_query//event_class/text()")])
-		names.query_names = set([str(i) for i in root.xpath("//event_query//event_name/text()")])
-		event_queries = root.xpath("//event_query")
-		# log for debugging
-		self.logger.logDebug("Got "+str(len(names.trigger_classes))+" trigger event classes.")
-		self.logger.logDebug("Got "+str(len(names.trigger_names))+" trigger event names.")
-		self.logger.logDebug("Got "+str(len(names.query_classes))+" query event classes.")
-		self.logger.logDebug("Got "+str(len(names.query_names))+" query event names.")
-		self.logger.logDebug("Got "+str(len(event_queries))+" event queries.")
+		if names == None:
+			names = NameRecord()
+			names.trigger_classes = set([str(i) for i in root.xpath("//when_class/text()")])
+			names.trigger_names = set([str(i) for i in root.xpath("//when_event/text()")])
+			names.query_classes = set([str(i) for i in root.xpath("//event_query//event_class/text()")])
+			names.query_names = set([str(i) for i in root.xpath("//event_query//event_name/text()")])
+			names.query_attributes = set([str(i) for i in root.xpath("//event_query//event_attribute/@name")])
+			event_queries = root.xpath("//event_query")
+			# log for debugging
+			self.logger.logDebug("Got "+str(len(names.trigger_classes))+" trigger event classes.")
+			self.logger.logDebug("Got "+str(len(names.trigger_names))+" trigger event names.")
+			self.logger.logDebug("Got "+str(len(names.query_classes))+" query event classes.")
+			self.logger.logDebug("Got "+str(len(names.query_names))+" query event names.")
+			self.logger.logDebug("Got "+str(len(names.query_attributes))+" query attribute names.")
+			self.logger.logDebug("Got "+str(len(event_queries))+" event queries.")
 		# parse the rule groups
 		groups = dict()
 		for group in root:
@@ -712,6 +1303,7 @@ class RuleParser:
 			group = qdet['rule'][0]
 			rule = qdet['rule'][1]
 			qdet['rule'] = groups[group].getRule(rule)
+		self.query_determinators.extend(self.reused_determinators)
 		# sanity check for referenced queries (existence + no loops)
 		for group in self.query_references:
 			self.currentgroup = group
@@ -731,19 +1323,7 @@ class RuleParser:
 		"""
 		if self.config.classlist == '':
 			return dict()
-		config = self.config.classlist.split(":")
-		source = config[0]
-		if len(config)>1:
-			options = dict([kv.split('=') for kv in config[1:] if kv.find('=')>=0])
-		else:
-			options = dict()
-		if source == 'file':
-			if not options.has_key('filename'):
-				raise RuleParserException("'file' classlist source needs option 'filename'.")
-			else:
-				classlist = etree.parse(options['filename'], self.parser)
-		else:
-			raise RuleParserException("Unknown classlist source '%s'." % source)
+		classlist = etree.parse(self.getSourceFilename(self.config.classlist, "classlist"), self.parser)
 		root = classlist.getroot()
 		# check root tag
 		if root.tag != CLASSLIST_ROOT:
@@ -755,6 +1335,29 @@ class RuleParser:
 				classes[eventclass.attrib['name']].add(eventname.text)
 		return classes
 
+	def getSourceFilename(self, spec, what):
+		"""
+		Returns the filename from the given source specification (only 'file'
+		sources are supported).
+		
+		@param spec: source specification, e.g. 'file:filename=rules.xml'
+		@param what: name of the configuration option (for error messages)
+		"""
+		config = spec.split(":")
+		source = config[0]
+		if len(config)>1:
+			options = dict([kv.split('=') for kv in config[1:] if kv.find('=')>=0])
+		else:
+			options = dict()
+		if source == 'file':
+			if not options.has_key('filename'):
+				raise RuleParserException("'file' %s needs option 'filename'." % what)
+			return options['filename']
+		elif what == "rulesource":
+			raise RuleParserException("Unknown rule source '%s'." % source)
+		else:
+			raise RuleParserException("Unknown %s source '%s'." % (what, source))
+
 	def parsingError(self, what):
 		"""
 		Adds an entry to the error list.
@@ -777,7 +1380,12 @@ class RuleParser:
 		newhash = hashlib.sha256(etree.tostring(group, pretty_print=True)).hexdigest()
 		if newhash in [g.grouphash for g in current.values()]:
 			self.logger.logDebug("Keeping unchanged rule group: ", group.attrib['name'])
-			return [g for g in current.values() if g.grouphash == newhash][0]
+			rulegroup = [g for g in current.values() if g.grouphash == newhash][0]
+			# the queries of the group are kept as well
+			self.reused_determinators.extend(rulegroup.query_determinators)
+			if len(rulegroup.named_queries) > 0:
+				self.named_queries[rulegroup.name] = rulegroup.named_queries
+			return rulegroup
 		# get group name, order and description
 		name = group.attrib['name']
 		if not group.attrib['order'].isdigit():
@@ -790,6 +1398,7 @@ class RuleParser:
 			description = ""
 		# create the rulegroup
 		rulegroup = RuleGroup(self.config, self.logger, name, order, newhash, description)
+		start = len(self.query_determinators)
 		# parse the rules
 		for rule in group:
 			# make sure the rule names are unique
@@ -799,6 +1408,8 @@ class RuleParser:
 			if rule.attrib['order'] in [str(r.order) for r in rulegroup.rules.values()]:
 				self.parsingError("Duplicate rule order: %s" % rule.attrib['order'])
 			rulegroup.addRule(self.parseRule(rulegroup, rule))
+		rulegroup.query_determinators = self.query_determinators[start:]
+		rulegroup.named_queries = self.named_queries.get(name, {})
 		return rulegroup
 
 	def parseRule(self, group, rule):
@@ -821,17 +1432,21 @@ class RuleParser:
 			description = ""
 		# parse the rule
 		self.currentrule = name
+		self.currentqueries = []
+		ruletext = [(child.tag, etree.tostring(child, pretty_print=True)) for child in rule]
+		if self.compiler != None:
+			(events, condition, actions, alternative_actions, source) = self.compiler.compileRule(rule)
+			return Rule(group, name, order, description, events, condition,
+			            actions, alternative_actions, ruletext, source, self.currentqueries)
 		rulecontent = {TAG_EVENTS: None, TAG_CONDITIONS:[], TAG_ACTIONS:[], TAG_ALTERNATIVE_ACTIONS:[]}
-		ruletext = []
 		for child in rule:
 			rulecontent[child.tag] = self.parseRuleElement(child)
-			ruletext.append((child.tag, etree.tostring(child, pretty_print=True)))
 		events = rulecontent[TAG_EVENTS]
 		condition = self.components.and_(rulecontent[TAG_CONDITIONS])
 		actions = rulecontent[TAG_ACTIONS]
 		alternative_actions = rulecontent[TAG_ALTERNATIVE_ACTIONS]
 		return Rule(group, name, order, description, events, condition,
-		            actions, alternative_actions, ruletext)
+		            actions, alternative_actions, ruletext, queries=self.currentqueries)
 
 	def parseTime(self, timestr):
 		"""
@@ -866,6 +1481,39 @@ class RuleParser:
 		else:
 			return int(string)
 
+	def queryFingerprint(self, element):
+		"""
+		Returns a fingerprint for the given event_query element, which is the
+		same for structurally identical queries in the current group (the query
+		name and the delay attribute don't influence the result of the query).
+		"""
+		def canonical(element):
+			""" Helper function. """
+			return (element.tag, sorted(element.attrib.items()), element.text,
+			        [canonical(child) for child in element], element.tail)
+		attributes = [(key, value) for (key, value) in sorted(element.attrib.items())
+		              if key != 'name' and key != 'delay']
+		return hashlib.sha1(repr((self.currentgroup, attributes, [canonical(child) for child in element])))\
+		         .hexdigest()
+
+	def isViewQuery(self, element):
+		"""
+		Checks, whether the results of the given event_query element can be
+		maintained as a materialized view (or whether the events selected by a
+		window_count element can be counted incrementally): the query must be
+		independent of the trigger (no trigger fields, is_trigger, contexts or
+		references to other queries) and only consist of conditions on single
+		events.
+		"""
+		def singleEventCondition(element):
+			""" Helper function. """
+			if element.tag == TAG_INTERSECTION or element.tag == TAG_UNION:
+				return all([singleEventCondition(child) for child in element])
+			return element.tag in [TAG_EVENT_NAME, TAG_EVENT_TYPE, TAG_EVENT_STATUS, TAG_EVENT_HOST,
+			                       TAG_EVENT_ATTRIBUTE, TAG_EVENT_CLASS, TAG_EVENT_MIN_AGE]
+		return len(element.xpath(".//"+TAG_TRIGGER)) == 0\
+		       and all([singleEventCondition(child) for child in element])
+
 	def parseMixedContent(self, element):
 		"""
 		Returns a function, which will generate the correct string when text is
@@ -877,7 +1525,8 @@ class RuleParser:
 			if child.tail == None:
 				children.append(childfunc)
 			else:
-				children.append(lambda **kwargs: childfunc(**kwargs)+child.tail)
+				# bind childfunc and tail now (not when the function is called)
+				children.append((lambda func, tail: lambda **kwargs: func(**kwargs)+tail)(childfunc, child.tail))
 		return self.components.mixed_content(element.text, children)
 
 	def parseRuleElement(self, element):
@@ -1004,6 +1653,25 @@ class RuleParser:
 			                              element.attrib['timeref'],
 			                              element.attrib['match'],
 			                              queries)
+		elif element.tag == TAG_WINDOW_COUNT:
+			field = element.attrib['field']
+			if not ((field in EVENT_FIELDS) or field.startswith("attributes.")):
+				self.parsingError("Unknown event field: %s" % field)
+				return None
+			if not self.isViewQuery(element):
+				self.parsingError("Error in element %s: only trigger independent conditions on single events are allowed."\
+				                  % element.tag)
+				return None
+			timeframe = self.parseTime(element.attrib['timeframe'])
+			threshold = self.parseInt(element.attrib['threshold'])
+			buckets = self.parseInt(element.attrib['buckets'])
+			if buckets == 0:
+				self.parsingError("Error in element %s: Attribute 'buckets' must be at least 1." % element.tag)
+				return None
+			query_operations = [self.parseRuleElement(child) for child in element]
+			return self.components.window_count(self.currentgroup, field, timeframe, buckets, threshold,
+			                                    element.attrib['op'], element.attrib['timeref'],
+			                                    self.queryFingerprint(element), query_operations)
 		elif element.tag == TAG_CONDITION_PLUGIN:
 			parameters = {}
 			queries = []
@@ -1182,9 +1850,14 @@ class RuleParser:
 				})
 			# build the actual query
 			query_operations = [self.parseRuleElement(child) for child in element]
-			query = self.components.event_query(query_operations, max_age, time_source)
+			# descriptions for the query plan (see rulecomponents.explain_query)
+			descriptions = [" ".join(etree.tostring(child, with_tail=False).split()) for child in element]
+			query = self.components.event_query(query_operations, max_age, time_source,
+			                                    self.queryFingerprint(element), self.isViewQuery(element),
+			                                    descriptions)
 			if name != None:
 				self.named_queries[self.currentgroup][name] = (query, qdet)
+			self.currentqueries.append((name if name != None else "[unnamed query]", query))
 			# return
 			return query
 		elif element.tag == TAG_INTERSECTION:
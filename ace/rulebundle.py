@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Rule bundle module - stores the results of analysing the rulebase (names,
+event classes and query classifications), so that these steps can be skipped
+for unchanged rules. The rules themselves are still parsed and built from the
+rule source at every start.
+"""
+
+import os
+import hashlib
+import zlib
+import cPickle as pickle
+
+class RuleBundle:
+	"""
+	Writes and reads the rule bundle (see 'ace --compile-rules').
+
+	The functions built from the rules can't be pickled, so the rules are
+	still parsed and built from the XML source, and loading them takes most
+	of the startup time either way. The bundle only stores the results of
+	the analysis steps around the parsing: the names referenced in the
+	rules (otherwise found with xpath scans over the whole document), the
+	event classes and the classification of each query determinator for the
+	query table (otherwise computed by evaluating every determinator for
+	every event name). Since the bundle is only used for a
+	source, which was validated when the bundle was written, the rules are
+	parsed without DTD validation.
+
+	The bundle contains a checksum of the rule source, the class list and the
+	rules DTD, and is ignored, if one of them was changed, or if it was
+	written by a different version.
+	"""
+
+	MAGIC = "ACERULES1" #: file header (includes the format version)
+
+	def __init__(self, config, logger):
+		self.config = config
+		self.logger = logger
+		self.filename = config.rule_bundle
+
+	def sourceChecksum(self, parser):
+		"""
+		Returns a checksum of the files, from which the rules are parsed.
+
+		@param parser: RuleParser (to find the source files)
+		"""
+		checksum = hashlib.sha256(self.MAGIC)
+		filenames = [parser.getSourceFilename(self.config.rulesource, "rulesource")]
+		if self.config.classlist != '':
+			filenames.append(parser.getSourceFilename(self.config.classlist, "classlist"))
+		filenames.append(self.config.rules_dtd)
+		for filename in filenames:
+			checksum.update(filename)
+			if os.path.exists(filename):
+				sourcefile = open(filename, 'rb')
+				checksum.update(sourcefile.read())
+				sourcefile.close()
+		return checksum.hexdigest()
+
+	def write(self, rulemanager):
+		"""
+		Writes the bundle for the rules of the given rule manager.
+
+		@param rulemanager: RuleManager, which has parsed the rules from the source
+		"""
+		bundle = {
+		  'checksum': self.sourceChecksum(rulemanager.ruleparser),
+		  'names': dict(rulemanager.names.__dict__),
+		  'eventclasses': rulemanager.eventclasses,
+		  'classifications': rulemanager.getClassifications()
+		}
+		data = zlib.compress(pickle.dumps(bundle, 2))
+		data = self.MAGIC+hashlib.sha256(data).hexdigest()+data
+		tmpname = self.filename+".tmp"
+		bundlefile = open(tmpname, 'wb')
+		bundlefile.write(data)
+		bundlefile.close()
+		os.rename(tmpname, self.filename)
+		self.logger.logInfo("RuleBundle: wrote %d bytes to %s." % (len(data), self.filename))
+
+	def load(self, parser):
+		"""
+		Returns the content of the bundle (a dict), or None, if there is no
+		usable bundle for the current rule source.
+
+		@param parser: RuleParser (to find the source files)
+		"""
+		if not os.path.exists(self.filename):
+			self.logger.logInfo("RuleBundle: no rule bundle found - parsing the rules.")
+			return None
+		try:
+			bundlefile = open(self.filename, 'rb')
+			data = bundlefile.read()
+			bundlefile.close()
+			if not data.startswith(self.MAGIC):
+				raise ValueError("not a rule bundle (or unsupported version)")
+			data = data[len(self.MAGIC):]
+			if hashlib.sha256(data[64:]).hexdigest() != data[:64]:
+				raise ValueError("checksum mismatch")
+			bundle = pickle.loads(zlib.decompress(data[64:]))
+		except (IOError, ValueError, zlib.error, pickle.UnpicklingError) as e:
+			self.logger.logErr("RuleBundle: could not read rule bundle: %s" % e)
+			return None
+		if bundle['checksum'] != self.sourceChecksum(parser):
+			self.logger.logInfo("RuleBundle: rule source changed - parsing the rules.")
+			return None
+		self.logger.logInfo("RuleBundle: using rule bundle %s." % self.filename)
+		return bundle
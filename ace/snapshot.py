@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Snapshot module - saves and restores the state of the correlation engine
+(event cache, contexts and ticker), so that the CE can resume correlation
+after a restart.
+"""
+
+import os
+import threading
+import zlib
+import cPickle as pickle
+from cStringIO import StringIO
+
+from ace.rulebase import Rule
+
+class Snapshot:
+	"""
+	Creates snapshots of the core state and restores them.
+
+	The state is pickled in the core thread (at the end of a tick, so it is
+	consistent), while compressing and writing the file is done in a
+	background thread. The file is replaced atomically, so there is always a
+	complete snapshot on disk.
+
+	Rules can't be pickled; references to rules (from events and contexts)
+	are stored as (group, name) and resolved with the current rules upon
+	restore. References to rules, which no longer exist, are restored as
+	None (like the references of events and contexts, which weren't set by a
+	rule).
+	"""
+
+	MAGIC = "ACESNAP1" #: file header (includes the format version)
+
+	def __init__(self, config, logger):
+		self.config = config
+		self.logger = logger
+		self.filename = config.snapshot_file
+		self.writer = None       #: background thread writing the last snapshot
+		self.next_snapshot = None #: tick, when the next snapshot is due
+		self.snapshots = 0       #: number of snapshots written
+		self.skipped = 0         #: number of snapshots skipped, because the previous one was still being written
+		self.last_tick = None    #: tick of the last snapshot
+		self.last_size = 0       #: size of the last snapshot (bytes, compressed)
+		self.unresolved = 0      #: number of rule references, which couldn't be resolved upon restore
+
+	def getContent(self):
+		"""
+		Returns the snapshot information for display in a UI.
+		"""
+		return [
+		  "Snapshot file: %s (interval: %d ticks)" % (self.filename, self.config.snapshot_interval),
+		  "Snapshots written/skipped: %d/%d" % (self.snapshots, self.skipped),
+		  "Last snapshot: tick %s, %d bytes" % (self.last_tick, self.last_size),
+		]
+
+	def checkpoint(self, core):
+		"""
+		Saves a snapshot, if one is due. Called by the core at the end of each
+		tick.
+
+		@param core: the EventHandler
+		"""
+		tick = core.ticker.getTick()
+		if self.next_snapshot == None:
+			self.next_snapshot = tick+self.config.snapshot_interval
+		elif tick >= self.next_snapshot:
+			self.next_snapshot = tick+self.config.snapshot_interval
+			self.save(core)
+
+	def save(self, core, background=True):
+		"""
+		Saves a snapshot of the core state.
+
+		@param core: the EventHandler
+		@param background: whether to write the file in a background thread
+		"""
+		if self.writer != None and self.writer.is_alive():
+			if background:
+				self.logger.logWarn("Snapshot: previous snapshot is still being written - skipping.")
+				self.skipped += 1
+				return
+			self.writer.join()
+		data = self.dumps(core)
+		self.last_tick = core.ticker.getTick()
+		if background:
+			self.writer = threading.Thread(target=self.write, args=(data,))
+			self.writer.start()
+		else:
+			self.write(data)
+
+	def dumps(self, core):
+		"""
+		Returns the pickled state of the core.
+		"""
+		state = {
+		  'tick': core.ticker.getTick(),
+		  'core': core.getState(),
+		  'cache': core.cache.getState(),
+		  'contexts': core.contextmanager.getState()
+		}
+		buf = StringIO()
+		pickler = pickle.Pickler(buf, 2)
+		pickler.persistent_id = self.persistentID
+		pickler.dump(state)
+		return buf.getvalue()
+
+	def write(self, data):
+		"""
+		Compresses the pickled state and writes it to the snapshot file.
+		"""
+		data = self.MAGIC+zlib.compress(data)
+		tmpname = self.filename+".tmp"
+		try:
+			snapshotfile = open(tmpname, 'wb')
+			snapshotfile.write(data)
+			snapshotfile.close()
+			os.rename(tmpname, self.filename)
+		except (IOError, OSError) as e:
+			self.logger.logErr("Snapshot: could not write snapshot: %s" % e)
+			return
+		self.snapshots += 1
+		self.last_size = len(data)
+		self.logger.logInfo("Snapshot: wrote %d bytes to %s." % (len(data), self.filename))
+
+	def restore(self, core):
+		"""
+		Restores the core state from the snapshot file, if it exists. Returns
+		True, if a snapshot was restored.
+
+		@param core: the EventHandler (with the rules already loaded)
+		"""
+		if not os.path.exists(self.filename):
+			self.logger.logInfo("Snapshot: no snapshot to restore.")
+			return False
+		try:
+			snapshotfile = open(self.filename, 'rb')
+			data = snapshotfile.read()
+			snapshotfile.close()
+			if not data.startswith(self.MAGIC):
+				raise ValueError("not a snapshot file (or unsupported version)")
+			unpickler = pickle.Unpickler(StringIO(zlib.decompress(data[len(self.MAGIC):])))
+			rulegroups = core.rulemanager.rulegroups
+			self.unresolved = 0
+			unpickler.persistent_load = lambda pid: self.persistentLoad(rulegroups, pid)
+			state = unpickler.load()
+		except (IOError, ValueError, zlib.error, pickle.UnpicklingError) as e:
+			self.logger.logErr("Snapshot: could not restore snapshot: %s" % e)
+			return False
+		core.ticker.setTick(state['tick'])
+		core.setState(state['core'])
+		core.cache.setState(state['cache'])
+		core.contextmanager.setState(state['contexts'])
+		core.contextmanager.cleanupContexts(rulegroups.keys())
+		self.last_tick = state['tick']
+		if self.unresolved > 0:
+			self.logger.logWarn("Snapshot: %d references to rules, which no longer exist." % self.unresolved)
+		self.logger.logNotice("Snapshot: restored state of tick %d (%d events in cache, %d contexts)."\
+		                      % (state['tick'], core.cache.getSize(), core.contextmanager.getNumberOfContexts()))
+		return True
+
+	def persistentID(self, obj):
+		"""
+		Replaces rule references by (group, name) while pickling.
+		"""
+		if isinstance(obj, Rule):
+			return (obj.group.name, obj.name)
+		return None
+
+	def persistentLoad(self, rulegroups, pid):
+		"""
+		Resolves rule references while unpickling (None, if the rule no longer
+		exists).
+		"""
+		(group, name) = pid
+		if group in rulegroups and name in rulegroups[group].rules:
+			return rulegroups[group].rules[name]
+		self.unresolved += 1
+		return None
@@ -22,6 +22,14 @@ class TestCache:
 		self.events = events
 	def getEvents(self):
 		return self.events
+	def getAllEvents(self):
+		return self.events
+	def getEventsByField(self, field, value):
+		return set([e for e in self.events if getattr(e, field) == value])
+	def getEventsByAttribute(self, name, op, value):
+		return None
+	def pageInCopies(self, events):
+		pass
 
 class TestRuleManager(rulebase.RuleManager):
 	def __init__(self, classes={}, queries=None):
@@ -184,6 +192,10 @@ class TestRuleComponents(unittest.TestCase):
 		self.assert_(seq_ab_all_arrival(query_events=cache.getEvents())==False)
 		self.assert_(seq_bc_any_arrival(query_events=cache.getEvents())==True)
 		self.assert_(seq_bc_all_arrival(query_events=cache.getEvents())==True)
+		# a query without events can't be part of a sequence
+		hostd = rulecomponents.event_host(lambda **kwargs: "D")
+		self.assert_(rulecomponents.sequence("creation", "all", [hosta, hostd])(query_events=cache.getEvents())==False)
+		self.assert_(rulecomponents.sequence("creation", "any", [hostd, hosta])(query_events=cache.getEvents())==False)
 
 	def test_pattern(self):
 		alphabet = lambda **kwargs: kwargs['string']
@@ -8,7 +8,8 @@
 
 import unittest
 import types
-from ace import event, contexts, cache, rulebase
+import re
+from ace import event, contexts, cache, rulebase, ticker
 from ace.util.exceptions import *
 from ace.util import configuration, logging
 from ace.basisfunctions import rulecomponents
@@ -64,6 +65,570 @@ class TestCache(unittest.TestCase):
 		self.assert_(events[1] not in self.eh.events) # was already forwarded
 		# self.assert_(events2[0] not in self.eh.events) # not in cache
 
+	def testIndexes(self):
+		events = self.evgen.randomEvents(20)
+		for e in events[:5]:
+			e.name = "FOO"
+		self.cache.addEvents(events)
+		self.assert_(self.cache.getEventsByField('name', "FOO") == set(events[:5]))
+		self.assert_(len(self.cache.getEventsByField('name', "BAR")) == 0)
+		self.cache.dropEvents(events[:2])
+		self.assert_(self.cache.getEventsByField('name', "FOO") == set(events[2:5]))
+		self.cache.setEventStatus(events[2], 'active')
+		self.cache.setEventStatus(events[3], 'inactive')
+		self.assert_(events[2] in self.cache.getEventsByField('status', 'active'))
+		self.assert_(events[2] not in self.cache.getEventsByField('status', 'inactive'))
+		self.assert_(events[3] in self.cache.getEventsByField('status', 'inactive'))
+		self.assert_(events[3] not in self.cache.getEventsByField('status', 'active'))
+
+	def testTimers(self):
+		events = self.evgen.randomEvents(20)
+		self.cache.addEvents(events)
+		self.assert_(len(self.cache.delay_list) == 20)
+		self.assert_(len(self.cache.cache_list) == 20)
+		self.cache.dropEvents(events[:5])
+		self.assert_(len(self.cache.delay_list) == 15)
+		self.assert_(len(self.cache.cache_list) == 15)
+		self.cache.insertDelayTimestamp(0, events[10])
+		self.assert_(len(self.cache.delay_list) == 15)
+		self.assert_(self.cache.delay_list.peek() == (0, events[10]))
+		self.cache.insertDelayTimestamp(0, events[0]) # no longer in cache
+		self.assert_(events[0] not in self.cache.delay_list)
+
+	def testEventByID(self):
+		events = self.evgen.randomEvents(20)
+		self.cache.addEvents(events)
+		self.assert_(self.cache.getEventByID(events[3].getID()) == events[3])
+		self.cache.dropEvents([events[3]])
+		self.assert_(self.cache.getEventByID(events[3].getID()) == None)
+		ids = [e.getID() for e in events[2:5]]
+		self.assert_(self.cache.getEventsByIDs(ids) == [events[2], None, events[4]])
+
+	def testIndexedQuery(self):
+		events = self.evgen.randomEvents(20)
+		for e in events[:5]:
+			e.name = "FOO"
+		for e in events[3:10]:
+			e.host = "BAR"
+		self.cache.addEvents(events)
+		query = rulecomponents.event_query([rulecomponents.event_name("FOO"),
+		                                    rulecomponents.event_host(lambda **kwargs: "BAR")],
+		                                   None, "creation")
+		self.assert_(sorted(query(cache=self.cache)) == sorted(events[3:5]))
+
+	def testIndexedQueryOrder(self):
+		events = self.evgen.randomEvents(4)
+		for (i, e) in enumerate(events):
+			e.name = "X" if i < 2 else "Y"
+			e.host = "A" if i%2 == 0 else "B"
+			e.creation = 100+i
+		self.cache.addEvents(events)
+		host = lambda: rulecomponents.event_host(lambda **kwargs: "B")
+		names = lambda: rulecomponents.intersection([rulecomponents.event_name("X")])
+		# the host lookup must not be applied before first_of/last_of
+		query = rulecomponents.event_query([rulecomponents.first_of("creation", names()), host()], None, "creation")
+		self.assert_(query(cache=self.cache) == [])
+		query = rulecomponents.event_query([rulecomponents.last_of("creation", names()), host()], None, "creation")
+		self.assert_(query(cache=self.cache) == [events[1]])
+		query = rulecomponents.event_query([host(), rulecomponents.first_of("creation", names())], None, "creation")
+		self.assert_(query(cache=self.cache) == [events[1]])
+
+	def testCounters(self):
+		events = self.evgen.randomEvents(20)
+		events[1].forwarded = True
+		self.cache.addEvents(events)
+		self.assert_(self.cache.getNumberOfDelayedEvents() == 19)
+		self.assert_(self.cache.getNumberOfCachedEvents() == 1)
+		self.assert_(self.cache.hasDelayedEvents())
+		list(self.cache.forwardEvents(events[:10]))
+		self.assert_(self.cache.getNumberOfDelayedEvents() == 10)
+		self.assert_(self.cache.getNumberOfCachedEvents() == 10)
+		self.cache.dropEvents(events[15:])
+		self.assert_(self.cache.getNumberOfDelayedEvents() == 5)
+		for e in events[10:15]:
+			self.cache.setEventLocal(e, True)
+		self.assert_(not self.cache.hasDelayedEvents())
+		self.cache.setEventLocal(events[12], False)
+		self.assert_(self.cache.hasDelayedEvents())
+		self.cache.clearCache()
+		self.assert_(self.cache.getNumberOfDelayedEvents() == 0)
+		self.assert_(not self.cache.hasDelayedEvents())
+
+	def testEviction(self):
+		self.config.cache_max_size = 10
+		self.config.cache_low_watermark = 5
+		self.config.cache_eviction_policy = 'earliest'
+		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		events = self.evgen.randomEvents(12)
+		for (i, e) in enumerate(events):
+			e.setDelayTime(0)
+			e.setCacheTime(100-i)
+		events[11].local = True
+		self.cache.addEvents(events)
+		forwarded = list(self.cache.evictEvents())
+		self.assert_(self.cache.getSize() == 5)
+		self.assert_(set(forwarded) == set(events[5:11]))
+		self.assert_(self.cache.dropped_events == 1)
+		self.assert_(self.cache.evictions == {'n/a': 7})
+		self.assert_(self.cache.getNumberOfDelayedEvents() == 5)
+
+	def testClassEviction(self):
+		self.config.cache_max_size = 10
+		self.config.cache_low_watermark = 8
+		self.config.cache_eviction_policy = 'class'
+		self.config.cache_eviction_classes = "unimportant, minor"
+		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		self.cache.setClasstable({'A': set(['minor']), 'B': set(['unimportant', 'major'])})
+		events = self.evgen.randomEvents(12)
+		events[0].name = 'A'
+		events[5].name = 'B'
+		events[6].name = 'C'
+		self.cache.addEvents(events)
+		forwarded = list(self.cache.evictEvents())
+		self.assert_(forwarded[:2] == [events[5], events[0]])
+		self.assert_(len(forwarded) == 4)
+
+	def testRefuseLocal(self):
+		self.config.cache_max_size = 10
+		self.config.cache_eviction_policy = 'refuse_local'
+		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		events = self.evgen.randomEvents(12)
+		events[10].local = True
+		self.cache.addEvents(events)
+		self.assert_(self.cache.getSize() == 11)
+		self.assert_(events[10] not in self.cache.getEvents())
+		self.assert_(self.cache.dropped_events == 1)
+		self.assert_(self.cache.evicted_events == 1)
+
+	def testOverflow(self):
+		self.config.cache_overflow_file = ":memory:"
+		self.config.cache_resident_max = 5
+		self.config.cache_overflow_min_time = 100
+		self.config.cache_overflow_idle_time = 0
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		tick = self.ticker.getTick()
+		events = self.evgen.randomEvents(10)
+		for (i, e) in enumerate(events):
+			e.arrival = tick
+			e.setDelayTime(tick)
+			e.setCacheTime(tick+1000+i)
+			e.host = "HOST%d" % (i%2)
+		self.cache.addEvents(events)
+		list(self.cache.forwardEvents(events[1:]))
+		self.cache.offloadEvents()
+		self.assert_(self.cache.getSize() == 5)
+		self.assert_(len(self.cache.overflow) == 5)
+		self.assert_(events[0] in self.cache.getEvents()) # not forwarded
+		self.assert_(events[9] not in self.cache.getEvents())
+		# lookups by id (from the RPC thread) return a copy without paging in
+		self.assert_(self.cache.getEventByID(events[9].getID()).getID() == events[9].getID())
+		self.assert_(len(self.cache.overflow) == 5)
+		self.assert_(not events[9].getID() in self.cache.ids)
+		# index lookups return copies of the stored events without paging in
+		hosts = self.cache.getEventsByField('host', "HOST0")
+		self.assert_(sorted([e.getID() for e in hosts]) == sorted([e.getID() for e in events[0::2]]))
+		self.assert_(len(self.cache.overflow) == 5)
+		self.assert_(len(self.cache.getAllEvents()) == 10)
+		self.assert_(len(self.cache.getEventsSince("arrival", tick)) == 10)
+		self.assert_(len(self.cache.overflow) == 5)
+		# the query plan only uses the index counts
+		host = rulecomponents.event_host(lambda **kwargs: "HOST1")
+		plan = rulecomponents.event_query([host], None, "arrival").explain(cache=self.cache)
+		self.assert_(plan[1] == "Index lookup: index_lookup_generated -> 5 candidates")
+		# only the events selected for actions are paged in
+		def selected(**kwargs):
+			return [e for e in kwargs['query_events'] if e.getID() == events[9].getID()]
+		selected.cost = rulecomponents.COST_LOOKUP
+		query = rulecomponents.event_query([host, selected], None, "arrival")
+		self.assert_(len(query(cache=self.cache)) == 1)
+		self.assert_(len(self.cache.overflow) == 5)
+		rulecomponents.select_events(query, [])(cache=self.cache)
+		self.assert_(events[9].getID() in self.cache.ids)
+		self.assert_(len(self.cache.overflow) == 4)
+		self.assert_(len(self.cache.overflow_rules) == 4)
+		self.assert_(len(self.cache.getAllEvents()) == 10)
+		# the copies are released, when the cache is updated
+		list(self.cache.updateCache())
+		self.assert_(len(self.cache.overflow.copies) == 0)
+
+	def testOverflowIndexes(self):
+		self.config.cache_overflow_file = ":memory:"
+		self.config.cache_resident_max = 2
+		self.config.cache_overflow_min_time = 100
+		self.config.cache_overflow_idle_time = 0
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		self.cache.setIndexedAttributes(set(["x"]))
+		tick = self.ticker.getTick()
+		events = self.evgen.randomEvents(6)
+		for (i, e) in enumerate(events):
+			e.name = "A"
+			e.arrival = tick-10+i
+			e.setDelayTime(tick)
+			e.setCacheTime(tick+1000+i)
+			e.attributes = {'x': str(i)}
+		self.cache.addEvents(events)
+		list(self.cache.forwardEvents(events))
+		view = self.cache.getView("q", lambda e: e.name == "A", 20, "arrival")
+		self.assert_(self.cache.getViewTimestamps("q", None, 20, "arrival", "arrival") == range(tick-10, tick-4))
+		self.cache.offloadEvents()
+		self.assert_(len(self.cache.overflow) == 4 and len(view.stored) == 4)
+		# the attribute index and the views include the stored events, which are not paged in
+		self.assert_(len(self.cache.getEventsByAttribute("x", "eq", "5")) == 1)
+		self.assert_(len(self.cache.getEventsByAttribute("x", "ge", "2")) == 4)
+		self.assert_(self.cache.countEventsByAttribute("x", "le", "3") == 4)
+		self.assert_(len(self.cache.getViewEvents("q", None, None, "arrival")) == 6)
+		self.assert_(len(self.cache.overflow) == 4)
+		# paged in events are moved back into the view
+		self.cache.pageInCopies(self.cache.getEventsByAttribute("x", "eq", "5"))
+		self.assert_(len(self.cache.overflow) == 3 and len(view.stored) == 3 and len(view.events) == 3)
+		self.assert_(len(self.cache.getEventsByAttribute("x", "ge", "2")) == 4)
+		# expired events are removed from the view (max_age) and the store (cache time)
+		self.ticker.tick = tick+13
+		self.assert_(self.cache.getViewTimestamps("q", None, 20, "arrival", "arrival") == range(tick-7, tick-4))
+		self.assert_(len(view.stored) == 2 and len(view.events) == 1)
+		self.ticker.tick = tick+1010
+		list(self.cache.updateCache())
+		self.assert_(len(self.cache.overflow) == 0)
+		self.assert_(self.cache.countEventsByAttribute("x", "ge", "0") == 0)
+
+	def testCompress(self):
+		events = self.evgen.randomEvents(6)
+		for e in events:
+			e.type = 'raw'
+			e.host = "HOST"
+		events[5].name = "OTHER"
+		events[2].host = "HOST2"
+		events[3].attributes = {'a': "1"}
+		events[4].attributes = {'a': "2"}
+		self.cache.addEvents(events)
+		new = list(self.cache.compressEvents(events[:3]))
+		self.assert_(len(new) == 1)
+		compressed = new[0]
+		self.assert_(compressed.getCount() == 3)
+		self.assert_(compressed.getHost() == self.config.hostname)
+		self.cache.addEvent(compressed)
+		self.assert_(self.cache.getSize() == 4)
+		# fold further events into the existing compressed event
+		updated = list(self.cache.compressEvents([compressed, events[3], events[4], events[5]]))
+		self.assert_(updated == [compressed])
+		self.assert_(compressed.getCount() == 5)
+		self.assert_(compressed.getAttribute('a') == "[multiple values]")
+		self.assert_(self.cache.getSize() == 2)
+		self.assert_(self.cache.compressed_events == 5)
+		self.assert_(self.cache.new_compressed == 1)
+		self.assert_(compressed in self.cache.getEventsByField('host', self.config.hostname))
+
+	def testTimeIndex(self):
+		events = self.evgen.randomEvents(20)
+		for (i, e) in enumerate(events):
+			e.arrival = 1000+(i*7)%20
+			e.creation = 1000
+		self.cache.addEvents(events)
+		since = self.cache.getEventsSince('arrival', 1010)
+		self.assert_(len(since) == 10)
+		self.assert_(self.cache.countEventsSince('arrival', 1010) == 10)
+		self.assert_([e.arrival for e in since] == range(1010, 1020))
+		self.cache.dropEvents(since[:5])
+		self.assert_(self.cache.countEventsSince('arrival', 1010) == 5)
+		self.assert_(self.cache.countEventsSince('creation', 1000) == 15)
+		# range scan in event queries
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1019
+		self.eh.ticker = self.ticker
+		for e in events[:10]:
+			self.cache.setEventStatus(e, 'active')
+		query = rulecomponents.event_query([], 4, "arrival")
+		self.assert_(sorted(query(cache=self.cache, core=self.eh)) == sorted(since[5:]))
+		query = rulecomponents.event_query([rulecomponents.event_status("active")], 4, "arrival")
+		self.assert_(sorted(query(cache=self.cache, core=self.eh))
+		             == sorted([e for e in since[5:] if e.status == 'active']))
+		# first_of/last_of select from all events, max_age is applied to the result
+		first = rulecomponents.event_query([rulecomponents.first_of("arrival",
+		                                    rulecomponents.intersection([]))], 9, "arrival")
+		self.assert_(first(cache=self.cache, core=self.eh) == [])
+		last = rulecomponents.event_query([rulecomponents.last_of("arrival",
+		                                   rulecomponents.intersection([]))], 9, "arrival")
+		self.assert_(last(cache=self.cache, core=self.eh) == [since[-1]])
+		first = rulecomponents.event_query([rulecomponents.first_of("arrival",
+		                                    rulecomponents.event_status("active"))], 10, "arrival")
+		self.assert_(first(cache=self.cache, core=self.eh) == [])
+
+	def testLazyQuery(self):
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1200
+		self.eh.ticker = self.ticker
+		events = self.evgen.randomEvents(200)
+		for (i, e) in enumerate(events):
+			e.arrival = 1000+i
+			e.setAttribute("level", i%5)
+		self.cache.addEvents(events)
+		seen = []
+		def low(**kwargs):
+			seen.extend(kwargs['query_events'])
+			return [e for e in kwargs['query_events'] if e.getAttribute("level") in ["0", "1"]]
+		low.cost = rulecomponents.COST_LOOKUP
+		query = rulecomponents.event_query([low], 150, "arrival")
+		selected = query(cache=self.cache, core=self.eh)
+		self.assert_(len(selected) == 60 and len(seen) == 150)
+		for (op, threshold) in [("ge", 3), ("ge", 61), ("le", 60), ("le", 2), ("eq", 60), ("eq", 3)]:
+			del seen[:]
+			result = rulecomponents.count(threshold, op, query)(cache=self.cache, core=self.eh)
+			self.assert_(result == {'ge': 60 >= threshold, 'le': 60 <= threshold, 'eq': 60 == threshold}[op])
+			if threshold < 5:
+				self.assert_(len(seen) == rulecomponents.LAZY_CHUNK_SIZE)
+		# first_of and last_of only filter the ordered events as far as needed
+		del seen[:]
+		first = rulecomponents.event_query([rulecomponents.first_of("arrival", low)], None, "arrival")
+		self.assert_(first(cache=self.cache, core=self.eh) == [events[0]])
+		last = rulecomponents.event_query([rulecomponents.last_of("arrival", low)], 150, "arrival")
+		self.assert_(last(cache=self.cache, core=self.eh) == [max(selected, key=lambda e: e.arrival)])
+		self.assert_(len(seen) == 2*rulecomponents.LAZY_CHUNK_SIZE)
+
+	def testLazyMatchQuery(self):
+		events = self.evgen.randomEvents(40)
+		for (i, e) in enumerate(events):
+			e.name = "A" if i%3 == 0 else "B"
+			e.type = "raw" if i < 36 else "compressed"
+		self.cache.addEvents(events)
+		named = rulecomponents.event_query([rulecomponents.event_name("A")], None, "arrival")
+		class RuleManager:
+			def getNamedQuery(self, group, name):
+				return named
+		query = rulecomponents.event_query([rulecomponents.event_type("raw"), rulecomponents.match_query("g", "A")],
+		                                   None, "arrival")
+		kwargs = {'cache': self.cache, 'rulemanager': RuleManager()}
+		self.assert_(hasattr(query, 'lazy') and len(query(**kwargs)) == 12)
+		# match_query selects from all events, not only from the chunk
+		self.assert_(rulecomponents.count(12, "eq", query)(**kwargs) == True)
+		self.assert_(rulecomponents.count(13, "ge", query)(**kwargs) == False)
+
+	def testAttributeIndex(self):
+		self.cache.setIndexedAttributes(set(["count"]))
+		events = self.evgen.randomEvents(10)
+		for (i, e) in enumerate(events):
+			e.setAttribute("count", i)
+		events[9].setAttribute("count", "many")
+		self.cache.addEvents(events)
+		self.assert_(self.cache.getEventsByAttribute("count", "eq", 3) == set([events[3]]))
+		self.assert_(self.cache.getEventsByAttribute("count", "ge", 7) == set(events[7:9]))
+		self.assert_(self.cache.getEventsByAttribute("count", "le", 2) == set(events[:3]))
+		self.assert_(self.cache.getEventsByAttribute("count", "ge", "many") == frozenset())
+		self.assert_(self.cache.getEventsByAttribute("other", "eq", 3) == None)
+		self.cache.setEventAttribute(events[0], "count", 5, "inc")
+		self.assert_(self.cache.getEventsByAttribute("count", "eq", 5) == set([events[0], events[5]]))
+		self.assert_(self.cache.getEventsByAttribute("count", "le", 2) == set(events[1:3]))
+		self.cache.dropEvents(events[5:])
+		self.assert_(self.cache.getEventsByAttribute("count", "ge", 4) == set([events[0], events[4]]))
+		# index lookup in event queries
+		query = rulecomponents.event_query([rulecomponents.event_attribute("count", lambda **kwargs: 2, "ge")],
+		                                   None, "arrival")
+		self.assert_(sorted(query(cache=self.cache)) == sorted([events[0]]+events[2:5]))
+
+	def testViews(self):
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		self.cache.ticker = self.ticker
+		self.eh.ticker = self.ticker
+		events = self.evgen.randomEvents(20)
+		for (i, e) in enumerate(events):
+			e.name = "A" if i%2 == 0 else "B"
+			e.status = "active"
+			e.arrival = 990+i
+			e.setAttribute("level", i%5)
+			e.setDelayTime(2000)
+		self.cache.addEvents(events[:10])
+		operations = lambda: [rulecomponents.event_name("A"),
+		                      rulecomponents.event_attribute("level", lambda **kwargs: "2", "ge")]
+		view = rulecomponents.event_query(operations(), 15, "arrival", "view", True)
+		query = rulecomponents.event_query(operations(), 15, "arrival")
+		check = lambda: sorted(view(cache=self.cache, core=self.eh)) == sorted(query(cache=self.cache, core=self.eh))
+		self.assert_(check())
+		self.assert_(len(self.cache.views) == 1)
+		self.cache.addEvents(events[10:])
+		self.assert_(check())
+		self.cache.setEventAttribute(events[12], "level", 0)
+		self.cache.setEventStatus(events[14], "inactive")
+		self.assert_(check())
+		self.cache.dropEvents(events[16:18])
+		self.assert_(check())
+		for tick in range(1000, 1030):
+			self.ticker.tick = tick
+			self.assert_(check())
+		self.assert_(view(cache=self.cache, core=self.eh) == [])
+		self.assert_(self.cache.views["view"].reads == 35)
+
+	def testViewTimestamps(self):
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		self.cache.ticker = self.ticker
+		self.eh.ticker = self.ticker
+		events = self.evgen.randomEvents(20)
+		for (i, e) in enumerate(events):
+			e.name = "A" if i%2 == 0 else "B"
+			e.status = "active"
+			e.arrival = 990+i
+			e.setDelayTime(2000)
+		self.cache.addEvents(events)
+		queries = lambda fingerprint: [rulecomponents.event_query([rulecomponents.event_name(name)], 15, "arrival",
+		                                                          fingerprint and fingerprint+name, fingerprint != None)
+		                               for name in "AB"]
+		viewqueries = queries("view")
+		timestamps = lambda: viewqueries[0].timestamps("arrival", cache=self.cache, core=self.eh)
+		self.assert_(timestamps() == [990+i for i in range(0, 20, 2)])
+		self.cache.dropEvents(events[4:5])
+		self.cache.setEventStatus(events[6], "inactive")
+		self.assert_(timestamps() == [990+i for i in range(0, 20, 2) if i != 4])
+		conditions = [[rulecomponents.within(timeframe, "arrival", match, qs) for qs in [queries(None), viewqueries]]
+		              for (timeframe, match) in [(0, "any"), (1, "any"), (1, "all"), (25, "all")]]
+		conditions += [[rulecomponents.sequence("arrival", match, qs) for qs in [queries(None), viewqueries]]
+		               for match in ["any", "all"]]
+		conditions += [[rulecomponents.sequence("arrival", "any", list(reversed(qs)))
+		                for qs in [queries(None), viewqueries]]]
+		for tick in range(1000, 1030, 3):
+			self.ticker.tick = tick
+			for variants in conditions:
+				results = [w(cache=self.cache, core=self.eh) for w in variants]
+				self.assert_(results[0] == results[1])
+		self.assert_(timestamps() == [])
+
+	def testPatternMatcher(self):
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		self.cache.ticker = self.ticker
+		self.eh.ticker = self.ticker
+		events = self.evgen.randomEvents(40)
+		for (i, e) in enumerate(events):
+			e.name = "ABCAD"[i%5]
+			e.status = "active"
+			e.arrival = 990+i-3*(i%4) # partly out of order
+			e.setDelayTime(2000)
+		self.cache.addEvents(events[:10])
+		query = lambda name, max_age: rulecomponents.event_query([rulecomponents.event_name(name)], max_age,
+		                                                         "arrival", "%s%s" % (name, max_age), True)
+		# events A leave the window of the letter a and get the letter x
+		symbols = [rulecomponents.symbol(letter, query(name, max_age))
+		           for (letter, name, max_age) in [('a', "A", 12), ('b', "B", 8), ('c', "C", None), ('x', "A", None)]]
+		alphabet = rulecomponents.alphabet("arrival", symbols)
+		regexp = re.compile(r"a[bc]*a|xb")
+		condition = rulecomponents.pattern(alphabet, regexp)
+		for tick in range(1000, 1040, 2):
+			self.ticker.tick = tick
+			if tick < 1030:
+				self.cache.addEvents(events[10+(tick-1000)//2:10+(tick-1000)//2+1])
+			if tick == 1010:
+				self.cache.dropEvents(events[3:8])
+			self.assert_(condition(cache=self.cache, core=self.eh)
+			             == bool(regexp.search(alphabet(cache=self.cache, core=self.eh))))
+			matcher = self.cache.pattern_matchers.values()[0]
+			self.assert_(matcher.getString(tick) == alphabet(cache=self.cache, core=self.eh))
+		self.assert_(len(self.cache.pattern_matchers) == 1)
+		self.assert_(matcher.reads == 20 and matcher.rebuilds < matcher.reads)
+		# without views, the queries are evaluated
+		self.config.cache_views = False
+		self.assert_(condition(cache=self.cache, core=self.eh)
+		             == bool(regexp.search(alphabet(cache=self.cache, core=self.eh))))
+		self.assert_(matcher.reads == 20)
+
+	def testWindowCount(self):
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		self.cache.ticker = self.ticker
+		events = self.evgen.randomEvents(6)
+		for (i, e) in enumerate(events):
+			e.name = "B" if i == 3 else "A"
+			e.host = "Y" if i == 5 else "X"
+			e.arrival = 1000 if i < 2 else 1003
+			e.setDelayTime(2000)
+		# 10 seconds in 5 buckets of 2 seconds
+		condition = rulecomponents.window_count("group", "host", 10, 5, 3, "ge", "arrival", "count",
+		                                        [rulecomponents.event_name("A")])
+		result = lambda trigger: condition(trigger=trigger, cache=self.cache)
+		self.cache.addEvents(events[:2])
+		self.assert_(result(events[0]) == False)
+		counter = self.cache.window_counters[("group", "count")]
+		self.assert_(counter.additions == 2)
+		self.ticker.tick = 1003
+		self.cache.addEvents(events[2:])
+		self.assert_(result(events[0]) == True)
+		self.assert_(result(events[5]) == False)
+		self.assert_(counter.count("Y", 1003) == 1)
+		self.ticker.tick = 1009
+		self.assert_(result(events[0]) == True)
+		# the bucket with the first two events is too old
+		self.ticker.tick = 1010
+		self.assert_(result(events[0]) == False)
+		self.assert_(counter.count("X", 1010) == 2)
+		self.assert_(counter.count("X", 1012) == 0)
+		self.assert_(len(counter) == 0)
+		# events, which are already too old, aren't counted
+		self.cache.dropEvents(events)
+		for e in events:
+			e.arrival = 995
+		self.cache.addEvents(events)
+		self.assert_(counter.count("X", 1012) == 0)
+		# the memory for a value is bounded by the number of buckets
+		for arrival in range(1012, 1040):
+			self.ticker.tick = arrival
+			e = self.evgen.randomEvent()
+			(e.name, e.host, e.arrival) = ("A", "X", arrival)
+			e.setDelayTime(2000)
+			self.cache.addEvent(e)
+			self.assert_(len(counter.counts["X"]) <= 5)
+		self.assert_(counter.count("X", 1039) == 10)
+		self.cache.clearWindowCounters(["other"])
+		self.assert_(self.cache.window_counters == {})
+
+	def testWindowCountCompress(self):
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		self.cache.ticker = self.ticker
+		events = self.evgen.randomEvents(5)
+		for e in events:
+			(e.name, e.type, e.host, e.arrival) = ("A", "raw", "X", 1000)
+			e.setDelayTime(2000)
+		self.cache.addEvents(events)
+		condition = rulecomponents.window_count("group", "host", 10, 5, 5, "eq", "arrival", "count", [])
+		self.assert_(condition(trigger=events[0], cache=self.cache) == True)
+		class RuleManager:
+			def updateCacheAndDelayTime(self, event):
+				event.setDelayTime(2000)
+		rulecomponents.compress(cache=self.cache, rulemanager=RuleManager(), selected_events=events)
+		self.assert_(len(self.cache.getEvents()) == 1)
+		# the compressed event replaces counted events, and is not counted again
+		self.assert_(condition(trigger=events[0], cache=self.cache) == True)
+
+	def testQueryPlan(self):
+		events = self.evgen.randomEvents(20)
+		for (i, e) in enumerate(events):
+			e.name = "FOO" if i < 3 else "BAR"
+			e.host = "HOST" if i < 15 else "OTHER"
+			e.arrival = 1000+i
+			e.setAttribute("x", str(i))
+		self.cache.addEvents(events)
+		regexp = rulecomponents.event_attribute("x", None, "re", "[0-9]+")
+		host = rulecomponents.event_host(lambda **kwargs: "HOST")
+		name = rulecomponents.event_name("FOO")
+		first = rulecomponents.first_of("arrival", rulecomponents.intersection([]))
+		kwargs = {'cache': self.cache, 'query_events': events}
+		plan = rulecomponents.plan_queries([regexp, host, name], kwargs)
+		self.assert_(plan == [name, host, regexp])
+		plan = rulecomponents.plan_queries([regexp, host, first, host, name], kwargs)
+		self.assert_(plan == [host, regexp, first, name, host])
+		query = rulecomponents.event_query([regexp, host, first, name], None, "arrival")
+		self.assert_(len(query(cache=self.cache)) == 1)
+		self.assert_(query.explain(cache=self.cache)[1:] == [
+		  "Index lookup: index_lookup_generated -> 15 candidates",
+		  "1. event_attribute_regexp (cost 3, estimate None)",
+		  "2. first_of_generated (order dependent)",
+		  "3. index_lookup_generated (cost 1, estimate 3)"])
+		# shared operations are described per query
+		one = rulecomponents.event_query([rulecomponents.is_trigger], None, "arrival", descriptions=["<one/>"])
+		two = rulecomponents.event_query([rulecomponents.is_trigger], None, "arrival", descriptions=["<two/>"])
+		self.assert_(one.explain(cache=self.cache)[1] == "1. <one/> (cost 0, estimate 1)")
+		self.assert_(two.explain(cache=self.cache)[1] == "1. <two/> (cost 0, estimate 1)")
+
 if __name__ == '__main__':
 	unittest.main()
 
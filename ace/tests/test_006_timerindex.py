@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+import unittest
+import random
+from ace.util.timerindex import TimerIndex
+
+class TestTimerIndex(unittest.TestCase):
+	"""
+	Unittest for the TimerIndex.
+	"""
+	
+	def setUp(self):
+		self.index = TimerIndex()
+
+	def testOrder(self):
+		deadlines = [random.randint(0, 100) for i in range(200)]
+		for i in range(200):
+			self.index.set(i, deadlines[i])
+		self.assert_(len(self.index) == 200)
+		self.assert_(self.index.peek()[0] == min(deadlines))
+		popped = [self.index.pop()[0] for i in range(200)]
+		self.assert_(popped == sorted(deadlines))
+		self.assert_(self.index.peek() == None)
+
+	def testUpdateAndRemove(self):
+		for i in range(100):
+			self.index.set(i, i)
+		self.index.set(50, -1)  # move to front
+		self.index.set(0, 1000) # move to back
+		self.assert_(self.index.peek() == (-1, 50))
+		self.assert_(self.index.getDeadline(0) == 1000)
+		self.assert_(self.index.remove(50))
+		self.assertFalse(self.index.remove(50))
+		self.assert_(50 not in self.index)
+		self.assert_(len(self.index) == 99)
+		popped = [self.index.pop()[1] for i in range(99)]
+		self.assert_(popped == range(1, 50)+range(51, 100)+[0])
+
+	def testTies(self):
+		# keys with equal deadlines are never compared and come out in insertion order
+		keys = [object() for i in range(10)]
+		for key in keys:
+			self.index.set(key, 5)
+		self.assert_([self.index.pop()[1] for i in range(10)] == keys)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+import unittest
+import os
+import Queue
+import tempfile
+from ace import core, ticker, event, rulebase
+from ace.util import configuration, logging
+
+class TestSnapshot(unittest.TestCase):
+	"""
+	Unittest for snapshots of the engine state.
+	"""
+
+	def setUp(self):
+		(fd, self.filename) = tempfile.mkstemp()
+		os.close(fd)
+		os.remove(self.filename)
+		self.config = configuration.Config()
+		self.config.loglevel = 0
+		self.config.verbosity = 0
+		self.config.realtime = False
+		self.config.snapshot_file = self.filename
+		self.logger = logging.Logger(self.config)
+		self.evgen = event.EventGenerator()
+
+	def createCore(self):
+		return core.EventHandler(self.config, self.logger, ticker.Ticker(self.config, self.logger),
+		                         Queue.Queue(), [Queue.Queue()])
+
+	def testSaveAndRestore(self):
+		ce = self.createCore()
+		ce.ticker.tick = 1234
+		events = self.evgen.randomEvents(10)
+		for e in events:
+			e.setDelayTime(1300)
+		ce.cache.addEvents(events)
+		list(ce.cache.forwardEvents(events[:3]))
+		ce.contextmanager.createContext("group", "ctx", None, ('input', {'name': "TIMEOUT"}),
+		                                {'timeout': 100})
+		ce.contextmanager.getContext("group", "ctx").associateWithEvents(events[5:7])
+		ce.snapshot.save(ce, background=False)
+		self.assert_(ce.snapshot.snapshots == 1)
+		# restore in a new core
+		restored = self.createCore()
+		self.assert_(restored.snapshot.restore(restored))
+		self.assert_(restored.ticker.getTick() == 1234)
+		self.assert_(restored.cache.getSize() == 10)
+		self.assert_(restored.cache.getNumberOfDelayedEvents() == 7)
+		self.assert_(restored.cache.hasDelayedEvents())
+		self.assert_(restored.cache.delay_list.peek()[0] == 1300)
+		for e in events:
+			self.assert_(restored.cache.getEventByID(e.getID()).getName() == e.getName())
+		# the context isn't restored, because its rule group doesn't exist
+		self.assert_(restored.contextmanager.getNumberOfContexts() == 0)
+		self.assertFalse(restored.contextmanager.mayGenerateTimeoutEvents())
+		# contexts of existing groups are restored, even if their rule no longer exists
+		restored = self.createCore()
+		restored.rulemanager.rulegroups["group"] = rulebase.RuleGroup(self.config, self.logger, "group", 1, "")
+		self.assert_(restored.snapshot.restore(restored))
+		context = restored.contextmanager.getContext("group", "ctx")
+		self.assert_(context.rule == None)
+		self.assert_(len(context.getContent()) > 0)
+
+	def tearDown(self):
+		if os.path.exists(self.filename):
+			os.remove(self.filename)
+
+if __name__ == '__main__':
+	unittest.main()
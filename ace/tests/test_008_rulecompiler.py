@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+import unittest
+import os
+import sys
+import random
+import Queue
+from ace import core, ticker, event
+from ace.util import configuration, logging
+
+class TestRuleCompiler(unittest.TestCase):
+	"""
+	Unittest for the compiled rule backend (compares it with the closures).
+	"""
+
+	def setUp(self):
+		self.basedir = os.path.dirname(os.path.abspath(sys.modules[__name__].__file__))+"/"
+		self.config = configuration.Config()
+		self.config.loglevel = 0
+		self.config.verbosity = 0
+		self.config.realtime = False
+		self.config.rulesource = "file:filename="+self.basedir+"rules/compiled.xml"
+
+	def correlate(self, backend):
+		"""
+		Runs a fixed set of random events through a core with the given rule
+		backend and returns the core and the output events.
+		"""
+		self.config.rule_backend = backend
+		logger = logging.Logger(self.config)
+		inputqueue = Queue.Queue()
+		outputqueue = Queue.Queue()
+		ce = core.EventHandler(self.config, logger, ticker.Ticker(self.config, logger),
+		                       inputqueue, [outputqueue])
+		rand = random.Random(1)
+		for i in range(300):
+			inputqueue.put(event.Event(name=rand.choice(['A', 'B', 'C', 'D', 'E']),
+			                           host='host%d' % rand.randint(0, 2),
+			                           creation=1000+i/3, arrival=1000+i/3,
+			                           attributes={'level': str(rand.randint(0, 9))}))
+		ce.ticker.tick = 1000
+		while inputqueue.qsize() > 0 or ce.contextmanager.mayGenerateTimeoutEvents()\
+		      or ce.cache.hasDelayedEvents() or len(ce.generated_input_events) > 0:
+			ce.work()
+		for e in ce.cache.forwardAll():
+			ce.generateOutputEvent(e)
+		events = []
+		while not outputqueue.empty():
+			e = outputqueue.get()
+			events.append((e.name, e.type, e.host, e.description, e.creation,
+			               tuple(sorted(e.getAttributes().items()))))
+		return (ce, sorted(events))
+
+	def testSameResults(self):
+		(closures, expected) = self.correlate('closures')
+		(compiled, events) = self.correlate('compiled')
+		self.assert_(events == expected)
+		self.assert_(len([e for e in events if e[0] == "MATCH"]) > 0)
+		self.assert_(len([e for e in events if e[0] == "TIMEOUT"]) > 0)
+		self.assert_(len([e for e in events if e[0] == "D"]) == 0)
+		for group in compiled.rulemanager.rulegroups.values():
+			for rule in group.rules.values():
+				other = closures.rulemanager.getRule(group.name, rule.name)
+				self.assert_(rule.exec_count_true == other.exec_count_true)
+				self.assert_(rule.source != None)
+				self.assert_(other.source == None)
+
+if __name__ == '__main__':
+	unittest.main()
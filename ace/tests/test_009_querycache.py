@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+import unittest
+from ace import event, cache, contexts, ticker, querycache
+from ace.util import configuration, logging
+from ace.basisfunctions import rulecomponents
+
+class TestQueryCache(unittest.TestCase):
+	"""
+	Unittest for memoized query results.
+	"""
+
+	def setUp(self):
+		self.config = configuration.Config()
+		self.logger = logging.Logger(self.config)
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		self.cache = cache.EventCache(self.config, self.logger, self.ticker)
+		self.contexts = contexts.ContextManager(self.config, self.logger, self.ticker, self.cache)
+		self.querycache = querycache.QueryCache(self.config, self.logger, self.ticker, self.cache)
+		self.events = [event.Event(name="A", host="host%d" % i, creation=995, arrival=995) for i in range(4)]\
+		              +[event.Event(name="B", host="host", type="compressed", count=2, creation=995, arrival=995)
+		                for i in range(2)]
+		for e in self.events:
+			e.setDelayTime(2000)
+		self.cache.addEvents(self.events)
+
+	def query(self, trigger, fingerprint="q"):
+		query = rulecomponents.event_query([rulecomponents.event_type("raw")], None, "arrival", fingerprint)
+		return query(trigger=trigger, cache=self.cache, contexts=self.contexts, querycache=self.querycache)
+
+	def testMemoized(self):
+		trigger = self.events[0]
+		raw = [e for e in self.events if e.type == "raw"]
+		self.assert_(sorted(self.query(trigger)) == sorted(raw))
+		result = self.query(trigger)
+		self.assert_(sorted(result) == sorted(raw))
+		self.assert_(self.querycache.evaluations == 1 and self.querycache.hits == 1)
+		# modifying the result doesn't change the stored result
+		del result[:]
+		self.assert_(sorted(self.query(trigger)) == sorted(raw))
+		self.assert_(self.querycache.hits == 2)
+		# other queries, triggers and ticks are evaluated
+		self.query(trigger, "other")
+		self.query(self.events[1])
+		self.ticker.tick += 1
+		self.query(self.events[1])
+		self.assert_(self.querycache.evaluations == 4 and self.querycache.hits == 2)
+
+	def testInvalidation(self):
+		trigger = self.events[0]
+		raw = [e for e in self.events if e.type == "raw"]
+		self.query(trigger)
+		self.cache.dropEvents(raw[:1])
+		self.assert_(sorted(self.query(trigger)) == sorted(raw[1:]))
+		self.cache.setEventStatus(raw[1], "inactive")
+		self.query(trigger)
+		self.contexts.createContext("group", "ctx", None, None, {'timeout': 10})
+		self.contexts.associateEventsWithContext("group", "ctx", raw[2:3])
+		self.query(trigger)
+		self.assert_(self.querycache.evaluations == 4 and self.querycache.hits == 0)
+		self.assert_(self.querycache.invalidations == 3)
+
+	def testWithoutQueryCache(self):
+		raw = [e for e in self.events if e.type == "raw"]
+		query = rulecomponents.event_query([rulecomponents.event_type("raw")], None, "arrival", "q")
+		self.assert_(sorted(query(cache=self.cache)) == sorted(raw))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+import unittest
+import os
+import sys
+import shutil
+import tempfile
+from ace import rulebase, rulebundle, event, cache, ticker
+from ace.util import configuration, logging
+
+RULES = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE rules SYSTEM "rules.dtd">
+
+<rules>
+	<group name="kept" order="1">
+		<rule name="define" order="1">
+			<events><when_event>A</when_event></events>
+			<conditions>
+				<count threshold="2"><event_query name="recent" max_age="10"><event_name>A</event_name></event_query></count>
+			</conditions>
+			<actions><drop/></actions>
+		</rule>
+		<rule name="match" order="2">
+			<events><when_event>B</when_event></events>
+			<conditions>
+				<count threshold="1"><event_query max_age="10"><match_query>recent</match_query></event_query></count>
+			</conditions>
+			<actions><drop/></actions>
+		</rule>
+	</group>
+	<group name="changed" order="2">
+		<rule name="rule" order="1">
+			<events><when_event>C</when_event></events>
+			<conditions>
+				<count threshold="1"><event_query max_age="%d"><event_name>C</event_name></event_query></count>
+			</conditions>
+			<actions><drop/></actions>
+		</rule>
+	</group>
+</rules>
+"""
+
+WINDOW_RULES = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE rules SYSTEM "rules.dtd">
+
+<rules>
+	<group name="window" order="1">
+		<rule name="window" order="1">
+			<events><when_event>A</when_event></events>
+			<conditions>
+				<window_count field="attributes.user" timeframe="10m" threshold="5">%s</window_count>
+			</conditions>
+			<actions><drop/></actions>
+		</rule>
+	</group>
+</rules>
+"""
+
+class TestReload(unittest.TestCase):
+	"""
+	Unittest for reloading the rules.
+	"""
+
+	def setUp(self):
+		basedir = os.path.dirname(os.path.abspath(sys.modules[__name__].__file__))+"/"
+		self.tempdir = tempfile.mkdtemp()
+		shutil.copy(basedir+"rules/rules.dtd", self.tempdir)
+		self.rulefile = self.tempdir+"/rules.xml"
+		self.writeRules(RULES % 20)
+		self.config = configuration.Config()
+		self.config.loglevel = 0
+		self.config.verbosity = 0
+		self.config.rulesource = "file:filename="+self.rulefile
+		self.logger = logging.Logger(self.config)
+		self.rulemanager = rulebase.RuleManager(self.config, self.logger)
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def writeRules(self, rules):
+		f = open(self.rulefile, "w")
+		f.write(rules)
+		f.close()
+
+	def testBackgroundReload(self):
+		self.assert_(self.config.background_reload == False)
+		kept = self.rulemanager.getGroup("kept")
+		changed = self.rulemanager.getGroup("changed")
+		tables = self.rulemanager.grouptables["kept"]
+		self.writeRules(RULES % 30)
+		self.rulemanager.startReload()
+		self.rulemanager.reloader.join()
+		# the new rules are only used after finishReload
+		self.assert_(self.rulemanager.getGroup("changed") is changed)
+		self.assert_(self.rulemanager.finishReload() == ["changed"])
+		self.assert_(self.rulemanager.finishReload() == None)
+		self.assert_(self.rulemanager.getGroup("changed") is not changed)
+		# unchanged groups are reused, including their queries
+		self.assert_(self.rulemanager.getGroup("kept") is kept)
+		self.assert_(self.rulemanager.getNamedQuery("kept", "recent") is kept.named_queries["recent"][0])
+		self.assert_(len(self.rulemanager.query_determinators) == 3)
+		for qdet in kept.query_determinators:
+			self.assert_(qdet in self.rulemanager.query_determinators)
+		self.assert_(self.rulemanager.querytable[False]['arrival']['by_event']['C']['max_age'] == 30)
+		# .. as well as their table entries, which the reload doesn't modify
+		self.assert_(self.rulemanager.grouptables["kept"] is tables)
+		for qdet in self.rulemanager.query_determinators:
+			self.assert_(not 'classification' in qdet)
+
+	def testInlineReload(self):
+		self.writeRules(RULES % 30)
+		self.assert_(self.rulemanager.reloadRules() == ["changed"])
+		self.assert_(self.rulemanager.reloadRules() == [])
+		self.assert_(len(self.rulemanager.named_queries["kept"]) == 1)
+
+	def testInvalidRules(self):
+		groups = self.rulemanager.rulegroups
+		self.writeRules("<rules>")
+		self.rulemanager.startReload()
+		self.rulemanager.reloader.join()
+		self.assert_(self.rulemanager.finishReload() == None)
+		self.assert_(self.rulemanager.rulegroups is groups)
+
+	def summary(self, rulemanager):
+		"""
+		Returns the content of the query table (without the determinators).
+		"""
+		table = rulemanager.querytable
+		return [(delay, ts, table[delay][ts]['any']['max_age'],
+		         sorted([(name, entry['max_age'], len(entry['qdets']))
+		                 for (name, entry) in table[delay][ts]['by_event'].items()]))
+		        for delay in [True, False] for ts in ['creation', 'arrival']]
+
+	def testRuleBundle(self):
+		self.config.rule_bundle = self.tempdir+"/rules.bundle"
+		rulebundle.RuleBundle(self.config, self.logger).write(self.rulemanager)
+		bundled = rulebase.RuleManager(self.config, self.logger)
+		self.assert_(self.summary(bundled) == self.summary(self.rulemanager))
+		self.assert_(bundled.names.__dict__ == self.rulemanager.names.__dict__)
+		self.assert_(bundled.getClassifications() == self.rulemanager.getClassifications())
+		self.assert_(bundled.getNamedQuery("kept", "recent") != None)
+		# the bundle is ignored, if the rules are changed ..
+		self.writeRules(RULES % 30)
+		changed = rulebase.RuleManager(self.config, self.logger)
+		self.assert_(changed.querytable[False]['arrival']['by_event']['C']['max_age'] == 30)
+		# .. or if it is corrupt
+		self.writeRules(RULES % 20)
+		f = open(self.config.rule_bundle, "r+b")
+		f.seek(-10, 2)
+		f.write("x")
+		f.close()
+		self.assert_(rulebundle.RuleBundle(self.config, self.logger).load(self.rulemanager.ruleparser) == None)
+
+	def testVerification(self):
+		events = [event.Event(name=name, host="host", creation=1000, arrival=1000) for name in "ABCABC"]
+		for (mode, verified) in [('off', 0), ('full', 12), ('sampled', 4)]:
+			self.config.querytable_verification = mode
+			self.config.querytable_verification_interval = 3
+			rulemanager = rulebase.RuleManager(self.config, self.logger)
+			for e in events:
+				rulemanager.updateCacheAndDelayTime(e)
+			self.assert_(rulemanager.verified_results == verified)
+			self.assert_(rulemanager.discrepancy_count == 0)
+		# wrong query table entry
+		rulemanager.verification = 'full'
+		rulemanager.querytable[False]['arrival']['by_event']['C']['max_age'] = 5
+		for e in events:
+			rulemanager.updateCacheAndDelayTime(e)
+		self.assert_(rulemanager.discrepancy_count == 2)
+		self.assert_(rulemanager.discrepancies[0]['event'] == events[2].getID())
+		self.assert_(rulemanager.discrepancies[0]['table'] == 1005)
+		self.assert_(rulemanager.discrepancies[0]['bruteforce'] == 1020)
+
+	def testBatchUpdate(self):
+		def events():
+			return [event.Event(name=name, host="host", creation=1000-delta, arrival=1000)
+			        for (name, delta) in [("A", 0), ("C", 5), ("B", 0), ("C", 5), ("D", 0), ("A", 0)]]
+		self.config.querytable_verification = 'full'
+		rulemanager = rulebase.RuleManager(self.config, self.logger)
+		single = events()
+		for e in single:
+			rulemanager.updateCacheAndDelayTime(e)
+		batch = events()
+		rulemanager.updateCacheAndDelayTimes(batch)
+		self.assert_([(e.getCacheTime(), e.getDelayTime()) for e in single]
+		             == [(e.getCacheTime(), e.getDelayTime()) for e in batch])
+		self.assert_([e.getCacheTime() for e in batch] == [1010, 1020, 1000, 1020, 1000, 1010])
+		self.assert_(rulemanager.verified_results == 24)
+		self.assert_(rulemanager.discrepancy_count == 0)
+
+	def testProfile(self):
+		self.assert_(self.rulemanager.getRule("kept", "define").profile == None)
+		self.config.rule_profiling = True
+		rulemanager = rulebase.RuleManager(self.config, self.logger)
+		rule = rulemanager.getRule("kept", "define")
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		eventcache = cache.EventCache(self.config, self.logger, self.ticker)
+		eventcache.addEvents([event.Event(name=name, host="host", creation=995, arrival=995) for name in "AAB"])
+		(name, query) = rule.queries[0]
+		self.assert_(len(query(rule=rule, cache=eventcache, core=self)) == 2)
+		self.assert_(rule.profile.count['queries'] == 1)
+		self.assert_((rule.profile.events_scanned, rule.profile.events_returned) == (2, 2))
+		rule.profile.record('condition', 0.05)
+		self.assert_(rule.profile.histogram['condition'] == [0, 0, 0, 0, 1, 0])
+		self.assert_(len(rule.getContent()) > len(self.rulemanager.getRule("kept", "define").getContent()))
+		profiles = rulemanager.getProfileContent()[0]['content']
+		self.assert_(profiles[0][0] == rule.getLink() and len(profiles) == 3)
+
+	def testWindowCount(self):
+		self.writeRules(WINDOW_RULES % "<event_name>A</event_name>")
+		rulemanager = rulebase.RuleManager(self.config, self.logger)
+		rule = rulemanager.getRule("window", "window")
+		self.ticker = ticker.Ticker(self.config, self.logger)
+		self.ticker.tick = 1000
+		eventcache = cache.EventCache(self.config, self.logger, self.ticker)
+		events = [event.Event(name="A", host="host", creation=1000, arrival=1000, attributes={'user': user})
+		          for user in "xxxxxy"]
+		eventcache.addEvents(events)
+		predicates = []
+		getWindowCount = eventcache.getWindowCount
+		def recordPredicate(group, key, predicate, *args):
+			predicates.append(predicate)
+			return getWindowCount(group, key, predicate, *args)
+		eventcache.getWindowCount = recordPredicate
+		self.assert_(rule.condition(trigger=events[0], cache=eventcache, core=self) == True)
+		self.assert_(rule.condition(trigger=events[5], cache=eventcache, core=self) == False)
+		self.assert_(predicates[0] is predicates[1]) # built once with the condition
+		self.assert_(len(rulemanager.query_determinators) == 0)
+		# the counted events must not depend on the trigger
+		self.writeRules(WINDOW_RULES % "<is_trigger/>")
+		self.assert_(rulemanager.reloadRules() == [])
+		self.assert_(rulemanager.getRule("window", "window") is rule)
+
+	def testDispatchTable(self):
+		events = [event.Event(name=name, host="host") for name in "ABCABCD"]
+		rules = [self.rulemanager.getRelevantRules(e) for e in events]
+		self.assert_(rules == [self.rulemanager.computeRelevantRules(e) for e in events])
+		self.assert_([rule.name for rule in rules[0]] == ["define"])
+		self.assert_(rules[3] is rules[0])
+		self.assert_((self.rulemanager.dispatch_hits, self.rulemanager.dispatch_misses) == (3, 4))
+		self.assert_(len(self.rulemanager.dispatch_table) == 4)
+		# the table is cleared, when the rules are reloaded ..
+		self.writeRules(RULES % 30)
+		self.assert_(self.rulemanager.reloadRules() == ["changed"])
+		self.assert_(len(self.rulemanager.dispatch_table) == 0)
+		rules = self.rulemanager.getRelevantRules(events[2])
+		self.assert_(rules[0] is self.rulemanager.getRule("changed", "rule"))
+		self.assert_(self.rulemanager.dispatch_misses == 5)
+		# .. or when it is full
+		self.config.dispatch_table_max_size = 3
+		for e in events:
+			self.rulemanager.getRelevantRules(e)
+		self.assert_(len(self.rulemanager.dispatch_table) <= 3)
+		self.assert_(("D", "raw") in self.rulemanager.dispatch_table)
+		self.assert_(self.rulemanager.getRelevantRules(events[6]) == [])
+
+if __name__ == '__main__':
+	unittest.main()
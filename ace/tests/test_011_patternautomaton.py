@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+import unittest
+import random
+import re
+from ace.basisfunctions import patternautomaton, rulecomponents
+
+class TestPatternAutomaton(unittest.TestCase):
+	"""
+	Unittest for the incremental pattern matcher.
+	"""
+
+	def setUp(self):
+		self.random = random.Random(42)
+
+	def randomString(self, maxlength):
+		return "".join([self.random.choice("ABCD1\n") for i in range(self.random.randint(0, maxlength))])
+
+	def testSearch(self):
+		for pattern in [r"AB", r"^AB", r"A(B|C)*D", r"A{2,3}B", r"[^AB]+C?", r"A.B", r"(AB|BA){2}",
+		                r"", r"A*", r"[A-C]\d", r"A+?B", r"(?:AB)+C{1,}", r"A|B|CD"]:
+			regexp = re.compile(pattern)
+			automaton = patternautomaton.compile_pattern(regexp)
+			self.assert_(automaton != None)
+			for i in range(300):
+				string = self.randomString(12)
+				split = self.random.randint(0, len(string))
+				state = automaton.consume(automaton.getInitialState(), string[:split])
+				state = automaton.consume(state, string[split:])
+				self.assert_(state[1] == bool(regexp.search(string)))
+
+	def testUnsupported(self):
+		for pattern in [r"A$", r"\bA", r"(A)\1", r"(?i)a", r"A(?=B)", r"A{1000}"]:
+			self.assert_(patternautomaton.compile_pattern(re.compile(pattern)) == None)
+
+	def testIncrementalPattern(self):
+		alphabet = lambda **kwargs: kwargs['string']
+		for pattern in [r"A[BC]*D", r"(A)\1"]:
+			regexp = re.compile(pattern)
+			condition = rulecomponents.pattern(alphabet, regexp)
+			string = ""
+			for i in range(200):
+				if self.random.random() < 0.2:
+					string = self.randomString(8) # not an extension of the previous string
+				else:
+					string += self.randomString(2)
+				self.assert_(condition(string=string) == bool(regexp.search(string)))
+
+	def testConsumedLetters(self):
+		consumed = []
+		compile_pattern = patternautomaton.compile_pattern
+		def counting_compile(regexp):
+			automaton = compile_pattern(regexp)
+			consume = automaton.consume
+			def counting_consume(state, string):
+				consumed.append(string)
+				return consume(state, string)
+			automaton.consume = counting_consume
+			return automaton
+		patternautomaton.compile_pattern = counting_compile
+		try:
+			condition = rulecomponents.pattern(lambda **kwargs: kwargs['string'], re.compile(r"A[BC]*D"))
+		finally:
+			patternautomaton.compile_pattern = compile_pattern
+		self.assert_(condition(string="AB") == False)
+		self.assert_(consumed == ["AB"])
+		# not an extension: the whole string is consumed
+		self.assert_(condition(string="BCD") == False)
+		self.assert_(condition(string="ACD") == True)
+		self.assert_(consumed == ["AB", "BCD", "ACD"])
+		# extension: only the new letters are consumed
+		self.assert_(condition(string="ACDB") == True)
+		self.assert_(condition(string="ACDBB") == True)
+		self.assert_(consumed == ["AB", "BCD", "ACD", "B", "B"])
+
+if __name__ == '__main__':
+	unittest.main()
@@ -40,6 +40,12 @@ class Ticker:
 	def getTick(self):
 		return self.tick
 
+	def setTick(self, tick):
+		"""
+		Sets the current tick (e.g. when the state is restored from a snapshot).
+		"""
+		self.tick = tick
+
 	def getTime(self):
 		return int(time.time())
 
@@ -30,12 +30,32 @@ class Config:
 	    'lockfile'              : 'string',
 	    'rulesource'            : 'string',
 	    'classlist'             : 'string',
+	    'rule_backend'          : 'string',
+	    'background_reload'     : 'bool',
+	    'rule_bundle'           : 'string',
+	    'querytable_verification': 'string',
+	    'querytable_verification_interval': 'int',
+	    'rule_profiling'        : 'bool',
+	    'dispatch_table_max_size': 'int',
 	    'hostname'              : 'string',
 	    'daemon'                : 'bool',
 	    'realtime'              : 'bool',
 	    'simulation'            : 'bool',
 	    'fast_exit'             : 'bool',
 	    'cache_max_size'        : 'int',
+	    'cache_low_watermark'   : 'int',
+	    'cache_eviction_policy' : 'string',
+	    'cache_eviction_classes': 'string',
+	    'cache_attribute_index' : 'bool',
+	    'cache_views'           : 'bool',
+	    'cache_overflow_file'   : 'string',
+	    'cache_resident_max'    : 'int',
+	    'cache_overflow_min_time': 'int',
+	    'cache_overflow_idle_time': 'int',
+	    'query_cache'           : 'bool',
+	    'snapshot_file'         : 'string',
+	    'snapshot_interval'     : 'int',
+	    'snapshot_restore'      : 'bool',
 	    'thread_sleep_time'     : 'float',
 	    'rpcserver'             : 'bool',
 	    'rpcserver_host'        : 'string',
@@ -78,12 +98,32 @@ class Config:
 	lockfile = "/var/lock/ace-lockfile" #: location of the lock file for daemon mode
 	rulesource = "file:filename="+etc+"emptyrules.xml" #: source of correlation rules
 	classlist = "file:filename="+etc+"emptyclasses.xml" #: source of event classes
+	rule_backend = "closures"       #: how rules are built: 'closures' (nested functions from the basis functions) or 'compiled' (Python source code is generated and compiled for each rule)
+	background_reload = False       #: parse reloaded rules on a background thread (the new rules are used from the first tick after parsing has finished), instead of stopping the correlation during the reload
+	rule_bundle = ""                #: rule bundle with the names, event classes and query classifications of the rules, which is used to skip the DTD validation, the name scans and the query classification, if the rule source is unchanged (the rules are still parsed; written with 'ace --compile-rules'; empty: no bundle)
+	querytable_verification = "sampled" #: whether to verify the cache and delay times from the query table by evaluating all queries: 'off', 'sampled' (every querytable_verification_interval-th event) or 'full' (every event)
+	querytable_verification_interval = 100 #: in 'sampled' verification mode, one in this number of events is verified
+	rule_profiling = False          #: record the time spent in the conditions, actions and event queries of each rule (see 'show_rule_profile' in the RPC interface)
+	dispatch_table_max_size = 10000 #: maximum number of (event name, event type) combinations, for which the relevant rules are stored (the table is cleared, when it is full)
 	hostname = socket.gethostname() #: name of the host, where the CE is running 
 	daemon = False                  #: daemonize the application?
 	realtime = True                 #: bind internal time to real time? (this means, one tick will be equal to one second. otherwise, the next tick starts as soon as all processing for the current tick is done.)
 	simulation = False              #: if True, the master control the execution of the input threads and the core, to guarantee an ordered execution for simulation. Note: in simulation mode, source and core threads must not be started!
 	fast_exit = False               #: if True, the CE will exit faster, but it is not guaranteed that the queues are empty when the CE exits
-	cache_max_size = 10000          #: maximum number of events in the cache
+	cache_max_size = 10000          #: maximum number of events in the cache (high watermark for eviction)
+	cache_low_watermark = 9000      #: if events are evicted, the cache is reduced to this size
+	cache_eviction_policy = "none"  #: what to do if cache_max_size is exceeded ('none': only warn, 'earliest': forward and evict the events with the earliest cache time, 'class': forward and evict events according to cache_eviction_classes, 'refuse_local': refuse new local events)
+	cache_eviction_classes = ""     #: comma separated list with event classes for the 'class' eviction policy; events of classes listed first are evicted first, events without a listed class are evicted last
+	cache_attribute_index = True    #: maintain an index for the event attributes used in event queries?
+	cache_views = True              #: maintain the results of trigger independent event queries incrementally (materialized views)?
+	cache_overflow_file = ""        #: SQLite database for events, which need to be cached for a long time (empty: keep all events in memory)
+	cache_resident_max = 5000       #: if an overflow file is configured, events are moved to it, when there are more events in memory
+	cache_overflow_min_time = 3600  #: only events, which must be kept for at least this number of ticks, are moved to the overflow file
+	cache_overflow_idle_time = 300  #: only events, which were not added or read back for this number of ticks, are moved to the overflow file
+	query_cache = True              #: memoize the results of structurally identical event queries during the processing of a trigger event
+	snapshot_file = ""              #: file for periodic snapshots of the engine state (cache, contexts, ticker), to resume correlation after a restart (empty: no snapshots)
+	snapshot_interval = 300         #: number of ticks between two snapshots
+	snapshot_restore = True         #: restore the engine state from snapshot_file on startup (if the file exists)
 	thread_sleep_time = 0.1         #: time in seconds, how long a thread sleeps, if there is no work
 	rpcserver = False               #: whether to start an RPC server for remote control
 	rpcserver_host = "localhost"    #: host for RPC server
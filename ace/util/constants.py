@@ -55,6 +55,7 @@ TAG_ALPHABET = 'alphabet'
 TAG_SYMBOL = 'symbol'
 TAG_REGEXP = 'regexp'
 TAG_WITHIN = 'within'
+TAG_WINDOW_COUNT = 'window_count'
 TAG_CONDITION_PLUGIN = 'condition_plugin'
 TAG_ACTION_PLUGIN = 'action_plugin'
 TAG_PLUGIN_PARAMETER = 'plugin_parameter'
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Timer index module - contains an indexed binary heap for deadlines.
+"""
+
+class TimerIndex:
+	"""
+	Indexed binary min-heap, which stores one deadline per key.
+
+	In contrast to a sorted list with (deadline, key) tuples, each key has at
+	most one entry, which can be updated or removed exactly in O(log n). The
+	earliest deadline can be looked up in O(1). Keys are never compared with
+	each other (ties are broken by insertion order), so any hashable object
+	(e.g. an event) can be used as key.
+	"""
+	def __init__(self):
+		self.heap = []         #: list with entries [deadline, serial, key]
+		self.position = {}     #: key -> position of the key's entry in the heap
+		self.serial = 0        #: insertion counter, used to break ties
+		self.insertions = 0    #: number of inserted keys
+		self.updates = 0       #: number of deadline updates for existing keys
+		self.removals = 0      #: number of removed keys (popped or removed)
+
+	def __len__(self):
+		return len(self.heap)
+
+	def __contains__(self, key):
+		return key in self.position
+
+	def keys(self):
+		return self.position.keys()
+
+	def getDeadline(self, key):
+		"""
+		Returns the deadline for the given key, or None if the key is not in
+		the index.
+		"""
+		if key in self.position:
+			return self.heap[self.position[key]][0]
+		return None
+
+	def set(self, key, deadline):
+		"""
+		Sets the deadline for the given key (inserts the key, if necessary).
+
+		@param key: hashable object
+		@param deadline: deadline (e.g. a tick)
+		"""
+		self.serial += 1
+		if key in self.position:
+			self.updates += 1
+			pos = self.position[key]
+			entry = self.heap[pos]
+			old = entry[0]
+			entry[0] = deadline
+			entry[1] = self.serial
+			if deadline < old:
+				self.siftUp(pos)
+			else:
+				self.siftDown(pos)
+		else:
+			self.insertions += 1
+			self.heap.append([deadline, self.serial, key])
+			self.position[key] = len(self.heap)-1
+			self.siftUp(len(self.heap)-1)
+
+	def remove(self, key):
+		"""
+		Removes the entry for the given key. Returns True, if the key was in
+		the index.
+		"""
+		if not key in self.position:
+			return False
+		self.removals += 1
+		pos = self.position.pop(key)
+		last = self.heap.pop()
+		if pos < len(self.heap):
+			self.heap[pos] = last
+			self.position[last[2]] = pos
+			self.siftUp(pos)
+			self.siftDown(self.position[last[2]])
+		return True
+
+	def peek(self):
+		"""
+		Returns a tuple (deadline, key) with the earliest deadline, or None if
+		the index is empty.
+		"""
+		if len(self.heap) == 0:
+			return None
+		return (self.heap[0][0], self.heap[0][2])
+
+	def pop(self):
+		"""
+		Removes and returns the tuple (deadline, key) with the earliest
+		deadline.
+		"""
+		(deadline, key) = self.peek()
+		self.remove(key)
+		return (deadline, key)
+
+	def clear(self):
+		"""
+		Removes all entries.
+		"""
+		self.heap = []
+		self.position = {}
+
+	def siftUp(self, pos):
+		"""
+		Moves the entry at the given position up, until the heap property is
+		restored.
+		"""
+		heap = self.heap
+		entry = heap[pos]
+		while pos > 0:
+			parentpos = (pos-1) >> 1
+			parent = heap[parentpos]
+			if entry[0] < parent[0] or (entry[0] == parent[0] and entry[1] < parent[1]):
+				heap[pos] = parent
+				self.position[parent[2]] = pos
+				pos = parentpos
+			else:
+				break
+		heap[pos] = entry
+		self.position[entry[2]] = pos
+
+	def siftDown(self, pos):
+		"""
+		Moves the entry at the given position down, until the heap property is
+		restored.
+		"""
+		heap = self.heap
+		size = len(heap)
+		entry = heap[pos]
+		while True:
+			childpos = 2*pos+1
+			if childpos >= size:
+				break
+			child = heap[childpos]
+			rightpos = childpos+1
+			if rightpos < size:
+				right = heap[rightpos]
+				if right[0] < child[0] or (right[0] == child[0] and right[1] < child[1]):
+					childpos = rightpos
+					child = right
+			if child[0] < entry[0] or (child[0] == entry[0] and child[1] < entry[1]):
+				heap[pos] = child
+				self.position[child[2]] = pos
+				pos = childpos
+			else:
+				break
+		heap[pos] = entry
+		self.position[entry[2]] = pos
@@ -0,0 +1,405 @@
+#!/usr/bin/env python
+# coding: utf8
+#
+# Andreas Müller, 2009
+# andrmuel@ee.ethz.ch
+#
+# This code may be freely used under GNU GPL conditions.
+
+"""
+Views module - materialized views for event queries, window counters and
+pattern matchers, which are maintained incrementally by the event cache.
+"""
+
+import bisect
+from ace.util.timerindex import TimerIndex
+
+class MaterializedView:
+	"""
+	The set of cached events, which are selected by a trigger independent
+	event query.
+
+	The event cache updates the view, whenever an event is added, removed or
+	modified. Events are checked with the predicate of the query (so the
+	query must consist of conditions on single events only). If the query has
+	a max_age, the time, when each event becomes too old, is kept in a timer
+	index, and events are removed from the view, when it is read.
+
+	For the within condition, the view also keeps sorted lists with the
+	timestamps of its events (one for each time reference used), which are
+	updated together with the view (see getTimestamps).
+
+	Selected events, which are moved to the overflow store of the cache, are
+	kept by their id and timestamps (see offload), so that the view doesn't
+	hold them in memory.
+	"""
+
+	def __init__(self, predicate, max_age, time_source):
+		"""
+		@param predicate: function, which returns True for the events selected
+		by the query (without max_age)
+		@param max_age: maximum age of a selected event (or None)
+		@param time_source: creation or arrival
+		"""
+		self.predicate = predicate
+		self.max_age = max_age
+		self.time_source = time_source
+		self.events = set()  #: events selected by the query
+		self.expiry = TimerIndex() if max_age != None else None #: event -> first tick, when the event is too old
+		self.timestamps = {} #: timeref -> sorted list with the timestamps of the events (built on first use)
+		self.stored = {}     #: event id -> timeref -> timestamp, for the selected events in the overflow store
+		self.stored_expiry = TimerIndex() if max_age != None else None #: event id -> first tick, when the stored event is too old
+		self.reads = 0       #: number of times, the view was read
+		self.updates = 0     #: number of checked events
+
+	def update(self, event):
+		"""
+		Adds the event to the view, or removes it, depending on whether it is
+		(still) selected by the query.
+		"""
+		self.updates += 1
+		if self.predicate(event):
+			if event.id in self.stored: # paged in from the overflow store (timestamps are kept)
+				self.removeStored(event.id, False)
+				self.events.add(event)
+			elif not event in self.events:
+				self.events.add(event)
+				for (timeref, timestamps) in self.timestamps.iteritems():
+					bisect.insort(timestamps, event.getTimestamp(timeref))
+			if self.expiry != None:
+				self.expiry.set(event, event.getTimestamp(self.time_source)+self.max_age+1)
+		else:
+			self.removeStored(event.id)
+			self.remove(event)
+
+	def offload(self, event):
+		"""
+		Keeps only the id and the timestamps of the event, if it is in the
+		view (called, when the event is moved to the overflow store).
+		"""
+		if event in self.events:
+			self.events.remove(event)
+			self.stored[event.id] = dict([(timeref, event.getTimestamp(timeref))
+			                              for timeref in ['creation', 'arrival']])
+			if self.expiry != None:
+				self.expiry.remove(event)
+				self.stored_expiry.set(event.id, event.getTimestamp(self.time_source)+self.max_age+1)
+
+	def removeStored(self, eventid, with_timestamps=True):
+		"""
+		Removes the event in the overflow store with the given id from the
+		view (if it is in the view).
+		
+		@param with_timestamps: whether to remove the timestamps of the event
+		"""
+		if eventid in self.stored:
+			stored = self.stored.pop(eventid)
+			if with_timestamps:
+				for (timeref, timestamps) in self.timestamps.iteritems():
+					del timestamps[bisect.bisect_left(timestamps, stored[timeref])]
+			if self.stored_expiry != None:
+				self.stored_expiry.remove(eventid)
+
+	def remove(self, event):
+		"""
+		Removes the event from the view (if it is in the view).
+		"""
+		if event in self.events:
+			self.events.remove(event)
+			for (timeref, timestamps) in self.timestamps.iteritems():
+				# timestamps are equal, so any entry with the timestamp can be removed
+				del timestamps[bisect.bisect_left(timestamps, event.getTimestamp(timeref))]
+		if self.expiry != None:
+			self.expiry.remove(event)
+
+	def expire(self, tick):
+		"""
+		Removes the events, which are too old at the given tick.
+		"""
+		if self.expiry != None:
+			while len(self.expiry) > 0 and self.expiry.peek()[0] <= tick:
+				self.remove(self.expiry.pop()[1])
+			while len(self.stored_expiry) > 0 and self.stored_expiry.peek()[0] <= tick:
+				self.removeStored(self.stored_expiry.pop()[1])
+
+	def getEvents(self, tick):
+		"""
+		Returns a list with the events selected by the query at the given tick
+		(without the events in the overflow store - see stored).
+		"""
+		self.reads += 1
+		self.expire(tick)
+		return list(self.events)
+
+	def getTimestamps(self, tick, timeref):
+		"""
+		Returns a sorted list with the timestamps of the events selected by the
+		query at the given tick. The list is updated by the view and must not
+		be modified.
+		
+		@param timeref: creation or arrival
+		"""
+		self.reads += 1
+		self.expire(tick)
+		if not self.timestamps.has_key(timeref):
+			self.timestamps[timeref] = sorted([event.getTimestamp(timeref) for event in self.events]
+			                                  +[stored[timeref] for stored in self.stored.itervalues()])
+		return self.timestamps[timeref]
+
+class WindowCounter:
+	"""
+	Rolling counts of the events, which arrived in a sliding time window,
+	for each value of an event field (see rulecomponents.window_count).
+
+	The window is divided into buckets of equal width, and only the number
+	of events in each bucket is kept, so the memory used for a value is
+	bounded by the number of buckets, independently of the number of events.
+	The window is advanced by whole buckets: at a given tick, it contains the
+	bucket of the tick and the buckets before it, so the counted timeframe is
+	between timeframe-width and timeframe.
+
+	The event cache adds the new events, when they arrive (except for the
+	events built by the compress action, which replace counted events).
+	Events are checked with the predicate only once, so modifications and
+	removals of counted events don't change the counts. Values without events
+	in the window are removed, when the counter is updated or read.
+	"""
+
+	def __init__(self, predicate, field, timeframe, buckets, timeref):
+		"""
+		@param predicate: function, which returns True for the events to count
+		@param field: event field or attributes.NAME
+		@param timeframe: length of the window
+		@param buckets: number of buckets
+		@param timeref: creation or arrival
+		"""
+		self.predicate = predicate
+		self.field = field
+		self.buckets = buckets
+		self.width = max(1, -(-timeframe//buckets)) #: width of a bucket (rounded up)
+		self.timeref = timeref
+		self.counts = {}            #: value -> bucket number -> number of events
+		self.totals = {}            #: value -> number of events in the buckets of the value
+		self.expiry = TimerIndex()  #: value -> first tick, when all buckets of the value are too old
+		self.additions = 0          #: number of counted events
+		self.reads = 0              #: number of times, the counter was read
+
+	def firstBucket(self, tick):
+		"""
+		Returns the number of the oldest bucket in the window at the given tick.
+		"""
+		return tick//self.width-self.buckets+1
+
+	def add(self, event, tick):
+		"""
+		Counts the event, if it is selected by the predicate and in the window
+		at the given tick (timestamps in the future are counted in the bucket
+		of the tick).
+		"""
+		self.expire(tick)
+		if not self.predicate(event):
+			return
+		bucket = min(event.getTimestamp(self.timeref), tick)//self.width
+		first = self.firstBucket(tick)
+		if bucket < first:
+			return
+		value = event.getField(self.field)
+		if not self.counts.has_key(value):
+			self.counts[value] = {}
+			self.totals[value] = 0
+		else:
+			self.expireBuckets(value, first)
+		counts = self.counts[value]
+		counts[bucket] = counts.get(bucket, 0)+1
+		self.totals[value] += 1
+		self.additions += 1
+		deadline = (bucket+self.buckets)*self.width
+		current = self.expiry.getDeadline(value)
+		if current == None or deadline > current:
+			self.expiry.set(value, deadline)
+
+	def count(self, value, tick):
+		"""
+		Returns the number of events with the given field value in the window
+		at the given tick.
+		"""
+		self.reads += 1
+		self.expire(tick)
+		if not self.counts.has_key(value):
+			return 0
+		self.expireBuckets(value, self.firstBucket(tick))
+		return self.totals[value]
+
+	def expireBuckets(self, value, first):
+		"""
+		Removes the buckets of the value, which are older than the given first
+		bucket of the window.
+		"""
+		counts = self.counts[value]
+		for bucket in [bucket for bucket in counts if bucket < first]:
+			self.totals[value] -= counts.pop(bucket)
+
+	def expire(self, tick):
+		"""
+		Removes the values, whose buckets are all too old at the given tick.
+		"""
+		while len(self.expiry) > 0 and self.expiry.peek()[0] <= tick:
+			value = self.expiry.pop()[1]
+			del self.counts[value]
+			del self.totals[value]
+
+	def __len__(self):
+		return len(self.counts)
+
+class PatternMatcher:
+	"""
+	The letters of a pattern condition, which consists of symbols with
+	trigger independent queries, and the state of the pattern automaton
+	after them (see rulecomponents.pattern).
+
+	The event cache passes each added, modified or removed event to the
+	matcher, which checks it with the predicates of the symbol queries. The
+	letters are kept ordered by timestamp (letters with equal timestamps by
+	the order of the symbols), and each event gets the letter of the first
+	symbol, which selects it (the queries don't overlap, see alphabet). When
+	an event leaves the max_age window of its symbol, it gets the letter of
+	the next symbol, which selects it, if any.
+
+	If a letter is appended after the last letter, it is consumed by the
+	automaton right away. Letters, which are inserted before the last letter
+	or removed (e.g. when events leave the window), invalidate the state,
+	which is then rebuilt from the kept letters at the next read, without
+	evaluating the queries again.
+
+	Events, which are moved to the overflow store of the cache, keep their
+	letters (see offload).
+	"""
+
+	def __init__(self, symbols, sort_by, automaton):
+		"""
+		@param symbols: list with (letter, predicate, max_age, time_source)
+		for each symbol, where predicate returns True for the events selected
+		by the symbol query (without max_age)
+		@param sort_by: creation or arrival
+		@param automaton: PatternAutomaton of the regular expression
+		"""
+		self.symbols = symbols
+		self.sort_by = sort_by
+		self.automaton = automaton
+		self.entries = {}          #: event id -> (selecting symbols, timestamps), for the events selected by any symbol
+		self.letters = []          #: sorted list with (timestamp, symbol, event id) for the current letters
+		self.keys = {}             #: event id -> entry of the event in letters
+		self.expiry = TimerIndex() #: event id -> first tick, when the event leaves the window of its symbol
+		self.stored = set()        #: ids of the events with letters in the overflow store
+		self.state = automaton.getInitialState() #: state after the letters (None: must be rebuilt)
+		self.reads = 0             #: number of times, the matcher was read
+		self.updates = 0           #: number of checked events
+		self.rebuilds = 0          #: number of times, the state was rebuilt
+
+	def update(self, event, tick):
+		"""
+		Checks the event with the symbol predicates, and adds, moves or
+		removes its letter accordingly.
+		"""
+		self.updates += 1
+		self.stored.discard(event.id) # paged in from the overflow store
+		selecting = [i for (i, symbol) in enumerate(self.symbols) if symbol[1](event)]
+		timestamps = dict([(timeref, event.getTimestamp(timeref)) for timeref in ['creation', 'arrival']])
+		if self.entries.get(event.id) == (selecting, timestamps):
+			return
+		self.removeStored(event.id)
+		if len(selecting) > 0:
+			self.entries[event.id] = (selecting, timestamps)
+			self.place(event.id, 0, tick)
+
+	def place(self, eventid, first, tick):
+		"""
+		Adds the letter of the first selecting symbol (starting with the
+		given symbol), whose window still contains the event.
+		"""
+		(selecting, timestamps) = self.entries[eventid]
+		for i in [i for i in selecting if i >= first]:
+			(letter, predicate, max_age, time_source) = self.symbols[i]
+			if max_age != None:
+				deadline = timestamps[time_source]+max_age+1
+				if deadline <= tick:
+					continue
+				self.expiry.set(eventid, deadline)
+			key = (timestamps[self.sort_by], i, eventid)
+			position = bisect.bisect_left(self.letters, key)
+			self.letters.insert(position, key)
+			self.keys[eventid] = key
+			if position == len(self.letters)-1 and self.state != None:
+				self.state = self.automaton.consume(self.state, letter)
+			else:
+				self.state = None
+			return
+		del self.entries[eventid] # not in any window (anymore)
+
+	def unplace(self, eventid):
+		"""
+		Removes the letter of the event (if it has one).
+		"""
+		key = self.keys.pop(eventid, None)
+		if key != None:
+			del self.letters[bisect.bisect_left(self.letters, key)]
+			self.state = None
+			self.expiry.remove(eventid)
+		return key
+
+	def offload(self, event):
+		"""
+		Keeps the letter of the event, when it is moved to the overflow store
+		(the following removal from the cache is ignored).
+		"""
+		if event.id in self.entries:
+			self.stored.add(event.id)
+
+	def remove(self, event):
+		"""
+		Removes the letter of the event (unless it was moved to the overflow
+		store).
+		"""
+		if not event.id in self.stored:
+			self.removeStored(event.id)
+
+	def removeStored(self, eventid):
+		"""
+		Removes the letter of the event with the given id (e.g. when the event
+		is removed from the overflow store).
+		"""
+		self.stored.discard(eventid)
+		self.unplace(eventid)
+		self.entries.pop(eventid, None)
+
+	def expire(self, tick):
+		"""
+		Moves the events, which have left the window of their symbol at the
+		given tick, to the next selecting symbol.
+		"""
+		while len(self.expiry) > 0 and self.expiry.peek()[0] <= tick:
+			eventid = self.expiry.peek()[1]
+			key = self.unplace(eventid)
+			self.place(eventid, key[1]+1, tick)
+
+	def getString(self, tick):
+		"""
+		Returns the letters at the given tick as a string.
+		"""
+		self.expire(tick)
+		return "".join([self.symbols[key[1]][0] for key in self.letters])
+
+	def matches(self, tick):
+		"""
+		Returns True, if the regular expression matches the letters at the
+		given tick.
+		"""
+		self.reads += 1
+		self.expire(tick)
+		if self.state == None:
+			self.rebuilds += 1
+			self.state = self.automaton.consume(self.automaton.getInitialState(), self.getString(tick))
+		return self.state[1]
+
+	def __len__(self):
+		return len(self.letters)